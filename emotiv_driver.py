@@ -36,14 +36,21 @@ release_lock.release()  # TODO: use theano config instead. We have to figure out
 
 
 @log_me()
-def run(task_num=0, model_type=0, **kwargs):
-    if model_type == 0:
+def run(task_num=0, model_type=0, stacked_folds=0, **kwargs):
+    if model_type == 0 and stacked_folds:
+        from learntools.emotiv.stacked import StackedEmotiv as SelectedModel
+    elif model_type == 0:
         from learntools.emotiv.base import BaseEmotiv as SelectedModel
     else:
         raise Exception("model type is not valid")
     dataset = prepare_data(**kwargs)
-    train_idx, valid_idx = cv_split(dataset, percent=0.1, fold_index=task_num)
-    prepared_data = (dataset, train_idx, valid_idx)
+    if stacked_folds:
+        # train the first stacked_folds folds together in one model
+        folds = [cv_split(dataset, percent=0.1, fold_index=k) for k in xrange(stacked_folds)]
+        prepared_data = (dataset, folds)
+    else:
+        train_idx, valid_idx = cv_split(dataset, percent=0.1, fold_index=task_num)
+        prepared_data = (dataset, train_idx, valid_idx)
 
     model = SelectedModel(prepared_data, **kwargs)
     model.train_full(**kwargs)
@@ -67,5 +74,7 @@ if __name__ == '__main__':
         params['dataset_name'] = default_dataset
 
     params['conds'] = ['EyesClosed', 'EyesOpen']
+    if not args['--quiet']:
+        params['metrics_path'] = log_filename + '.metrics.jsonl'
     run(0, **params)
     print("Finished")
@@ -13,7 +13,7 @@ def run(task_num, model_type=0, **kwargs):
     if model_type == 0:
         from learntools.kt.deepkt import DeepKT as SelectedModel
     elif model_type == 1:
-        from learntools.kt.lrkt import build_model  # TODO: UNBREAK
+        from learntools.kt.lrkt import LRKT as SelectedModel
     elif model_type == 2:
         from learntools.kt.kt2 import build_model  # TODO: UNBREAK
     else:
@@ -39,6 +39,12 @@ if __name__ == '__main__':
                         help='name for the log file to be generated')
     parser.add_argument('-t', dest='task_num', type=int, default=0,
                         help='a way to separate different runs of the same parameter-set')
+    parser.add_argument('-c', dest='cache_dir', type=str, default=None,
+                        help='if set, keep snapshots of the prepared data in this directory')
+    parser.add_argument('-k', dest='checkpoint_path', type=str, default=None,
+                        help='prefix of the checkpoint files of the best and latest weights')
+    parser.add_argument('-r', dest='resume', action='store_true',
+                        help='continue training from the latest checkpoint')
     args = parser.parse_args()
 
     params = config.get_config(args.param_set)
@@ -47,6 +53,10 @@ if __name__ == '__main__':
         params['dataset_name'] = args.file
     elif 'dataset_name' not in params:
         params['dataset_name'] = default_dataset
+    params['cache_dir'] = args.cache_dir
+    params['checkpoint_path'] = args.checkpoint_path
+    params['resume'] = args.resume
+    params['metrics_path'] = args.outname + '.metrics.jsonl'
     run(0, **params)
     print "finished"
     if sys.platform.startswith('win'):
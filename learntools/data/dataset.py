@@ -81,6 +81,10 @@ class Column(object):
     def to_original(self, value):
         return value
 
+    def extend(self, other):
+        '''append the data of another column of the same type'''
+        self._data = np.concatenate([self._data, other.data])
+
     @property
     def data(self):
         return self[:]
@@ -97,6 +101,9 @@ class ObjectColumn(Column):
         else:
             self._data = data
 
+    def extend(self, other):
+        self._data = list(self._data) + list(other.data)
+
 
 class NumericColumn(Column):
     def __init__(self, name, set_func=None, *args, **kwargs):
@@ -157,6 +164,14 @@ class MatColumn(Column):
             raise Exception("Matrix column '{}' not initialized".format(self.name))
         return super(MatColumn, self).__getitem__(key)
 
+    def extend(self, other):
+        if other._data is None:
+            return
+        if self._data is None:
+            self._data = np.array(other._data, dtype=self.dtype)
+        else:
+            super(MatColumn, self).extend(other)
+
 
 class EnumColumn(Column):
     def __init__(self, name, enum_dict=None, *args, **kwargs):
@@ -190,6 +205,14 @@ class EnumColumn(Column):
     def __getitem__(self, key):
         return super(EnumColumn, self).__getitem__(key)
 
+    def extend(self, other):
+        # the other column has its own enum values so map them through the original strings
+        mapping = np.zeros(len(other._enum_dict), dtype='i4')
+        for k, v in other.ienum_pairs:
+            mapping[v] = self.__convert_to_dict__(k)
+        self._enum_dict_reverse = None
+        self._data = np.concatenate([self._data, mapping[other.data]])
+
     def to_original(self, value):
         if self._enum_dict_reverse is None:
             self._enum_dict_reverse = dict((v, k) for (k, v) in self._enum_dict.iteritems())
@@ -356,6 +379,20 @@ class Dataset(object):
     def _resize(self, n_rows):
         self.n_rows = n_rows
 
+    def extend(self, other):
+        '''append the rows of another dataset
+
+        Args:
+            other (Dataset): a dataset with the same headers. Its ENUM columns may use
+                different enum values; they are matched by their original strings
+        '''
+        if other.headers != self.headers:
+            raise Exception("cannot extend dataset with headers {} by headers {}".format(
+                self.headers, other.headers))
+        for c, c2 in izip(self.columns, other.columns):
+            c.extend(c2)
+        self._resize(self.n_rows + other.n_rows)
+
     def reorder(self, order_i):
         '''reorder the rows.
 
@@ -380,14 +417,14 @@ class Dataset(object):
                 a row. Masking [1, 2, 3, 4, 5] with [True, True, False, False, True]
                 results in [1, 2, 5]
         '''
-        mask_i = [bool(i) for i in mask_i]
+        mask_i = np.asarray(mask_i, dtype=bool)
         for c in self.columns:
             if isinstance(c.data, np.ndarray):
-                c2 = c[[i for i in xrange(len(mask_i)) if mask_i[i]]]
+                c2 = c[mask_i]
             else:
                 c2 = list(compress(c.data, mask_i))
             c.data = c2
-        self._resize(sum(mask_i))
+        self._resize(int(mask_i.sum()))
 
     def __setitem__(self, key, values):
         if not isinstance(key, int):
@@ -440,6 +477,61 @@ class Dataset(object):
             dataset[i] = data[i]
         return dataset
 
+    def save_columns(self, fname):
+        '''write the dataset to a binary columnar snapshot
+
+        Each column is stored as its internal array (plus the enum dictionary for ENUM
+        columns) so that loading only has to read the arrays back rather than re-parse
+        every row like from_pickle. OBJ columns are not supported.
+
+        Args:
+            fname (string): location of the snapshot file
+        '''
+        arrays = {
+            'headers': np.array(get_column(self.headers, 0)),
+            'types': np.array(get_column(self.headers, 1)),
+            'n_rows': np.array(self.n_rows),
+            'time_form': np.array(self.time_form),
+        }
+        for i, ((h, t), c) in enumerate(izip(self.headers, self.columns)):
+            if t == Dataset.OBJ:
+                raise Exception("object column '{}' cannot be stored in columns".format(h))
+            arrays['column{}'.format(i)] = np.asarray(c.data)
+            if t == Dataset.ENUM:
+                keys, values = zip(*c.enum_pairs) if c.enum_pairs else ([], [])
+                arrays['enum_keys{}'.format(i)] = np.array(keys, dtype=str)
+                arrays['enum_values{}'.format(i)] = np.array(values, dtype='i4')
+        with open(fname, 'wb') as f:
+            np.savez(f, **arrays)
+
+    @classmethod
+    def load_columns(cls, fname):
+        '''load a snapshot written by save_columns
+
+        Args:
+            fname (string): location of the snapshot file
+
+        Returns:
+            (Dataset): the loaded Dataset object
+        '''
+        snapshot = np.load(fname)
+        try:
+            headers = zip([str(h) for h in snapshot['headers']],
+                          [int(t) for t in snapshot['types']])
+            dataset = cls(headers, n_rows=int(snapshot['n_rows']),
+                          form=str(snapshot['time_form']))
+            for i, ((h, t), c) in enumerate(izip(headers, dataset.columns)):
+                data = snapshot['column{}'.format(i)]
+                if t == Dataset.STR:
+                    data = [str(d) for d in data]
+                elif t == Dataset.ENUM:
+                    c._enum_dict = dict(izip([str(k) for k in snapshot['enum_keys{}'.format(i)]],
+                                             [int(v) for v in snapshot['enum_values{}'.format(i)]]))
+                c.data = data
+        finally:
+            snapshot.close()
+        return dataset
+
     @classmethod
     def from_csv(cls, fname, headers, delimiter='\t', **kwargs):
         '''load a dataset from a csv file
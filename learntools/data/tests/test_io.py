@@ -204,3 +204,22 @@ def test_rename_column():
     for (h, _), c in izip(headers, columns):
         with pytest.raises(KeyError):
             assert AWrap(dataset[h]) == c
+
+
+def test_save_columns(tmpdir):
+    headers = [('int', Dataset.INT), ('enum', Dataset.ENUM), ('time', Dataset.TIME),
+               ('str', Dataset.STR), ('mat', Dataset.MATINT)]
+    dataset = Dataset(headers, n_rows=len(nums))
+    for i, row in enumerate(izip(numstr, enumstr, strtimes, numstr, matints)):
+        dataset[i] = row
+
+    fname = str(tmpdir.join('snapshot.npz'))
+    dataset.save_columns(fname)
+    dataset2 = Dataset.load_columns(fname)
+
+    assert dataset2.headers == headers
+    assert dataset2.n_rows == dataset.n_rows
+    for h, _ in headers:
+        assert AWrap(dataset2[h][:]) == dataset[h][:]
+    assert dataset2.orig['enum'] == enumstr
+    assert dataset2.orig['time'] == strtimes
@@ -154,6 +154,23 @@ ALL_PARAMS['emotiv_wide_search'] = {'learning_rate': GenVar(0.001, 0.02, scale=L
                                     'dropout_p': GenVar(0, 0.4),
                                     'n_epochs': 4000,
                                     'patience': 4000}  # run at least 5000 epochs no matter what
+ALL_PARAMS['padded'] = {'train_lanes': GenVar(32, type=int),
+                        'valid_lanes': GenVar(32, type=int),
+                        'precompute_features': GenVar(1, type=int)}
+ALL_PARAMS['deep_config5_padded'] = combine_dict(ALL_PARAMS['deep_config5'],
+                                                 ALL_PARAMS['padded'])
+ALL_PARAMS['adam'] = {'optimizer': 'adam',
+                      'learning_rate': GenVar(0.0005, 0.005, scale=LOG_SCALE),
+                      'max_norm': 5.}
+ALL_PARAMS['nesterov'] = {'optimizer': 'nesterov',
+                          'momentum': GenVar(0.8, 0.95)}
+ALL_PARAMS['deep_config5_adam'] = combine_dict(ALL_PARAMS['deep_config5'],
+                                               ALL_PARAMS['adam'])
+ALL_PARAMS['emotiv_adam'] = combine_dict(ALL_PARAMS['emotiv_wide_search'],
+                                         ALL_PARAMS['adam'],
+                                         {'n_epochs': 500, 'patience': 100})
+ALL_PARAMS['emotiv_stacked'] = combine_dict(ALL_PARAMS['emotiv_wide_search'],
+                                            {'stacked_folds': 10})
 all_param_set_keys = ALL_PARAMS.keys()
 
 if __name__ == '__main__':
@@ -7,10 +7,68 @@ from itertools import chain
 from learntools.libs.logger import log_me
 from learntools.libs.auc import auc
 from learntools.model.mlp import MLP
-from learntools.model.theano_utils import make_shared
+from learntools.model.optimizers import get_updates, optimizer_config
+from learntools.model.theano_utils import (make_shared, set_shared, shared_data, get_compiled,
+                                           updated_variables)
 from learntools.model import Model, gen_batches_by_size
 
 
+def _build_base_emotiv(input_size, classifier_width, classifier_depth, rng_seed, optimizer):
+    """connect up and compile the BaseEmotiv graph
+
+    The data and hyperparameters are shared variables so that the compiled functions can be
+    reused by other models with the same architecture (see get_compiled).
+    """
+    xs = make_shared(np.zeros((0, input_size)), name='eeg')
+    ys = make_shared(np.zeros(0), to_int=True, name='condition')
+    hyperparams = dict((name, make_shared(0., name=name))
+                       for name in ('learning_rate', 'dropout_p', 'L1_reg', 'L2_reg'))
+
+    # 2: Connect the model
+    rng = np.random.RandomState(rng_seed)
+    t_dropout = T.scalar('dropout')
+
+    classifier = MLP(rng=rng,
+                     n_in=input_size,
+                     size=[classifier_width] * classifier_depth,
+                     n_out=2,
+                     dropout=t_dropout)
+
+    input_idxs = T.ivector('input_idxs')
+    pY = classifier.instance(xs[input_idxs])
+    true_y = ys[input_idxs]
+
+    # 3: Create theano functions
+    loss = -T.mean(T.log(pY)[T.arange(input_idxs.shape[0]), true_y])
+    subnets = [classifier]
+    cost = (
+        loss
+        + hyperparams['L1_reg'] * sum([net.L1 for net in subnets])
+        + hyperparams['L2_reg'] * sum([net.L2_sqr for net in subnets])
+    )
+
+    func_args = {
+        'inputs': [input_idxs],
+        'outputs': [loss, pY[:, 1] - pY[:, 0], input_idxs],
+        'allow_input_downcast': True,
+    }
+    params = chain.from_iterable(net.params for net in subnets)
+    update_parameters = get_updates(cost, params, hyperparams['learning_rate'],
+                                    **dict(optimizer))
+
+    return {
+        'xs': xs,
+        'ys': ys,
+        'hyperparams': hyperparams,
+        'saved_variables': classifier.params,
+        'valid': theano.function(givens={t_dropout: 0.}, **func_args),
+        'train': theano.function(
+            updates=update_parameters,
+            givens={t_dropout: hyperparams['dropout_p']},
+            **func_args),
+    }
+
+
 class BaseEmotiv(Model):
     @log_me('...building BaseEmotiv')
     def __init__(self, prepared_data, batch_size=30, L1_reg=0., L2_reg=0.,
@@ -23,61 +81,48 @@ class BaseEmotiv(Model):
                 training set, and the row indices of the validation set
             batch_size : int
                 The size of the batches used to train
+            **kwargs :
+                may hold the optimizer settings (see optimizer_config)
         """
         # 1: Organize data into batches
         ds, train_idx, valid_idx = prepared_data
         input_size = ds.get_data('eeg').shape[1]
 
-        self._xs = make_shared(ds.get_data('eeg'))
-        self._ys = make_shared(ds.get_data('condition'), to_int=True)
-
         self.train_batches = gen_batches_by_size(train_idx, batch_size)
         self.valid_batches = gen_batches_by_size(valid_idx, 1)
 
-        # 2: Connect the model
-        rng = np.random.RandomState(rng_seed)
-        t_dropout = T.scalar('dropout')
-
-        classifier = MLP(rng=rng,
-                         n_in=input_size,
-                         size=[classifier_width] * classifier_depth,
-                         n_out=2,
-                         dropout=t_dropout)
-
-        input_idxs = T.ivector('input_idxs')
-        pY = classifier.instance(self._xs[input_idxs])
-        true_y = self._ys[input_idxs]
-
-        # 3: Create theano functions
-        loss = -T.mean(T.log(pY)[T.arange(input_idxs.shape[0]), true_y])
-        subnets = [classifier]
-        cost = (
-            loss
-            + L1_reg * sum([net.L1 for net in subnets])
-            + L2_reg * sum([net.L2_sqr for net in subnets])
-        )
-
-        func_args = {
-            'inputs': [input_idxs],
-            'outputs': [loss, pY[:, 1] - pY[:, 0], input_idxs],
-            'allow_input_downcast': True,
+        self.config = {
+            'classifier_width': classifier_width,
+            'classifier_depth': classifier_depth,
         }
-        params = chain.from_iterable(net.params for net in subnets)
-        update_parameters = [(param, param - learning_rate * T.grad(cost, param))
-                             for param in params]
+        architecture = dict(self.config, input_size=input_size, rng_seed=rng_seed,
+                            optimizer=tuple(sorted(optimizer_config(**kwargs).iteritems())))
+        graph = get_compiled(('BaseEmotiv', tuple(sorted(architecture.iteritems()))),
+                             lambda: _build_base_emotiv(**architecture), owner=self)
+        self._compiled_graph = graph
+        set_shared(graph['xs'], ds.get_data('eeg'))
+        set_shared(graph['ys'], ds.get_data('condition'))
+        hyperparams = {'learning_rate': learning_rate, 'dropout_p': dropout_p,
+                       'L1_reg': L1_reg, 'L2_reg': L2_reg}
+        for name, value in hyperparams.iteritems():
+            set_shared(graph['hyperparams'][name], value)
 
-        self._tf_valid = theano.function(givens={t_dropout: 0.}, **func_args)
-        self._tf_train = theano.function(
-            updates=update_parameters,
-            givens={t_dropout: dropout_p},
-            **func_args)
+        self._ys = graph['ys']
+        self.saved_variables = graph['saved_variables']
+        self.state_variables = updated_variables([graph['train']],
+                                                 exclude=graph['saved_variables'])
+        self._tf_valid = graph['valid']
+        self._tf_train = graph['train']
 
     def evaluate(self, idxs, pred):
-        y = self._ys.owner.inputs[0].get_value(borrow=True)[idxs]
+        self.bind()
+        y = shared_data(self._ys)[idxs]
         return auc(y[:len(pred)], pred, pos_label=1)
 
     def validate(self, idxs, **kwargs):
+        self.bind()
         return self._tf_valid(idxs)
 
     def train(self, idxs, **kwargs):
+        self.bind()
         return self._tf_train(idxs)
@@ -0,0 +1,217 @@
+import theano
+import theano.tensor as T
+import numpy as np
+
+from learntools.libs.logger import log_me, log
+from learntools.libs.auc import auc
+from learntools.model.mlp import MLP
+from learntools.model.optimizers import get_updates, optimizer_config
+from learntools.model.theano_utils import (make_shared, set_shared, shared_data, get_compiled,
+                                           updated_variables)
+from learntools.model import Model, gen_batches_by_size
+
+
+def _stack_batches(fold_batches):
+    '''combine the batches of each fold into [fold x row] matrices padded with -1
+
+    Args:
+        fold_batches (int[][][]): the list of batches of each fold
+
+    Returns:
+        int[][][]: list of stacked batches. Folds with fewer batches get padding only
+
+    Example:
+        >>> _stack_batches([[[0, 1], [2, 3]], [[4, 5]]])
+        [array([[0, 1],
+               [4, 5]], dtype=int32), array([[ 2,  3],
+               [-1, -1]], dtype=int32)]
+    '''
+    n_batches = max([len(batches) for batches in fold_batches] or [0])
+    if n_batches == 0:
+        return []
+    width = max(len(batch) for batches in fold_batches for batch in batches)
+    stacked = []
+    for i in xrange(n_batches):
+        batch = np.empty((len(fold_batches), width), dtype='int32')
+        batch.fill(-1)
+        for k, batches in enumerate(fold_batches):
+            if i < len(batches):
+                batch[k, :len(batches[i])] = batches[i]
+        stacked.append(batch)
+    return stacked
+
+
+def _build_stacked_emotiv(n_folds, input_size, classifier_width, classifier_depth, rng_seed,
+                          optimizer):
+    '''connect up and compile the stacked fold graph
+
+    The MLP holds the weights of all folds along a leading axis, so one batched matmul runs
+    a layer for every fold. Each fold only sees its own rows and its loss only depends on its
+    own weights, so without dropout the folds train exactly as they would separately. Dropout
+    masks are drawn independently for every fold and row, but from random streams shared by
+    all folds, so a fold's masks differ from the ones it would draw on its own.
+    '''
+    xs = make_shared(np.zeros((0, input_size)), name='eeg')
+    ys = make_shared(np.zeros(0), to_int=True, name='condition')
+    hyperparams = dict((name, make_shared(0., name=name))
+                       for name in ('learning_rate', 'dropout_p', 'L1_reg', 'L2_reg'))
+    dropout = T.scalar('dropout')
+
+    rng = np.random.RandomState(rng_seed)
+    classifier = MLP(rng=rng,
+                     n_in=input_size,
+                     size=[classifier_width] * classifier_depth,
+                     n_out=2,
+                     dropout=dropout,
+                     n_stacked=n_folds)
+
+    idxs = T.imatrix('idxs')
+    mask = T.cast(T.ge(idxs, 0), theano.config.floatX)
+    rows = T.maximum(idxs, 0)  # padding reads row 0 but is masked out
+    pY = classifier.instance(xs[rows]).reshape((-1, 2))
+    true_y = ys[rows].flatten()
+
+    nll = -T.log(pY)[T.arange(true_y.shape[0]), true_y].reshape(idxs.shape)
+    fold_losses = T.sum(nll * mask, axis=1) / T.maximum(T.sum(mask, axis=1), 1)
+    loss = T.sum(fold_losses)
+    cost = (
+        loss
+        + hyperparams['L1_reg'] * classifier.L1
+        + hyperparams['L2_reg'] * classifier.L2_sqr
+    )
+
+    # rows of different folds are told apart by flat ids of fold * n_rows + row
+    flat_ids = (T.arange(idxs.shape[0])[:, None] * xs.shape[0] + idxs).flatten()
+    func_args = {
+        'inputs': [idxs],
+        'outputs': [loss, pY[:, 1] - pY[:, 0], flat_ids, mask.flatten()],
+        'allow_input_downcast': True,
+    }
+    update_parameters = get_updates(cost, classifier.params, hyperparams['learning_rate'],
+                                    **dict(optimizer))
+
+    return {
+        'xs': xs,
+        'ys': ys,
+        'hyperparams': hyperparams,
+        'saved_variables': classifier.params,
+        'valid': theano.function(givens={dropout: 0.}, **func_args),
+        'train': theano.function(
+            updates=update_parameters,
+            givens={dropout: hyperparams['dropout_p']},
+            **func_args),
+    }
+
+
+class StackedEmotiv(Model):
+    '''BaseEmotiv trained on several cross validation folds at once
+
+    The folds are independent with plain sgd. Optimizers with state keep moving a fold's
+    weights on steps where it has run out of batches, and max_norm clips the gradients of all
+    folds together.
+
+    Attributes:
+        train_batches (int[][][]): [fold x row] matrices of the training rows of each fold,
+            padded with -1
+        valid_batches (int[][][]): the same for the validation rows
+        fold_accuracies (float[]): the validation auc of each fold from the last
+            valid_evaluate
+    '''
+    @log_me('...building StackedEmotiv')
+    def __init__(self, prepared_data, batch_size=30, L1_reg=0., L2_reg=0.,
+                 classifier_width=500, classifier_depth=1, rng_seed=42, dropout_p=0.5,
+                 learning_rate=0.02, **kwargs):
+        """
+        Args:
+            prepared_data : (Dataset, [([int], [int])])
+                a tuple that holds the data to be used and the row indices of the training
+                and validation set of each fold
+            batch_size : int
+                The size of the batches used to train each fold
+            **kwargs :
+                may hold the optimizer settings (see optimizer_config)
+        """
+        ds, folds = prepared_data
+        if not folds:
+            raise Exception('StackedEmotiv needs at least one fold')
+        for k, (train_idx, _) in enumerate(folds):
+            if len(train_idx) == 0:
+                raise Exception('fold {} has no training rows'.format(k))
+        input_size = ds.get_data('eeg').shape[1]
+        self.n_rows = ds.n_rows
+        self.n_folds = len(folds)
+
+        self.train_batches = _stack_batches(
+            [gen_batches_by_size(list(train_idx), batch_size) for train_idx, _ in folds])
+        self.valid_batches = _stack_batches(
+            [[list(valid_idx[i:(i + batch_size)]) for i in xrange(0, len(valid_idx), batch_size)]
+             for _, valid_idx in folds])
+        self.fold_accuracies = []
+
+        self.config = {
+            'n_folds': self.n_folds,
+            'classifier_width': classifier_width,
+            'classifier_depth': classifier_depth,
+        }
+        architecture = dict(self.config, input_size=input_size, rng_seed=rng_seed,
+                            optimizer=tuple(sorted(optimizer_config(**kwargs).iteritems())))
+        graph = get_compiled(('StackedEmotiv', tuple(sorted(architecture.iteritems()))),
+                             lambda: _build_stacked_emotiv(**architecture), owner=self)
+        self._compiled_graph = graph
+        set_shared(graph['xs'], ds.get_data('eeg'))
+        set_shared(graph['ys'], ds.get_data('condition'))
+        hyperparams = {'learning_rate': learning_rate, 'dropout_p': dropout_p,
+                       'L1_reg': L1_reg, 'L2_reg': L2_reg}
+        for name, value in hyperparams.iteritems():
+            set_shared(graph['hyperparams'][name], value)
+
+        self._ys = graph['ys']
+        self.saved_variables = graph['saved_variables']
+        self.state_variables = updated_variables([graph['train']],
+                                                 exclude=graph['saved_variables'])
+        self._tf_valid = graph['valid']
+        self._tf_train = graph['train']
+
+    def fold_evaluate(self, idxs, pred):
+        '''the auc of each fold
+
+        Args:
+            idxs (int[]): flat ids of the rows (fold * n_rows + row)
+            pred (float[]): the prediction for the label of that row
+
+        Returns:
+            float[]: auc of each fold. nan for folds without rows
+        '''
+        idxs = np.asarray(idxs)
+        pred = np.asarray(pred)
+        self.bind()
+        y = shared_data(self._ys)
+        accuracies = []
+        for k in xrange(self.n_folds):
+            in_fold = idxs // self.n_rows == k
+            if not in_fold.any():
+                accuracies.append(float('nan'))
+                continue
+            accuracies.append(auc(y[idxs[in_fold] % self.n_rows], pred[in_fold], pos_label=1))
+        return accuracies
+
+    def evaluate(self, idxs, pred):
+        return np.nanmean(self.fold_evaluate(idxs, pred))
+
+    def valid_evaluate(self, idxs, pred):
+        self.fold_accuracies = self.fold_evaluate(idxs, pred)
+        log('fold validation accuracies ' +
+            ' '.join('{:.2%}'.format(a) for a in self.fold_accuracies), True)
+        return np.nanmean(self.fold_accuracies)
+
+    def _run(self, f, idxs):
+        self.bind()
+        loss, preds, ids, mask = f(idxs)
+        mask = mask.astype(bool)
+        return loss, preds[mask], ids[mask]
+
+    def validate(self, idxs, **kwargs):
+        return self._run(self._tf_valid, idxs)
+
+    def train(self, idxs, **kwargs):
+        return self._run(self._tf_train, idxs)
@@ -0,0 +1,69 @@
+import pytest
+import numpy as np
+
+from learntools.data import Dataset
+from learntools.libs.logger import set_log_file
+from learntools.emotiv.stacked import StackedEmotiv, _stack_batches
+
+
+def _fake_emotiv_data(n_rows=80, seed=0):
+    rng = np.random.RandomState(seed)
+    ds = Dataset([('condition', Dataset.ENUM), ('eeg', Dataset.MATFLOAT)], n_rows=n_rows)
+    for i in xrange(n_rows):
+        condition = (i // 4) % 2
+        ds[i] = (str(condition), rng.rand(4) + condition)
+    return ds
+
+
+def _folds(n_rows, n_folds):
+    folds = []
+    for k in xrange(n_folds):
+        valid_idx = range(k, n_rows, n_folds)
+        folds.append(([i for i in xrange(n_rows) if i % n_folds != k], valid_idx))
+    return folds
+
+
+def test_stack_batches():
+    batches = _stack_batches([[[0, 1], [2, 3]], [[4, 5]], [[6]]])
+    assert len(batches) == 2
+    assert batches[0].tolist() == [[0, 1], [4, 5], [6, -1]]
+    assert batches[1].tolist() == [[2, 3], [-1, -1], [-1, -1]]
+
+
+def _train(ds, folds, n_epochs=10):
+    model = StackedEmotiv((ds, folds), batch_size=10, classifier_width=6, dropout_p=0.,
+                          learning_rate=0.1)
+    for _ in xrange(n_epochs):
+        for batch in model.train_batches:
+            model.train(batch)
+    return model
+
+
+def test_stacked_folds(tmpdir):
+    set_log_file(str(tmpdir.join('log.txt')))
+    ds = _fake_emotiv_data()
+    folds = _folds(ds.n_rows, 4)
+    model = _train(ds, folds)
+
+    results = [model.validate(batch) for batch in model.valid_batches]
+    idxs = np.concatenate([r[2] for r in results])
+    preds = np.concatenate([r[1] for r in results])
+    assert sorted(idxs % ds.n_rows) == range(ds.n_rows)
+    accuracy = model.valid_evaluate(idxs, preds)
+    assert len(model.fold_accuracies) == 4
+    assert accuracy > 0.9
+
+    # a fold trains the same no matter what the other folds hold
+    other_folds = [folds[0]] + [(folds[0][0][:20], folds[0][1])] * 3
+    other = [v.get_value()[0] for v in _train(ds, other_folds).saved_variables]
+    first = [v.get_value()[0] for v in _train(ds, folds).saved_variables]
+    for v1, v2 in zip(first, other):
+        assert np.allclose(v1, v2)
+
+
+def test_empty_folds():
+    assert _stack_batches([[], []]) == []
+    ds = _fake_emotiv_data(n_rows=8)
+    with pytest.raises(Exception) as e:
+        StackedEmotiv((ds, [(range(8), []), ([], range(8))]), classifier_width=2)
+    assert 'fold 1 has no training rows' in str(e.value)
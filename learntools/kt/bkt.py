@@ -0,0 +1,558 @@
+from collections import namedtuple
+import multiprocessing
+import time
+
+import numpy as np
+
+from learntools.libs.logger import log
+from learntools.libs.utils import balanced_work_units
+
+# per-skill parameters of bayesian knowledge tracing. Each field is an array indexed by skill
+BKTParams = namedtuple('BKTParams', ['L0', 'T', 'G', 'S'])
+
+# how the fit of a single skill went (see fit_parallel)
+FitReport = namedtuple('FitReport', ['skill', 'n_rows', 'iterations', 'log_likelihood',
+                                     'seconds'])
+
+FITTERS = {}
+
+
+def register_fitter(name):
+    '''decorator that makes a parameter fitter selectable by name in fit_parallel
+
+    A fitter takes skills, corrects, positions and the keyword arguments params and n_skills
+    plus its own settings, and returns the fitted BKTParams, the number of iterations of each
+    skill and the log likelihood of each skill.
+    '''
+    def register(func):
+        FITTERS[name] = func
+        return func
+    return register
+
+
+def get_fitter(name):
+    try:
+        return FITTERS[name]
+    except KeyError:
+        raise Exception("unknown bkt fitter '{}'".format(name))
+
+
+def default_params(n_skills, L0=0.4, T=0.5, G=0.1, S=0.2):
+    '''the same starting point as the parameters of kt.build_model'''
+    base = np.ones(n_skills)
+    return BKTParams(base * L0, base * T, base * G, base * S)
+
+
+def sort_order(subjects, skills, start_times=None):
+    '''row order that groups the rows by (subject, skill) sequence like kt.build_model
+
+    Rows of a sequence keep their original order unless start_times are given.
+    '''
+    keys = [np.arange(len(skills))] if start_times is None else [start_times]
+    return np.lexsort(keys + [skills, subjects])
+
+
+def sequence_positions(subjects, skills):
+    '''position of each row in its (subject, skill) sequence
+
+    Args:
+        subjects (int[]): the subject of each row
+        skills (int[]): the skill of each row. Rows must be sorted so that the rows of a
+            (subject, skill) sequence are contiguous and in order
+
+    Returns:
+        int[]: 0 for the first row of a sequence, 1 for the second and so on
+    '''
+    subjects = np.asarray(subjects)
+    skills = np.asarray(skills)
+    n = len(skills)
+    if n == 0:
+        return np.zeros(0, dtype=int)
+    starts = np.ones(n, dtype=bool)
+    starts[1:] = (subjects[1:] != subjects[:-1]) | (skills[1:] != skills[:-1])
+    start_idx = np.nonzero(starts)[0]
+    return np.arange(n) - start_idx[np.cumsum(starts) - 1]
+
+
+def _steps(positions):
+    '''group the rows by their position in their sequence
+
+    Rows at position t only depend on the rows at position t - 1 (always the row right before
+    them), so each group can be computed at once for every sequence.
+
+    Returns:
+        int[][]: the rows of each position
+    '''
+    order = np.argsort(positions, kind='mergesort')
+    bounds = np.searchsorted(positions[order], np.arange(positions.max() + 2))
+    return [order[lo:hi] for lo, hi in zip(bounds[:-1], bounds[1:])]
+
+
+def _filter(skills, corrects, steps, params, initial=None):
+    '''the forward pass of knowledge tracing
+
+    The first row of each sequence starts from initial (by row) if it is given and from L0 of
+    its skill otherwise.
+
+    Returns:
+        (float[], float[], float[]): for each row the predicted probability of a correct
+            answer, the probability that the skill is known given the rows up to and
+            including it, and the same after the chance to learn it
+    '''
+    L0, T, G, S = params
+    p_correct = np.empty(len(skills))
+    p_filtered = np.empty(len(skills))
+    p_known = np.empty(len(skills))
+    for t, rows in enumerate(steps):
+        skill = skills[rows]
+        if t > 0:
+            prior = p_known[rows - 1]
+        else:
+            prior = L0[skill] if initial is None else initial[rows]
+        g, s = G[skill], S[skill]
+        p_c = prior * (1 - s) + (1 - prior) * g
+        posterior = np.where(corrects[rows],
+                             prior * (1 - s) / p_c,
+                             prior * s / (1 - p_c))
+        p_correct[rows] = p_c
+        p_filtered[rows] = posterior
+        p_known[rows] = posterior + (1 - posterior) * T[skill]
+    return p_correct, p_filtered, p_known
+
+
+def _as_arrays(skills, corrects, positions, params):
+    return (np.asarray(skills), np.asarray(corrects, dtype=bool), np.asarray(positions),
+            BKTParams(*(np.asarray(p, dtype=float) for p in params)))
+
+
+def forward(skills, corrects, positions, params, initial=None):
+    '''run knowledge tracing over every sequence at once
+
+    Args:
+        skills (int[]): the skill of each row
+        corrects (bool[]): whether each row was answered correctly
+        positions (int[]): position of each row in its sequence (see sequence_positions)
+        params (BKTParams): per-skill parameters
+        initial (float[], optional): the knowledge each row would start from if it were the
+            first row of its sequence. Only the first rows are read. L0 of the skill is used
+            by default
+
+    Returns:
+        (float[], float[]): the predicted probability that each row is correct given the rows
+            before it, and the probability that the skill is known after the row (which is
+            what the next row of the sequence starts from)
+    '''
+    skills, corrects, positions, params = _as_arrays(skills, corrects, positions, params)
+    if len(skills) == 0:
+        return np.empty(0), np.empty(0)
+    if initial is not None:
+        initial = np.asarray(initial, dtype=float)
+    p_correct, _, p_known = _filter(skills, corrects, _steps(positions), params,
+                                    initial=initial)
+    return p_correct, p_known
+
+
+def _smooth(skills, positions, steps, p_filtered, p_known, T):
+    '''the backward pass of forward-backward given the results of _filter
+
+    Since a known skill is never forgotten, a row only has to pass back the probability that
+    the skill is known.
+
+    Returns:
+        (float[], float[]): for each row the probability that the skill is known given the
+            whole sequence, and the probability that it was learned between the row and the
+            next one of the sequence (0 for the last row)
+    '''
+    p_smoothed = np.empty(len(skills))
+    p_learned = np.zeros(len(skills))
+    has_next = np.zeros(len(skills), dtype=bool)
+    has_next[:-1] = positions[1:] > 0
+    for rows in reversed(steps):
+        last = rows[~has_next[rows]]
+        p_smoothed[last] = p_filtered[last]
+        rows = rows[has_next[rows]]
+        next_smoothed = p_smoothed[rows + 1]
+        # the probability of being known at the next row, given the rows up to this one
+        next_known = p_known[rows]
+        stayed = p_filtered[rows] * next_smoothed / next_known
+        learned = ((1 - p_filtered[rows]) * T[skills[rows]] * next_smoothed / next_known)
+        p_smoothed[rows] = stayed
+        p_learned[rows] = learned
+    return p_smoothed, p_learned
+
+
+def _row_log_likelihood(corrects, p_correct, eps=1e-10):
+    return np.log(np.clip(np.where(corrects, p_correct, 1 - p_correct), eps, 1))
+
+
+def log_likelihood(corrects, p_correct, eps=1e-10):
+    '''total log likelihood of the observed answers under the predictions of forward'''
+    return _row_log_likelihood(np.asarray(corrects, dtype=bool), p_correct, eps=eps).sum()
+
+
+def _ratio(num, den, default):
+    return np.where(den > 0, num / np.maximum(den, 1e-300), default)
+
+
+@register_fitter('em')
+def fit_em(skills, corrects, positions, params=None, n_skills=None, tol=1e-5, max_iter=100,
+           max_guess=0.3, max_slip=0.3, eps=1e-4):
+    '''fit the parameters of every skill with expectation maximization (Baum-Welch)
+
+    Each iteration runs forward-backward over all sequences at once and then sets L0, T, G
+    and S of each skill to their expected frequencies.
+
+    Args:
+        skills (int[]): the skill of each row
+        corrects (bool[]): whether each row was answered correctly
+        positions (int[]): position of each row in its sequence (see sequence_positions)
+        params (BKTParams, optional): the parameters to start from. default_params is used
+            if not provided
+        n_skills (int, optional): the number of skills. Taken from params or skills by default
+        tol (float): a skill has converged once its log likelihood per row improves by less
+            than this in an iteration
+        max_iter (int): the maximum number of iterations
+        max_guess (float): upper bound of G
+        max_slip (float): upper bound of S. Keeping G and S below 0.5 rules out the fits
+            where "known" and "unknown" swap meanings
+        eps (float): how far every probability is kept from 0 and 1
+
+    Returns:
+        (BKTParams, int[], float[]): the fitted parameters, the number of iterations each skill
+            took and the log likelihood of the rows of each skill. Skills without rows keep
+            their starting parameters
+    '''
+    skills = np.asarray(skills)
+    corrects = np.asarray(corrects, dtype=bool)
+    positions = np.asarray(positions)
+    if n_skills is None:
+        n_skills = len(params[0]) if params is not None else skills.max() + 1
+    if params is None:
+        params = default_params(n_skills)
+    params = BKTParams(*(np.array(p, dtype=float) for p in params))
+    iterations = np.zeros(n_skills, dtype=int)
+    if len(skills) == 0:
+        return params, iterations, np.zeros(n_skills)
+
+    def per_skill(values):
+        return np.bincount(skills, weights=values, minlength=n_skills)
+
+    steps = _steps(positions)
+    first = positions == 0
+    has_next = np.zeros(len(skills), dtype=bool)
+    has_next[:-1] = positions[1:] > 0
+    n_rows = per_skill(None)
+    active = n_rows > 0
+    prev_ll = np.empty(n_skills)
+    prev_ll.fill(-np.inf)
+    for i in xrange(max_iter + 1):
+        p_correct, p_filtered, p_known = _filter(skills, corrects, steps, params)
+        ll = per_skill(_row_log_likelihood(corrects, p_correct))
+        active &= ll - prev_ll >= tol * n_rows
+        prev_ll = ll
+        if i == max_iter or not active.any():
+            break
+        iterations[active] += 1
+
+        p_smoothed, p_learned = _smooth(skills, positions, steps, p_filtered, p_known,
+                                        params.T)
+        p_unknown = 1 - p_smoothed
+        updates = BKTParams(
+            _ratio(per_skill(p_smoothed * first), per_skill(first), params.L0),
+            _ratio(per_skill(p_learned), per_skill(p_unknown * has_next), params.T),
+            _ratio(per_skill(p_unknown * corrects), per_skill(p_unknown), params.G),
+            _ratio(per_skill(p_smoothed * ~corrects), per_skill(p_smoothed), params.S))
+        upper = (1 - eps, 1 - eps, max_guess, max_slip)
+        # converged skills keep their parameters
+        params = BKTParams(*(np.where(active, np.clip(new, eps, high), old)
+                             for new, old, high in zip(updates, params, upper)))
+    return params, iterations, ll
+
+
+def _filter_gradient(skills, corrects, steps, params):
+    '''_filter with forward mode derivatives with respect to the parameters of each row's skill
+
+    Returns:
+        (float[], float[][]): the log likelihood of each row and its derivatives with respect to
+            (L0, T, G, S) of the skill of the row
+    '''
+    L0, T, G, S = params
+    row_ll = np.empty(len(skills))
+    d_ll = np.empty((len(skills), 4))
+    p_known = np.empty(len(skills))
+    d_known = np.empty((len(skills), 4))
+    for t, rows in enumerate(steps):
+        skill = skills[rows]
+        correct = corrects[rows]
+        g, s, tr = G[skill], S[skill], T[skill]
+        if t == 0:
+            prior = L0[skill]
+            d_prior = np.zeros((len(rows), 4))
+            d_prior[:, 0] = 1
+        else:
+            prior = p_known[rows - 1]
+            d_prior = d_known[rows - 1]
+        # the probability of the observed answer and of "known and this answer"
+        p_c = prior * (1 - s) + (1 - prior) * g
+        d_p_c = d_prior * (1 - s - g)[:, None]
+        d_p_c[:, 2] += 1 - prior
+        d_p_c[:, 3] -= prior
+        sign = np.where(correct, 1., -1.)
+        p_obs = np.where(correct, p_c, 1 - p_c)
+        d_obs = d_p_c * sign[:, None]
+        emit = np.where(correct, 1 - s, s)
+        joint = prior * emit
+        d_joint = d_prior * emit[:, None]
+        d_joint[:, 3] -= prior * sign
+        posterior = joint / p_obs
+        d_posterior = (d_joint - posterior[:, None] * d_obs) / p_obs[:, None]
+
+        row_ll[rows] = np.log(p_obs)
+        d_ll[rows] = d_obs / p_obs[:, None]
+        p_known[rows] = posterior + (1 - posterior) * tr
+        d_known[rows] = d_posterior * (1 - tr)[:, None]
+        d_known[rows, 1] += 1 - posterior
+    return row_ll, d_ll
+
+
+@register_fitter('gradient')
+def fit_gradient(skills, corrects, positions, params=None, n_skills=None, learning_rate=1.,
+                 tol=1e-5, max_iter=500, max_guess=0.3, max_slip=0.3, eps=1e-4):
+    '''fit the parameters of every skill by gradient ascent on the log likelihood
+
+    Like kt.build_model the parameters are optimized as logits (see make_probability), but
+    with exact gradients of the mean log likelihood of each skill computed in numpy.
+
+    Args:
+        learning_rate (float): step size on the logits
+        The other arguments are the same as for fit_em
+
+    Returns:
+        (BKTParams, int[], float[]): the same as fit_em
+    '''
+    skills = np.asarray(skills)
+    corrects = np.asarray(corrects, dtype=bool)
+    positions = np.asarray(positions)
+    if n_skills is None:
+        n_skills = len(params[0]) if params is not None else skills.max() + 1
+    if params is None:
+        params = default_params(n_skills)
+    params = BKTParams(*(np.array(p, dtype=float) for p in params))
+    iterations = np.zeros(n_skills, dtype=int)
+    if len(skills) == 0:
+        return params, iterations, np.zeros(n_skills)
+
+    def per_skill(values):
+        return np.bincount(skills, weights=values, minlength=n_skills)
+
+    steps = _steps(positions)
+    n_rows = per_skill(None)
+    active = n_rows > 0
+    lower = np.array([eps] * 4)[:, None]
+    upper = np.array([1 - eps, 1 - eps, max_guess, max_slip])[:, None]
+    probs = np.clip(np.array(params), lower, upper)
+    logits = np.log(probs / (1 - probs))
+    prev_ll = np.empty(n_skills)
+    prev_ll.fill(-np.inf)
+    for i in xrange(max_iter + 1):
+        row_ll, d_ll = _filter_gradient(skills, corrects, steps, BKTParams(*probs))
+        ll = per_skill(row_ll)
+        active &= ll - prev_ll >= tol * n_rows
+        prev_ll = ll
+        if i == max_iter or not active.any():
+            break
+        iterations[active] += 1
+
+        grads = np.array([per_skill(d_ll[:, k]) for k in xrange(4)]) / np.maximum(n_rows, 1)
+        logits += active * learning_rate * grads * probs * (1 - probs)
+        probs = np.clip(1 / (1 + np.exp(-logits)), lower, upper)
+        logits = np.log(probs / (1 - probs))
+    return BKTParams(*probs), iterations, ll
+
+
+def _fit_skills(work_unit):
+    '''fit the skills of a work unit one at a time
+
+    Args:
+        work_unit ((string, dict, (int, bool[], int[], float[])[])): the fitter, its settings
+            and the skill, answers, positions and starting parameters of each skill
+
+    Returns:
+        (FitReport, float[])[]: the report and the fitted (L0, T, G, S) of each skill
+    '''
+    method, kwargs, skill_data = work_unit
+    fitter = get_fitter(method)
+    results = []
+    for skill, corrects, positions, start in skill_data:
+        start_time = time.time()
+        fitted, iterations, ll = fitter(np.zeros(len(corrects), dtype=int), corrects,
+                                        positions, params=BKTParams(*([p] for p in start)),
+                                        n_skills=1, **kwargs)
+        report = FitReport(skill, len(corrects), iterations[0], ll[0],
+                           time.time() - start_time)
+        results.append((report, [p[0] for p in fitted]))
+    return results
+
+
+def fit_parallel(skills, corrects, positions, params=None, n_skills=None, method='em',
+                 n_jobs=1, **kwargs):
+    '''fit the skills independently over a pool of processes
+
+    The parameters of a skill only depend on its own rows, so skills are split into work units
+    of similar total row counts and each skill is fit on its own.
+
+    Args:
+        skills (int[]): the skill of each row
+        corrects (bool[]): whether each row was answered correctly
+        positions (int[]): position of each row in its sequence (see sequence_positions)
+        params (BKTParams, optional): the parameters to start from
+        n_skills (int, optional): the number of skills
+        method (string): name of the fitter (see FITTERS)
+        n_jobs (int): number of processes. Everything runs in this process if it is 1
+        **kwargs: settings of the fitter
+
+    Returns:
+        (BKTParams, FitReport[]): the fitted parameters and a report of each skill with rows
+    '''
+    get_fitter(method)
+    skills = np.asarray(skills)
+    corrects = np.asarray(corrects, dtype=bool)
+    positions = np.asarray(positions)
+    if n_skills is None:
+        n_skills = len(params[0]) if params is not None else skills.max() + 1
+    if params is None:
+        params = default_params(n_skills)
+    params = BKTParams(*(np.array(p, dtype=float) for p in params))
+
+    # a stable sort keeps the sequences of each skill contiguous and in order
+    order = np.argsort(skills, kind='mergesort')
+    bounds = np.searchsorted(skills[order], np.arange(n_skills + 1))
+    skill_data = [(k, corrects[order[lo:hi]], positions[order[lo:hi]],
+                   [p[k] for p in params])
+                  for k, (lo, hi) in enumerate(zip(bounds[:-1], bounds[1:])) if hi > lo]
+    sizes = [len(c) for _, c, _, _ in skill_data]
+    work_units = [(method, kwargs, [skill_data[i] for i in unit])
+                  for unit in balanced_work_units(sizes, max(n_jobs, 1) * 4)]
+
+    start_time = time.time()
+    if n_jobs > 1 and len(work_units) > 1:
+        pool = multiprocessing.Pool(n_jobs)
+        try:
+            results = pool.map(_fit_skills, work_units)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = map(_fit_skills, work_units)
+
+    reports = []
+    for report, fitted in (r for unit in results for r in unit):
+        for p, value in zip(params, fitted):
+            p[report.skill] = value
+        reports.append(report)
+    reports.sort(key=lambda r: r.skill)
+
+    slowest = sorted(reports, key=lambda r: -r.seconds)[:3]
+    log('fit {} skills with {} in {:.2f}s. slowest: {}'.format(
+        len(reports), method, time.time() - start_time,
+        ', '.join('skill {} ({} rows, {} iterations, {:.2f}s)'.format(
+            r.skill, r.n_rows, r.iterations, r.seconds) for r in slowest)), True)
+    return params, reports
+
+
+def _grid_log_likelihood(corrects, steps, points, max_floats):
+    '''log likelihood of the rows of one skill under every point of a parameter grid
+
+    Args:
+        corrects (bool[]): whether each row was answered correctly
+        steps (int[][]): the rows of each sequence position (see _steps)
+        points (float[][]): (n_points, 4) array of (L0, T, G, S)
+        max_floats (int): grid points are evaluated in chunks so that the knowledge of every
+            row under every point of a chunk holds at most about this many floats
+
+    Returns:
+        float[]: the log likelihood of each grid point
+    '''
+    answers = corrects.astype(int)
+    chunk_size = max(1, max_floats // max(len(corrects), 1))
+    lls = np.empty(len(points))
+    for lo in xrange(0, len(points), chunk_size):
+        L0, T, G, S = points[lo:lo + chunk_size].T[:, :, None]
+        # probability of each answer (wrong, right) when the skill is known or unknown
+        if_known = np.concatenate([S, 1 - S], axis=1)
+        if_unknown = np.concatenate([1 - G, G], axis=1)
+        p_known = np.empty((len(L0), len(corrects)))
+        ll = np.zeros(len(L0))
+        for t, rows in enumerate(steps):
+            prior = L0 if t == 0 else p_known[:, rows - 1]
+            known = prior * if_known[:, answers[rows]]
+            p_obs = known + (1 - prior) * if_unknown[:, answers[rows]]
+            posterior = known / p_obs
+            ll += np.log(p_obs).sum(axis=1)
+            p_known[:, rows] = posterior + (1 - posterior) * T
+        lls[lo:lo + chunk_size] = ll
+    return lls
+
+
+def _grid_points(axes):
+    return np.array(np.meshgrid(*axes, indexing='ij')).reshape(4, -1).T
+
+
+@register_fitter('grid')
+def fit_grid(skills, corrects, positions, params=None, n_skills=None, resolution=10, refine=0,
+             max_floats=10 ** 7, max_guess=0.3, max_slip=0.3, eps=1e-4):
+    '''fit the parameters of every skill by exhaustive search over a grid
+
+    Every combination of resolution values of L0, T, G and S is evaluated, so the fit cannot
+    get stuck in a local optimum at the cost of resolution ** 4 forward passes, which run
+    together as array ops.
+
+    Args:
+        resolution (int): the number of values of each parameter in the grid
+        refine (int): the number of times a finer grid is searched around the best point.
+            Each refinement covers the neighbouring points of the previous grid
+        max_floats (int): bounds the memory of a chunk of grid points (see
+            _grid_log_likelihood)
+        The other arguments are the same as for fit_em. Only the number of skills is taken
+        from params
+
+    Returns:
+        (BKTParams, int[], float[]): the same as fit_em. The iterations are the number of
+            grids searched
+    '''
+    skills = np.asarray(skills)
+    corrects = np.asarray(corrects, dtype=bool)
+    positions = np.asarray(positions)
+    if n_skills is None:
+        n_skills = len(params[0]) if params is not None else skills.max() + 1
+    if params is None:
+        params = default_params(n_skills)
+    params = BKTParams(*(np.array(p, dtype=float) for p in params))
+    iterations = np.zeros(n_skills, dtype=int)
+    lls = np.zeros(n_skills)
+
+    upper = np.array([1 - eps, 1 - eps, max_guess, max_slip])
+    # the grid starts at the centers of resolution equal cells between 0 and each upper bound
+    spacing = upper / resolution
+    order = np.argsort(skills, kind='mergesort')
+    bounds = np.searchsorted(skills[order], np.arange(n_skills + 1))
+    for skill, (lo, hi) in enumerate(zip(bounds[:-1], bounds[1:])):
+        if hi == lo:
+            continue
+        rows = order[lo:hi]
+        steps = _steps(positions[rows])
+        axes = [(np.arange(resolution) + 0.5) * s for s in spacing]
+        step_size = spacing
+        for i in xrange(refine + 1):
+            points = _grid_points(axes)
+            skill_lls = _grid_log_likelihood(corrects[rows], steps, points, max_floats)
+            best = np.argmax(skill_lls)
+            step_size = step_size * 2 / max(resolution - 1, 1)
+            axes = [np.unique(np.clip(center + (np.arange(resolution) - (resolution - 1) / 2.)
+                                      * step, eps, high))
+                    for center, step, high in zip(points[best], step_size, upper)]
+        for p, value in zip(params, points[best]):
+            p[skill] = value
+        iterations[skill] = refine + 1
+        lls[skill] = skill_lls[best]
+    return params, iterations, lls
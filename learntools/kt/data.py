@@ -1,13 +1,18 @@
+import csv
+import ctypes
 import gzip
 import cPickle
-from itertools import groupby, compress, imap
+import hashlib
+import multiprocessing
+import os
+from itertools import imap, islice, izip
 from operator import or_
 
 import numpy as np
 
 from learntools.data import Dataset
 from learntools.libs.logger import log, log_me
-from learntools.libs.utils import normalize_table
+from learntools.libs.utils import normalize_table, get_column, idx_to_mask, balanced_work_units
 
 
 def convert_task_from_xls(fname, outname=None):
@@ -25,86 +30,330 @@ def convert_task_from_xls(fname, outname=None):
         return data
 
 
-def convert_eeg_from_xls(fname, outname=None, cutoffs=(0.5, 4.0, 7.0, 12.0, 30.0)):
-    from eeg import signal_to_freq_bins
-    headers = (('sigqual', Dataset.INT),
+EEG_HEADERS = (('sigqual', Dataset.INT),
                ('subject', Dataset.ENUM),
                ('start_time', Dataset.TIME),
-               ('end_time', Dataset.TIME),
-               ('rawwave', Dataset.STR))
-    data = Dataset.from_csv(fname, headers)
+               ('end_time', Dataset.TIME))
+
+
+def gen_eeg_features(fname, cutoffs=(0.5, 4.0, 7.0, 12.0, 30.0), offset=None,
+                     chunk_size=1000, delimiter='\t', extractor='fft_bins', cache=None):
+    '''stream frequency band features out of a raw eeg file
+
+    The file is read one chunk of rows at a time and the raw waves of each chunk are
+    discarded as soon as their features are computed, so memory is bounded by chunk_size
+    rather than by the size of the recording.
+
+    Args:
+        fname (string): location of the eeg file. It must have the columns of EEG_HEADERS
+            and a 'rawwave' column of space separated samples
+        cutoffs (float[]): boundaries of the frequency bands
+        offset (int, optional): byte offset to resume reading from. This must be an offset
+            yielded by this function. Reading starts at the first row by default
+        chunk_size (int): number of rows processed at a time
+        delimiter (char): the delimiter of the csv file
+        extractor (string): name of the feature extractor in learntools.libs.eeg
+        cache (FeatureCache, optional): reuse features of raw waves that were already seen
+
+    Yields:
+        (list[], int): the rows of the chunk and the byte offset of the first unread row.
+            Each row holds the original strings of the EEG_HEADERS columns followed by
+            the list of band features
+    '''
+    from learntools.libs.eeg import extract
     cutoffs = list(cutoffs)
-    eeg_freq = np.empty((len(data.get_data('rawwave')), len(cutoffs) - 1))
-    for i, eeg_str in enumerate(data['rawwave']):
-        eeg = [float(d) for d in eeg_str.strip().split(' ')]
-        eeg_freq[i] = tuple(signal_to_freq_bins(eeg, cutoffs=cutoffs, sampling_rate=512))
-    data.set_column('eeg', Dataset.MATFLOAT, data=eeg_freq)
+    f_extract = extract if cache is None else cache.extract
+    with open(fname, 'rb') as f:
+        # read line by line rather than iterating over the file so that tell() stays exact
+        reader = csv.reader(iter(f.readline, ''), delimiter=delimiter)
+        file_headers = reader.next()
+        header_column_idxs = [file_headers.index(h) for h in get_column(EEG_HEADERS, 0)]
+        rawwave_idx = file_headers.index('rawwave')
+        if offset is not None:
+            f.seek(offset)
+        while True:
+            rows = list(islice(reader, chunk_size))
+            if not rows:
+                break
+            rows = [row for row in rows if ''.join(row).strip()]  # skip blank lines
+            if not rows:
+                continue
+            signals = [np.fromstring(row[rawwave_idx], sep=' ') for row in rows]
+            features = f_extract(extractor, signals, cutoffs=cutoffs, sampling_rate=512.)
+            del signals
+            yield ([[row[i] for i in header_column_idxs] + [list(feat)]
+                    for row, feat in izip(rows, features)], f.tell())
+
+
+def convert_eeg_from_xls(fname, outname=None, cutoffs=(0.5, 4.0, 7.0, 12.0, 30.0),
+                         chunk_size=1000, **kwargs):
+    # count the rows first so that the dataset can be preallocated. The raw waves are
+    # never stored so the file can be much larger than memory
+    with open(fname, 'rb') as f:
+        n_rows = sum(1 for line in f if line.strip()) - 1  # don't count header
+    data = Dataset(EEG_HEADERS + (('eeg', Dataset.MATFLOAT),), n_rows=n_rows)
+    i = 0
+    for rows, _ in gen_eeg_features(fname, cutoffs=cutoffs, chunk_size=chunk_size, **kwargs):
+        for row in rows:
+            data[i] = row
+            i += 1
+    if i < n_rows:
+        # only keep the rows that were written, e.g. if a quoted field spanned lines
+        data.mask(np.arange(n_rows) < i)
     if outname is not None:
         with gzip.open(outname, 'w') as f:
             cPickle.dump(data.to_pickle(), f)
     return data
 
 
-def align_data(task_data, eeg_data, out_name=None, sigqual_cutoff=200):
-    # Step1: convert to dictionary with subject_id as keys and rows sorted by
-    # start_time as values
-    if isinstance(task_data, str):
-        with gzip.open(task_data, 'rb') as f:
-            task_data = Dataset.from_pickle(cPickle.load(f))
-    if isinstance(eeg_data, str):
-        with gzip.open(eeg_data, 'rb') as f:
-            eeg_data = Dataset.from_pickle(cPickle.load(f))
-
-    def convert_format(dataset):
-        sorted_i = sorted(xrange(dataset.n_rows),
-                          key=lambda i: (dataset['subject'][i], dataset['start_time'][i]))
-        subject_groups = groupby(sorted_i, lambda i: dataset['subject'][i])
-        subject_dict = dict((v, k) for (k, v) in dataset.get_column('subject').enum_pairs)
-        data_by_subject = {subject_dict[k]: list(v) for k, v in subject_groups}
-        return data_by_subject
-    task_by_subject = convert_format(task_data)
-    eeg_by_subject = convert_format(eeg_data)
-
-    # Step2: efficiently create mapping between task and eeg using the structured data
-    task_eeg_mapping = [None] * task_data.n_rows
-    for sub, task in task_by_subject.iteritems():
-        if sub not in eeg_by_subject:
-            continue
-        eeg = eeg_by_subject[sub]
-        num_sub_eegs = len(eeg)
-        e_i = 0
+def stream_eeg_from_xls(fname, outname, cutoffs=(0.5, 4.0, 7.0, 12.0, 30.0), offset=None,
+                        chunk_size=1000, **kwargs):
+    '''convert a raw eeg file into a tab-delimited feature file chunk by chunk
+
+    Feature rows are appended to outname as each chunk is processed. After every chunk
+    the byte offset reached in fname is written to '<outname>.offset' so that an
+    interrupted conversion, or a file that has grown since, can be continued by passing
+    that offset back in. Load the result with load_eeg_features.
+
+    Args:
+        fname (string): location of the raw eeg file
+        outname (string): location of the feature file to write
+        offset (int, optional): byte offset of fname to resume from. If not provided,
+            outname is overwritten from the start
+        **kwargs: feature extraction arguments to gen_eeg_features
+
+    Returns:
+        int: the byte offset of the end of fname
+    '''
+    offset_name = '{}.offset'.format(outname)
+    with open(outname, 'w' if offset is None else 'a') as f:
+        writer = csv.writer(f, delimiter='\t')
+        if offset is None:
+            writer.writerow(get_column(EEG_HEADERS, 0) + ['eeg'])
+        for rows, offset in gen_eeg_features(fname, cutoffs=cutoffs, offset=offset,
+                                             chunk_size=chunk_size, **kwargs):
+            writer.writerows(row[:-1] + [' '.join(map(repr, row[-1]))] for row in rows)
+            f.flush()
+            with open(offset_name, 'w') as f_offset:
+                f_offset.write(str(offset))
+    return offset
+
+
+def load_eeg_features(fname):
+    '''load a feature file written by stream_eeg_from_xls
+
+    Returns:
+        Dataset: a dataset with the EEG_HEADERS columns and an 'eeg' feature matrix
+    '''
+    data = Dataset.from_csv(fname, EEG_HEADERS + (('eeg', Dataset.STR),))
+    eeg_strs = data.get_data('eeg')
+    data.set_column('eeg', Dataset.MATFLOAT)
+    for i, eeg_str in enumerate(eeg_strs):
+        data.get_column('eeg')[i] = np.fromstring(eeg_str, sep=' ')
+    return data
+
+
+def _load_dataset(data):
+    if isinstance(data, str):
+        with gzip.open(data, 'rb') as f:
+            data = Dataset.from_pickle(cPickle.load(f))
+    return data
+
+
+def _rows_by_subject(dataset, rows=None):
+    '''group rows by subject name with the rows of each subject sorted by start_time'''
+    if rows is None:
+        rows = np.arange(dataset.n_rows)
+    subject_x = dataset.get_data('subject')
+    rows = rows[np.lexsort((dataset.get_data('start_time')[rows], subject_x[rows]))]
+    boundaries = np.flatnonzero(np.diff(subject_x[rows])) + 1
+    subject_dict = dict((v, k) for (k, v) in dataset.get_column('subject').enum_pairs)
+    return {subject_dict[subject_x[group[0]]]: group for group in np.split(rows, boundaries)
+            if len(group)}
+
+
+class SubjectIndex(object):
+    '''the rows of each subject of a dataset sorted by start_time
+
+    The index is kept up to date as rows are appended to the dataset (e.g. with
+    Dataset.extend), so that aligning new tasks against a long eeg history neither sorts
+    nor scans the whole history again.
+
+    Args:
+        dataset (Dataset): a dataset with subject, start_time and end_time columns
+    '''
+    def __init__(self, dataset):
+        self.rows = _rows_by_subject(dataset)
+        self.n_rows = dataset.n_rows
+
+    def update(self, dataset):
+        '''merge the rows appended to dataset since the index was built or last updated'''
+        if dataset.n_rows == self.n_rows:
+            return
+        start_x = dataset.get_data('start_time')
+        new_rows = _rows_by_subject(dataset, rows=np.arange(self.n_rows, dataset.n_rows))
+        for subject, new in new_rows.iteritems():
+            rows = self.rows.get(subject, np.zeros(0, dtype=int))
+            positions = np.searchsorted(start_x[rows], start_x[new], side='right')
+            self.rows[subject] = np.insert(rows, positions, new)
+        self.n_rows = dataset.n_rows
+
+    def overlapping(self, dataset, subject, start, end):
+        '''the sorted rows of a subject from the first that ends at or after start up to the
+        last that starts before end'''
+        rows = self.rows.get(subject)
+        if rows is None:
+            return np.zeros(0, dtype=int)
+        lo = np.searchsorted(np.maximum.accumulate(dataset.get_data('end_time')[rows]), start,
+                             side='left')
+        hi = np.searchsorted(dataset.get_data('start_time')[rows], end, side='left')
+        return rows[lo:max(lo, hi)]
+
+
+def _align_subject(task_start, task_end, eeg_start, eeg_end):
+    '''find the span of eeg rows recorded during each task of a single subject
+
+    Args:
+        task_start, task_end (int[]): task times sorted by start time
+        eeg_start, eeg_end (int[]): eeg times sorted by start time
+
+    Returns:
+        (int[], int[]): for each task, the first and one-past-the-last eeg position
+    '''
+    # each task starts at the first eeg that has not ended before it. Ends are not always
+    # sorted, so search the running maximum of the ends
+    lo = np.searchsorted(np.maximum.accumulate(eeg_end), task_start, side='left')
+    # eeg that start before the end of the task are mapped onto the task
+    hi = np.maximum(lo, np.searchsorted(eeg_start, task_end, side='left'))
+    return lo, hi
+
+
+# columns read by _align_subjects. Worker processes get them as shared memory buffers
+_ALIGN_COLUMNS = {}
+
+
+def _share_columns(columns):
+    '''copy arrays into shared memory so that forked workers can read them without pickling'''
+    shared = {}
+    for name, arr in columns.iteritems():
+        arr = np.ascontiguousarray(arr)
+        buf = multiprocessing.RawArray(ctypes.c_char, max(arr.nbytes, 1))
+        np.frombuffer(buf, dtype=arr.dtype, count=arr.size).reshape(arr.shape)[...] = arr
+        shared[name] = (buf, arr.dtype.str, arr.shape)
+    return shared
+
+
+def _init_align_worker(shared, sigqual_cutoff):
+    for name, (buf, dtype, shape) in shared.iteritems():
+        count = int(np.prod(shape))
+        _ALIGN_COLUMNS[name] = np.frombuffer(buf, dtype=dtype, count=count).reshape(shape)
+    _ALIGN_COLUMNS['sigqual_cutoff'] = sigqual_cutoff
+
+
+def _align_subjects(work_unit):
+    '''align the tasks of some subjects and average the eeg features of each task
+
+    Args:
+        work_unit ((int[], int[])[]): the task rows and eeg rows of each subject, both sorted
+            by start_time
+
+    Returns:
+        (int[], float[][]): the task rows that have eeg and their eeg features
+    '''
+    cols = _ALIGN_COLUMNS
+    n_features = cols['eeg'].shape[1]
+    task_rows, features = [], []
+    for task, eeg in work_unit:
+        lo, hi = _align_subject(cols['task_start'][task], cols['task_end'][task],
+                                cols['eeg_start'][eeg], cols['eeg_end'][eeg])
+        # the sum and count of the good eeg of every span come from running totals
+        good_eeg = cols['eeg_sigqual'][eeg] < cols['sigqual_cutoff']
+        totals = np.zeros((len(eeg) + 1, n_features))
+        np.cumsum(cols['eeg'][eeg] * good_eeg[:, np.newaxis], axis=0, out=totals[1:])
+        counts = np.concatenate([[0], np.cumsum(good_eeg)])
+        n_good = counts[hi] - counts[lo]
+        has_eeg = n_good > 0
+        task_rows.append(task[has_eeg])
+        features.append((totals[hi] - totals[lo])[has_eeg] / n_good[has_eeg, np.newaxis])
+    if not task_rows:
+        return np.zeros(0, dtype=int), np.zeros((0, n_features), dtype=cols['eeg'].dtype)
+    return (np.concatenate(task_rows).astype(int),
+            np.concatenate(features).astype(cols['eeg'].dtype))
+
+
+def _align_tasks(task_data, eeg_data, task_by_subject, eeg_by_subject, sigqual_cutoff,
+                 n_jobs=1):
+    '''map tasks onto eeg and set the averaged eeg features of the tasks that have any
+
+    Tasks without eeg are masked out of task_data.
+    '''
+    columns = {
+        'task_start': task_data.get_data('start_time'),
+        'task_end': task_data.get_data('end_time'),
+        'eeg_start': eeg_data.get_data('start_time'),
+        'eeg_end': eeg_data.get_data('end_time'),
+        'eeg_sigqual': eeg_data.get_data('sigqual'),
+        'eeg': eeg_data.get_data('eeg'),
+    }
+    subjects = [(task, eeg_by_subject[sub]) for sub, task in task_by_subject.iteritems()
+                if sub in eeg_by_subject]
+
+    if n_jobs > 1 and len(subjects) > 1:
+        # subjects are independent so they are split into units of similar row counts
+        sizes = [len(task) + len(eeg) for task, eeg in subjects]
+        work_units = [[subjects[i] for i in unit]
+                      for unit in balanced_work_units(sizes, n_jobs * 4)]
+        pool = multiprocessing.Pool(n_jobs, initializer=_init_align_worker,
+                                    initargs=(_share_columns(columns), sigqual_cutoff))
+        try:
+            results = pool.map(_align_subjects, work_units)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        _ALIGN_COLUMNS.update(columns, sigqual_cutoff=sigqual_cutoff)
         try:
-            for t_i in task:
-                t_start = task_data['start_time'][t_i]
-                t_end = task_data['end_time'][t_i]
-                # throw away eeg before the current task
-                # this works because the tasks are sorted by start_time
-                while e_i < num_sub_eegs and eeg_data['end_time'][eeg[e_i]] < t_start:
-                    e_i += 1
-                    if e_i > num_sub_eegs:
-                        raise StopIteration
-                # map eeg onto the current task
-                e_i2 = e_i
-                task_eeg = []
-                # TODO: refactor this while loop into a itertools.takewhile
-                while e_i2 < num_sub_eegs and eeg_data['start_time'][eeg[e_i2]] < t_end:
-                    if eeg_data['sigqual'][eeg[e_i2]] < sigqual_cutoff:
-                        task_eeg.append(eeg[e_i2])
-                    e_i2 += 1
-                if task_eeg:
-                    task_eeg_mapping[t_i] = task_eeg
-        except StopIteration:
-            pass
-
-    # Step3: compute eeg features for each task based on aligned eeg
-    eeg_mask = [bool(ei) for ei in task_eeg_mapping]
-    task_data.mask(eeg_mask)
-    itask_eeg_mapping = compress(task_eeg_mapping, eeg_mask)
+            results = [_align_subjects(subjects)]
+        finally:
+            _ALIGN_COLUMNS.clear()
+
+    # stitch the results back together in the original row order
+    task_rows = np.concatenate([r for r, _ in results])
+    features = np.concatenate([f for _, f in results])
+    order = np.argsort(task_rows)
+    task_data.mask(idx_to_mask(task_rows, task_data.n_rows))
     task_data.set_column('eeg', Dataset.MATFLOAT)
-    for i, ei in enumerate(itask_eeg_mapping):
-        features = np.mean(eeg_data['eeg'][ei], axis=0)
-        task_data.get_column('eeg')[i] = features
-    # Step4: write data file for use by classifier
+    task_data.get_column('eeg').data = features[order]
+
+
+def align_data(task_data, eeg_data, out_name=None, sigqual_cutoff=200, n_jobs=1):
+    '''map each task onto the eeg recorded during it and average its eeg features
+
+    Args:
+        task_data (Dataset|string): task rows in the format of convert_task_from_xls
+        eeg_data (Dataset|string): eeg rows in the format of convert_eeg_from_xls
+        out_name (string, optional): where to write the aligned data
+        sigqual_cutoff (int): eeg rows with a signal quality at or above this are ignored
+        n_jobs (int): number of processes. Subjects are aligned independently so they are
+            spread over a process pool when this is more than 1
+
+    Returns:
+        Dataset: the task rows that have eeg with an 'eeg' feature column. Nothing is
+            returned if out_name is provided
+    '''
+    # Step1: convert to dictionary with subject names as keys and rows sorted by
+    # start_time as values
+    task_data = _load_dataset(task_data)
+    eeg_data = _load_dataset(eeg_data)
+    task_by_subject = _rows_by_subject(task_data)
+    eeg_by_subject = _rows_by_subject(eeg_data)
+
+    # Step2: efficiently map tasks onto eeg using the structured data and compute eeg
+    # features for each task based on the aligned eeg
+    _align_tasks(task_data, eeg_data, task_by_subject, eeg_by_subject, sigqual_cutoff,
+                 n_jobs=n_jobs)
+
+    # Step3: write data file for use by classifier
     if out_name is not None:
         with gzip.open(out_name, 'w') as f:
             cPickle.dump(task_data.to_pickle(), f)
@@ -112,6 +361,56 @@ def align_data(task_data, eeg_data, out_name=None, sigqual_cutoff=200):
         return task_data
 
 
+def align_new_data(aligned_data, task_data, eeg_data, out_name=None, sigqual_cutoff=200,
+                   n_jobs=1, eeg_index=None):
+    '''align newly arrived task rows and append them to already aligned data
+
+    Only the subjects that appear in task_data are aligned, and only against the eeg rows
+    of those subjects that overlap the time span of their new tasks. These are found by
+    binary search in the per-subject order of eeg_index, so with an index kept across calls
+    the cost grows with the new sessions rather than with the full history.
+
+    Args:
+        aligned_data (Dataset|string): the output of align_data or its location
+        task_data (Dataset|string): the new task rows, in the format of
+            convert_task_from_xls
+        eeg_data (Dataset|string): eeg rows that cover the new tasks. This can be just the
+            new sessions or the whole eeg history
+        out_name (string, optional): where to write the extended aligned data
+        sigqual_cutoff (int): eeg rows with a signal quality at or above this are ignored
+        n_jobs (int): number of processes to align with (see align_data)
+        eeg_index (SubjectIndex, optional): an index of eeg_data from an earlier call. It is
+            updated with any rows appended to eeg_data since. Without it eeg_data is indexed
+            from scratch
+
+    Returns:
+        Dataset: aligned_data with the aligned new rows appended
+    '''
+    aligned_data = _load_dataset(aligned_data)
+    task_data = _load_dataset(task_data)
+    eeg_data = _load_dataset(eeg_data)
+    if eeg_index is None:
+        eeg_index = SubjectIndex(eeg_data)
+    else:
+        eeg_index.update(eeg_data)
+
+    task_by_subject = _rows_by_subject(task_data)
+    eeg_by_subject = {}
+    for sub, task in task_by_subject.iteritems():
+        eeg = eeg_index.overlapping(eeg_data, sub, task_data.get_data('start_time')[task].min(),
+                                    task_data.get_data('end_time')[task].max())
+        if len(eeg):
+            eeg_by_subject[sub] = eeg
+    _align_tasks(task_data, eeg_data, task_by_subject, eeg_by_subject, sigqual_cutoff,
+                 n_jobs=n_jobs)
+    aligned_data.extend(task_data)
+
+    if out_name is not None:
+        with gzip.open(out_name, 'w') as f:
+            cPickle.dump(aligned_data.to_pickle(), f)
+    return aligned_data
+
+
 def cv_split(ds, cv_fold=0, no_new_skills=False, percent=None, **kwargs):
     from learntools.data import cv_split as general_cv_split
     train_idx, valid_idx = general_cv_split(ds,
@@ -131,28 +430,58 @@ def cv_split(ds, cv_fold=0, no_new_skills=False, percent=None, **kwargs):
     return train_idx, valid_idx
 
 
+def _prepared_cache_name(dataset_name, cache_dir, top_n):
+    # the file is fingerprinted by its location, size and modification time so that
+    # regenerated datasets do not hit a stale snapshot
+    stat = os.stat(dataset_name)
+    key = repr((os.path.abspath(dataset_name), stat.st_size, stat.st_mtime, top_n))
+    return os.path.join(cache_dir, 'prepared_{}.npz'.format(hashlib.sha1(key).hexdigest()))
+
+
 @log_me('...loading data')
-def prepare_data(dataset_name, top_eeg_n=0, top_n=0, **kwargs):
-    from learntools.data import Dataset
+def prepare_data(dataset_name, top_eeg_n=0, top_n=0, cache_dir=None, **kwargs):
+    '''load an aligned kt dataset and keep the subjects with the most rows
+
+    Args:
+        dataset_name (string): location of the gzipped Dataset pickle
+        top_n (int): only keep this many of the subjects with the most rows. All subjects are
+            kept if it is 0
+        top_eeg_n (int): deprecated name for top_n
+        cache_dir (string, optional): directory for snapshots of the prepared dataset. If
+            provided, the result is loaded from a snapshot keyed on the dataset file and top_n
+            when one exists and saved to one otherwise
+
+    Returns:
+        Dataset: the prepared dataset sorted by start_time with normalized eeg features
+    '''
+    top_n = top_n or top_eeg_n  # TODO: remove "top_eeg_n" as a config
+    if cache_dir is not None:
+        cache_name = _prepared_cache_name(dataset_name, cache_dir, top_n)
+        if os.path.exists(cache_name):
+            log('loading prepared data from {}'.format(cache_name), True)
+            return Dataset.load_columns(cache_name)
+
     with gzip.open(dataset_name, 'rb') as f:
         ds = Dataset.from_pickle(cPickle.load(f))
     ds.rename_column('stim', 'skill')
     ds.rename_column('cond', 'correct')
-    subjects = np.unique(ds['subject'])
-
-    sorted_i = sorted(range(ds.n_rows), key=lambda i: ds['start_time'][i])
-    ds.reorder(sorted_i)
 
-    def row_count(subj):
-        return sum(np.equal(ds['subject'], subj))
-    top_n = top_n or top_eeg_n  # TODO: remove "top_eeg_n" as a config
+    ds.reorder(np.argsort(ds['start_time'], kind='mergesort'))
 
+    subjects = np.unique(ds['subject'])
     if top_n:
-        subjects = sorted(subjects, key=row_count)[-top_n:]
-    subject_mask = reduce(or_, imap(lambda s: np.equal(ds['subject'], s), subjects))
-    ds.mask(subject_mask)
+        row_counts = np.bincount(ds['subject'])
+        subjects = subjects[np.argsort(row_counts[subjects], kind='mergesort')][-top_n:]
+    ds.mask(np.in1d(ds['subject'], subjects))
     ds.get_column('eeg').data = normalize_table(ds['eeg'])
 
+    if cache_dir is not None:
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        # write to a temporary name first so that concurrent trials never read a partial file
+        temp_name = '{}.{}.tmp'.format(cache_name, os.getpid())
+        ds.save_columns(temp_name)
+        os.rename(temp_name, cache_name)
     return ds
 
 
@@ -163,10 +492,14 @@ if __name__ == "__main__":
                         help='location of the task file')
     parser.add_argument('-e', type=str, dest='eeg', default='raw_data/eeg_data_thinkgear_2013_2014.xls',
                         help='location of the eeg file')
+    parser.add_argument('-x', type=str, dest='extractor', default='fft_bins',
+                        help='name of the eeg feature extractor')
+    parser.add_argument('-j', type=int, dest='n_jobs', default=1,
+                        help='number of processes used to align the data')
     parser.add_argument('outfile', type=str, nargs='*', default='data/data5.gz',
                         help='where to store the output file')
     args = parser.parse_args()
 
     task = convert_task_from_xls(args.task)
-    eeg = convert_eeg_from_xls(args.eeg)
-    align_data(task, eeg, args.outfile)
+    eeg = convert_eeg_from_xls(args.eeg, extractor=args.extractor)
+    align_data(task, eeg, args.outfile, n_jobs=args.n_jobs)
@@ -1,4 +1,4 @@
-from itertools import imap, chain, groupby, islice, ifilter
+from itertools import izip, chain
 
 import theano
 import theano.tensor as T
@@ -6,12 +6,16 @@ import numpy as np
 
 from learntools.libs.utils import idx_to_mask, mask_to_idx
 from learntools.data import gen_word_matrix
-from learntools.libs.logger import log_me
+from learntools.libs.logger import log, log_me
 from learntools.libs.auc import auc
 from learntools.model.mlp import HiddenNetwork, MLP
 from learntools.model.math import rectifier
-from learntools.model.theano_utils import make_shared
-from learntools.model import Model, gen_batches_by_keys, gen_batches_by_size
+from learntools.model.optimizers import get_updates, optimizer_config
+from learntools.model.state import StateCache
+from learntools.model.theano_utils import (make_shared, set_shared, shared_data, get_compiled,
+                                           updated_variables)
+from learntools.model import Model, plan_batches
+from learntools.model.scheduler import describe_schedule, schedule_batches, schedule_stats
 
 from theano import config
 
@@ -36,15 +40,324 @@ def _gen_batches(idxs, subjects, batch_size):
 
     Example:
         >>> _gen_batches(xrange(11), [1] * 6 + [2] * 5, 2)
-        [[2, 3], [4, 5], [8, 9]]
+        [array([2, 3]), array([4, 5]), array([8, 9])]
     '''
-    batches = gen_batches_by_keys(idxs, [subjects])
-    batches = imap(lambda idxs: islice(idxs, 2, None), batches)
-    sub_batches = imap(lambda idxs: gen_batches_by_size(list(idxs), batch_size), batches)
-    batches = chain.from_iterable(sub_batches)
-    batches = ifilter(lambda b: b, batches)
-    batches = list(batches)
-    return batches
+    return plan_batches(idxs, [subjects], batch_size=batch_size, skip=2)
+
+
+def _gen_padded_batches(idxs, subjects, n_lanes, max_cells=0, rng_seed=None):
+    '''divide row indices into padded batches of whole subject sequences for deepkt.
+
+    Each batch is a [time x lanes] matrix where every column holds the rows of one subject
+    in order and is padded at the end with -1. The first row of each subject is removed
+    because the state is only carried from the second row on (see _gen_batches), so the
+    first prediction of each column is for its second row. Subjects of similar lengths are
+    packed together so that columns of a batch need little padding (see schedule_batches).
+
+    Args:
+        idxs (int[]): row indices
+        subjects (int[]): list of subject ids corresponding to each row. Subject ids must
+            be pre-sorted.
+        n_lanes (int): the number of subjects per batch
+        max_cells (int): if set, batches of short subjects get more lanes, up to this many
+            cells
+        rng_seed (int, optional): shuffle subjects of similar lengths with this seed before
+            packing them
+
+    Returns:
+        int[][][]: list of batches
+
+    Example:
+        >>> _gen_padded_batches(xrange(11), [1] * 6 + [2] * 5, 2)
+        [array([[ 1,  7],
+               [ 2,  8],
+               [ 3,  9],
+               [ 4, 10],
+               [ 5, -1]], dtype=int32)]
+    '''
+    sequences = plan_batches(idxs, [subjects], skip=1)
+    return schedule_batches([seq for seq in sequences if len(seq) >= 2], n_lanes,
+                            max_cells=max_cells, rng_seed=rng_seed)
+
+
+def _unpad(loss, preds, idxs, mask):
+    '''keep only the outputs of the unpadded cells of a padded batch'''
+    mask = mask.astype(bool)
+    return loss, preds[mask], idxs[mask]
+
+
+def _row_features(skill_matrix, skills, corrects, eegs, previous_eeg_on, current_eeg_on):
+    '''the static inputs of the combiner and the classifier for every row
+
+    Row i holds the combiner features of row i - 1 (skill vector, whether it was correct and
+    its eeg features) followed by the classifier features of row i (skill vector and eeg
+    features), so that a step only has to gather the rows it predicts. The first row has no
+    previous row and gets zeros.
+
+    Args:
+        skill_matrix (float[][]): skill vector of each skill
+        skills (int[]): skill of each row
+        corrects (int[]): 1 for incorrect and 2 for correct rows
+        eegs (float[][]): eeg features of each row
+        previous_eeg_on (int): whether the combiner features include eeg
+        current_eeg_on (int): whether the classifier features include eeg
+
+    Returns:
+        float32[][]: the feature matrix
+    '''
+    skill_vectors = np.asarray(skill_matrix, dtype='float32')[skills]
+    combiner_features = [skill_vectors, (np.asarray(corrects) == 2)[:, np.newaxis]]
+    classifier_features = [skill_vectors]
+    if previous_eeg_on:
+        combiner_features.append(eegs)
+    if current_eeg_on:
+        classifier_features.append(eegs)
+    combiner_features = np.hstack(combiner_features)
+    features = np.empty((len(skills), combiner_features.shape[1] +
+                         sum(f.shape[1] for f in classifier_features)), dtype='float32')
+    features[0, :combiner_features.shape[1]] = 0
+    features[1:, :combiner_features.shape[1]] = combiner_features[:-1]
+    features[:, combiner_features.shape[1]:] = np.hstack(classifier_features)
+    return features
+
+
+def _build_deepkt(eeg_vector_len, skill_vector_len, combiner_depth, combiner_width,
+                  main_net_depth, main_net_width, previous_eeg_on, current_eeg_on, combiner_on,
+                  train_lanes, valid_lanes, full_bptt, state_checkpoint_every, optimizer,
+                  precompute_features, rng_seed):
+    '''connect up and compile the deepkt graph. See figures/vector_edu_model.png for diagram
+
+    The data and hyperparameters are shared variables so that the compiled functions can be
+    reused by other models with the same architecture (see get_compiled). optimizer holds the
+    sorted items of the optimizer_config.
+
+    Returns:
+        dict: the theano functions, shared variables and symbolic pieces DeepKT needs
+    '''
+    # TODO: make the above mentioned diagram
+    base_indices = T.ivector('idx')
+
+    # data preloaded into network. Values are set by the model
+    skill_matrix = make_shared(np.zeros((0, skill_vector_len)), name='skill_matrix')
+    skill_x = make_shared(np.zeros(0), dtype='int32', name='skill')
+    correct_y = make_shared(np.zeros(0), dtype='uint8', name='correct')
+    eeg_full = make_shared(np.zeros((0, eeg_vector_len)), name='eeg')
+
+    hyperparams = dict((name, make_shared(0., name=name))
+                       for name in ('learning_rate', 'dropout_p', 'L1_reg', 'L2_reg'))
+    learning_rate = hyperparams['learning_rate']
+
+    rng = np.random.RandomState(rng_seed)
+    t_dropout = T.scalar('dropout')
+
+    # setup combiner component
+    combiner_n_in = combiner_width + skill_vector_len + 1
+    if previous_eeg_on:
+        combiner_n_in += eeg_vector_len
+    combiner = HiddenNetwork(
+        rng=rng,
+        n_in=combiner_n_in,
+        size=[combiner_width] * combiner_depth,
+        activation=rectifier,
+        dropout=t_dropout
+    )
+
+    # setup main network component
+    classifier_n_in = skill_vector_len
+    if combiner_on:
+        classifier_n_in += combiner_width
+    if current_eeg_on:
+        classifier_n_in += eeg_vector_len
+    # final softmax classifier
+    classifier = MLP(rng=rng,
+                     n_in=classifier_n_in,
+                     size=[main_net_width] * main_net_depth,
+                     n_out=3,
+                     dropout=t_dropout)
+
+    # need to convert list of indices of 1,2 into [0],[1] columns
+    correct_vectors = make_shared([[0], [1]])
+
+    # STEP 3.1 stuff that goes in scan
+    def combine(previous_state, skills, corrects, eegs):
+        '''fold the observations of the previous rows into the previous state'''
+        correct_feature = correct_vectors[corrects - 1]
+        correct_feature.name = 'correct_feature'
+        combiner_inputs = [previous_state, skill_matrix[skills], correct_feature]
+        if previous_eeg_on:
+            combiner_inputs.append(eegs)
+        t_combiner_inputs = T.concatenate(combiner_inputs, axis=1)
+        t_combiner_inputs.name = 'combiner_inputs'
+        return combiner.instance(t_combiner_inputs)
+
+    def classify(state, skills, eegs):
+        '''probability of y for each 0, 1, 2 given the state before the rows'''
+        classifier_inputs = [skill_matrix[skills]]
+        if combiner_on:
+            classifier_inputs.append(state)
+        if current_eeg_on:
+            classifier_inputs.append(eegs)
+        return classifier.instance(T.concatenate(classifier_inputs, axis=1))
+
+    # the static inputs of each row can be gathered from a precomputed matrix instead (see
+    # _row_features)
+    row_features = make_shared(np.zeros((0, 0)), dtype='float32', name='row_features')
+    n_combiner_features = skill_vector_len + 1 + (eeg_vector_len if previous_eeg_on else 0)
+
+    def step_rows(previous_state, previous_idxs, idxs):
+        '''state after the previous rows and the probabilities of y for the rows'''
+        if not precompute_features:
+            state = combine(previous_state, skill_x[previous_idxs], correct_y[previous_idxs],
+                            eeg_full[previous_idxs])
+            return state, classify(state, skill_x[idxs], eeg_full[idxs])
+        features = T.cast(row_features[idxs], theano.config.floatX)
+        state = combiner.instance(T.concatenate(
+            [previous_state, features[:, :n_combiner_features]], axis=1))
+        classifier_inputs = [features[:, n_combiner_features:
+                                      (n_combiner_features + skill_vector_len)]]
+        if combiner_on:
+            classifier_inputs.append(state)
+        if current_eeg_on:
+            classifier_inputs.append(features[:, (n_combiner_features + skill_vector_len):])
+        return state, classifier.instance(T.concatenate(classifier_inputs, axis=1))
+
+    def row_outputs(previous_states):
+        '''combiner output, loss and outputs of batches of rows given the previous states'''
+        combiner_out, pY = step_rows(previous_states, base_indices - 1, base_indices)
+        y = correct_y[base_indices]
+        loss = -T.mean(T.log(pY)[T.arange(y.shape[0]), y])
+        return combiner_out, loss, [loss, pY[:, -2] - pY[:, -1], base_indices, pY,
+                                    eeg_full[base_indices - 1]]
+
+    # padded batches of whole sequences carry the state through a scan over time
+    seq = T.imatrix('seq')
+    seq_idxs = T.maximum(seq, 0)  # padding reads row 0 but is masked out
+
+    def seq_step(previous_idxs, idxs, previous_state):
+        if not full_bptt:
+            previous_state = theano.gradient.disconnected_grad(previous_state)
+        return step_rows(previous_state, previous_idxs, idxs)
+    ((seq_states, seq_pY), seq_updates) = theano.scan(
+        fn=seq_step,
+        sequences=[seq_idxs[:-1], seq_idxs[1:]],
+        outputs_info=[T.zeros((seq.shape[1], combiner_width), dtype=theano.config.floatX),
+                      None])
+    seq_pY = seq_pY.reshape((-1, seq_pY.shape[2]))
+    seq_mask = T.cast(T.ge(seq[1:], 0).flatten(), theano.config.floatX)
+    seq_flat_idxs = seq[1:].flatten()
+    # sparse record of the states after some of the rows for diagnostics
+    seq_checkpoints = []
+    if state_checkpoint_every:
+        seq_checkpoints = [seq_states[::state_checkpoint_every],
+                           seq[:-1][::state_checkpoint_every]]
+
+    # ########
+    # STEP3: create the theano functions to run the model
+
+    seq_y = correct_y[seq_idxs[1:].flatten()]
+    seq_loss = -(T.sum(T.log(seq_pY)[T.arange(seq_y.shape[0]), seq_y] * seq_mask) /
+                 T.sum(seq_mask))
+    # used to help compute regularization terms
+    subnets = [classifier]
+    if combiner_on:
+        subnets.append(combiner)
+    regularization = (
+        hyperparams['L1_reg'] * sum([n.L1 for n in subnets])
+        + hyperparams['L2_reg'] * sum([n.L2_sqr for n in subnets])
+    )
+    seq_cost = seq_loss + regularization
+
+    # the same for both validation and training
+    func_args = {
+        'inputs': [base_indices],
+        'on_unused_input': 'ignore',
+        'allow_input_downcast': True,
+    }
+    seq_func_args = {
+        'inputs': [seq],
+        'outputs': [seq_loss, seq_pY[:, -2] - seq_pY[:, -1], seq_flat_idxs,
+                    seq_mask] + seq_checkpoints,
+        'on_unused_input': 'ignore',
+        'allow_input_downcast': True,
+    }
+
+    graph = {
+        'skill_matrix': skill_matrix,
+        'skill': skill_x,
+        'correct': correct_y,
+        'row_features': row_features,
+        'eeg': eeg_full,
+        'hyperparams': hyperparams,
+        'live_state': None,
+        'skill_accumulator': None,
+        'saved_variables': classifier.params + combiner.params + [skill_matrix],
+    }
+
+    # collect all theano updates
+    params = list(chain.from_iterable(n.params for n in subnets))
+    optimizer = dict(optimizer)
+    if valid_lanes:
+        # validation of whole sequences without dropout
+        graph['valid'] = theano.function(
+            updates=seq_updates,
+            givens={t_dropout: 0.},
+            **seq_func_args)
+    else:
+        # validation of one row at a time only needs the state of the previous row
+        live_state = make_shared(np.zeros((1, combiner_width)), name='live_state')
+        combiner_out, _, outputs = row_outputs(live_state)
+        graph['valid'] = theano.function(
+            outputs=outputs,
+            updates=[(live_state, combiner_out)] if combiner_on else [],
+            givens={t_dropout: 0.},
+            **func_args)
+        graph['live_state'] = live_state
+    if train_lanes:
+        # training on whole sequences with dropout. The state lives inside the scan
+        update_parameters = get_updates(seq_cost, params, learning_rate, **optimizer)
+        graph['train'] = theano.function(
+            updates=update_parameters + seq_updates.items(),
+            givens={t_dropout: hyperparams['dropout_p']},
+            **seq_func_args)
+    else:
+        # the rows of a batch read the states their previous rows had in the last epoch so
+        # row batches need to store a state for every row
+        skill_accumulator = make_shared(np.zeros((0, combiner_width)),
+                                        name='skill_accumulator')
+        combiner_out, loss, outputs = row_outputs(skill_accumulator[base_indices - 2])
+        # training uses parameter updates plus previous skill propagation with dropout
+        update_parameters = get_updates(loss + regularization, params, learning_rate,
+                                        **optimizer)
+        if combiner_on:
+            update_parameters.append((
+                skill_accumulator,
+                T.set_subtensor(skill_accumulator[base_indices - 1], combiner_out)
+            ))
+        graph['train'] = theano.function(
+            outputs=outputs,
+            updates=update_parameters,
+            givens={t_dropout: hyperparams['dropout_p']},
+            **func_args)
+        graph['skill_accumulator'] = skill_accumulator
+    # the states are reset by the model for its own data
+    graph['transient'] = [v for v in (graph['live_state'], graph['skill_accumulator'])
+                          if v is not None]
+
+    # single steps of a student for serving. They are compiled on first use
+    t_state = T.vector('state')
+    t_skill = T.iscalar('skill')
+    t_correct = T.iscalar('correct')
+    t_eeg = T.vector('eeg')
+    graph['step_args'] = {
+        'observe': ([t_state, t_skill, t_correct, t_eeg],
+                    combine(t_state[None, :], t_skill[None], t_correct[None],
+                            t_eeg[None, :])[0]),
+        'predict': ([t_state, t_skill, t_eeg],
+                    classify(t_state[None, :], t_skill[None], t_eeg[None, :])[0]),
+    }
+    graph['step_givens'] = {t_dropout: 0.}
+    graph['step_functions'] = {}
+    return graph
 
 
 class DeepKT(Model):
@@ -52,19 +365,60 @@ class DeepKT(Model):
     Attributes:
         train_batches (int[][]): training batches are divided by subject_id and the rows of each subject
             are further divided by batch_size. The first 2 rows of each subject are removed by
-            necessity due to the recursive structure of the model
-        valid_batches (int[][]): validation batches. See train_batches
+            necessity due to the recursive structure of the model. If train_lanes is set, each
+            batch is instead a padded [time x lanes] matrix of whole subject sequences (see
+            _gen_padded_batches)
+        valid_batches (int[][]): validation batches. See train_batches. Without valid_lanes,
+            rows are validated one at a time
+        states (StateCache): the latest combiner state of each student seen by observe
+        state_checkpoints (dict): combiner state after a row keyed by row index. Only filled
+            if state_checkpoint_every is set
     '''
     @log_me('...building deepkt')
     def __init__(self, prepared_data, L1_reg=0., L2_reg=0., dropout_p=0., learning_rate=0.02,
                  skill_vector_len=100, combiner_depth=1, combiner_width=200,
                  main_net_depth=1, main_net_width=500, previous_eeg_on=1,
                  current_eeg_on=1, combiner_on=1, mutable_skill=1, valid_percentage=0.8,
-                 batch_size=30, **kwargs):
+                 batch_size=30, train_lanes=0, full_bptt=0, valid_lanes=0,
+                 state_cache_size=100000, state_checkpoint_every=0, precompute_features=0,
+                 lane_cells=0, rng_seed=1234, **kwargs):
         '''
         Args:
             prepared_data (tuple(Dataset, int[], int[])): a tuple that holds the data to be used,
                 the row indices of the training set, and the row indices of the validation set
+            batch_size (int): the number of rows of one subject trained on per call when
+                train_lanes is not set. These row batches read the combiner state that the
+                previous rows had in the last epoch, so they keep an N x combiner_width state
+                for all N rows of the data
+            train_lanes (int): if set, train on padded batches of this many subjects at a time.
+                The combiner state is carried through a scan over time so each call advances
+                all of the subjects' sequences together rather than batch_size rows of one
+                subject. The state memory is then bounded by the number of lanes instead of
+                the number of rows. It is off by default because it changes how training
+                sees the state
+            full_bptt (int): if set, propagate the gradient back through the combiner state
+                over the whole sequence when training on padded batches. Otherwise the previous
+                state is treated as a constant as it is with row batches
+            valid_lanes (int): if set, validate on padded batches of this many subjects at a
+                time. The predictions are the same as validating one row at a time
+            lane_cells (int): if set, padded batches of subjects with few rows get more lanes,
+                up to this many time x lane cells, so they take fewer calls
+            rng_seed (int): seeds the parameters and the shuffling of training subjects of
+                similar lengths before they are packed into padded batches
+            state_cache_size (int): the number of students whose states are kept for
+                observe and predict_next
+            state_checkpoint_every (int): if set, padded batches record the combiner state
+                after every state_checkpoint_every-th row of each subject in
+                state_checkpoints
+            precompute_features (int): if set, the skill vectors, correct feature and eeg
+                features of every row and its previous row are gathered from one float32
+                matrix built up front instead of being looked up and concatenated on every
+                call (see _row_features)
+            **kwargs: may hold the optimizer settings (see optimizer_config)
+
+        Models with the same architecture reuse the functions compiled for the first one
+        (see get_compiled). Each keeps its own values and binds them to the shared graph
+        whenever it is used, so several of them can be used side by side.
         '''
         # ##########
         # STEP1: order the data properly so that we can read from it sequentially
@@ -83,126 +437,81 @@ class DeepKT(Model):
         valid_mask = valid_mask[sorted_i]
         train_idx = mask_to_idx(train_mask)
         valid_idx = mask_to_idx(valid_mask)
-        base_indices = T.ivector('idx')
-
-        skill_x = ds.get_data('skill')
         subject_x = ds.get_data('subject')
-        correct_y = ds.get_data('correct')
-        eeg_full = ds.get_data('eeg')
 
         # ###########
-        # STEP2: connect up the model. See figures/vector_edu_model.png for diagram
-        # TODO: make the above mentioned diagram
+        # STEP2: get the compiled model for this architecture and load the data into it
 
-        # make a skill matrix containing skill vectors for each skill
-        skill_matrix = make_shared(gen_word_matrix(ds.get_data('skill'),
-                                                   ds['skill'].enum_pairs,
-                                                   vector_length=skill_vector_len))
+        self.config = {
+            'skill_vector_len': skill_vector_len,
+            'combiner_depth': combiner_depth,
+            'combiner_width': combiner_width,
+            'main_net_depth': main_net_depth,
+            'main_net_width': main_net_width,
+            'previous_eeg_on': previous_eeg_on,
+            'current_eeg_on': current_eeg_on,
+            'combiner_on': combiner_on,
+        }
+        architecture = dict(self.config,
+                            eeg_vector_len=eeg_vector_len,
+                            train_lanes=int(train_lanes > 0),
+                            valid_lanes=int(valid_lanes > 0),
+                            full_bptt=full_bptt,
+                            state_checkpoint_every=state_checkpoint_every,
+                            optimizer=tuple(sorted(optimizer_config(**kwargs).iteritems())),
+                            precompute_features=precompute_features,
+                            rng_seed=rng_seed)
+        graph = get_compiled(('DeepKT', tuple(sorted(architecture.iteritems()))),
+                             lambda: _build_deepkt(**architecture), owner=self)
+        self._compiled_graph = graph
 
-				# data preloaded into network
-        skill_x = make_shared(skill_x, to_int=True, name='skill')
-        correct_y = make_shared(correct_y, to_int=True, name='correct')
-        eeg_full = make_shared(eeg_full, name='eeg')
+        # make a skill matrix containing skill vectors for each skill
+        skill_matrix = gen_word_matrix(ds.get_data('skill'), ds['skill'].enum_pairs,
+                                       vector_length=skill_vector_len)
+        set_shared(graph['skill_matrix'], skill_matrix)
+        if precompute_features:
+            set_shared(graph['row_features'],
+                       _row_features(skill_matrix, ds.get_data('skill'), ds.get_data('correct'),
+                                     ds.get_data('eeg'), previous_eeg_on, current_eeg_on))
+        set_shared(graph['skill'], ds.get_data('skill'))
+        set_shared(graph['correct'], ds.get_data('correct'))
+        set_shared(graph['eeg'], ds.get_data('eeg'))
+        hyperparams = {'learning_rate': learning_rate, 'dropout_p': dropout_p,
+                       'L1_reg': L1_reg, 'L2_reg': L2_reg}
+        for name, value in hyperparams.iteritems():
+            set_shared(graph['hyperparams'][name], value)
 
-        rng = np.random.RandomState(1234)
-        t_dropout = T.scalar('dropout')
-        skill_accumulator = make_shared(np.zeros((N, combiner_width)), name='skill_accumulator')
+        self._tf_train = graph['train']
+        self._tf_valid = graph['valid']
+        if train_lanes:
+            self.train_batches = _gen_padded_batches(train_idx, subject_x, train_lanes,
+                                                     max_cells=lane_cells, rng_seed=rng_seed)
+            log('train batches: ' + describe_schedule(schedule_stats(self.train_batches)), True)
+        else:
+            set_shared(graph['skill_accumulator'], np.zeros((N, combiner_width)))
+            self.train_batches = _gen_batches(train_idx, subject_x, batch_size)
+        if valid_lanes:
+            self.valid_batches = _gen_padded_batches(valid_idx, subject_x, valid_lanes,
+                                                     max_cells=lane_cells)
+        else:
+            self.valid_batches = _gen_batches(valid_idx, subject_x, 1)
+            self._live_state = graph['live_state']
+            self._live_row = None
+        self.train_lanes = train_lanes
+        self.valid_lanes = valid_lanes
+        self.saved_variables = graph['saved_variables']
+        self.state_variables = updated_variables([graph['train']],
+                                                 exclude=graph['saved_variables'])
+        self.state_checkpoint_every = state_checkpoint_every
+        self.state_checkpoints = {}
+        self._correct_y = graph['correct']
 
-        # setup combiner component
-        combiner_n_in = combiner_width + skill_vector_len + 1
-        if previous_eeg_on:
-            combiner_n_in += eeg_vector_len
-        combiner = HiddenNetwork(
-            rng=rng,
-            n_in=combiner_n_in,
-            size=[combiner_width] * combiner_depth,
-            activation=rectifier,
-            dropout=t_dropout
-        )
-
-        # setup main network component
-        classifier_n_in = skill_vector_len
-        if combiner_on:
-            classifier_n_in += combiner_width
-        if current_eeg_on:
-            classifier_n_in += eeg_vector_len
-        # final softmax classifier
-        classifier = MLP(rng=rng,
-                         n_in=classifier_n_in,
-                         size=[main_net_width] * main_net_depth,
-                         n_out=3,
-                         dropout=t_dropout)
-
-        # STEP 3.1 stuff that goes in scan
-        current_skill = skill_matrix[skill_x[base_indices]]
-        previous_skill = skill_matrix[skill_x[base_indices - 1]]
-        previous_eeg_vector = eeg_full[base_indices - 1]
-        current_eeg_vector = eeg_full[base_indices]
-
-        # need to convert list of indices of 1,2 into [0],[1] columns
-        correct_vectors = make_shared([[0], [1]])
-        correct_feature = correct_vectors[correct_y[base_indices - 1] - 1]
-        correct_feature.name = 'correct_feature'
-        combiner_inputs = [skill_accumulator[base_indices - 2], previous_skill, correct_feature]
-        if previous_eeg_on:
-            combiner_inputs.append(previous_eeg_vector)
-        t_combiner_inputs = T.concatenate(combiner_inputs, axis=1)
-        t_combiner_inputs.name = 'combiner_inputs'
-        combiner_out = combiner.instance(t_combiner_inputs)
-        classifier_inputs = [current_skill]
-        if combiner_on:
-            classifier_inputs.append(combiner_out)
-        if current_eeg_on:
-            classifier_inputs.append(current_eeg_vector)
-        # probability of y for each 0, 1, 2
-        pY = classifier.instance(T.concatenate(classifier_inputs, axis=1))
-        # ########
-        # STEP3: create the theano functions to run the model
-
-        y = correct_y[base_indices]
-        loss = -T.mean(T.log(pY)[T.arange(y.shape[0]), y])
-        # used to help compute regularization terms
-        subnets = [classifier]
-        if combiner_on:
-            subnets.append(combiner)
-        cost = (
-            loss
-            + L1_reg * sum([n.L1 for n in subnets])
-            + L2_reg * sum([n.L2_sqr for n in subnets])
-        )
-
-        # the same for both validation and training
-        func_args = {
-            'inputs': [base_indices],
-            'outputs': [loss, pY[:, -2] - pY[:, -1], base_indices, pY, previous_eeg_vector],
-            'on_unused_input': 'ignore',
-            'allow_input_downcast': True,
-        }
-
-        # collect all theano updates
-        params = chain.from_iterable(n.params for n in subnets)
-        update_parameters = [(param, param - learning_rate * T.grad(cost, param))
-                             for param in params]
-        # propagation of previous skill to next is computed as an update
-        basic_updates = []
-        if combiner_on:
-            basic_updates += [(
-                skill_accumulator,
-                T.set_subtensor(skill_accumulator[base_indices - 1], combiner_out)
-            )]
-        # validation uses no dropout and previous skill propagation
-        self._tf_valid = theano.function(
-            updates=basic_updates,
-            givens={t_dropout: 0.},
-            **func_args)
-        # training uses parameter updates plus previous skill propagation with dropout
-        self._tf_train = theano.function(
-            updates=update_parameters + basic_updates,
-            givens={t_dropout: dropout_p},
-            **func_args)
-        self.train_batches = _gen_batches(train_idx, subject_x, batch_size)
-        self.valid_batches = _gen_batches(valid_idx, subject_x, 1)
-        self._correct_y = correct_y
+        self._step_args = graph['step_args']
+        self._step_givens = graph['step_givens']
+        self._step_functions = graph['step_functions']
+        self._skill_ids = dict(ds['skill'].enum_pairs)
+        self._eeg_vector_len = eeg_vector_len
+        self.states = StateCache(np.zeros(combiner_width), max_entries=state_cache_size)
 
     def evaluate(self, idxs, pred):
         '''scores the predictions of a given set of rows
@@ -212,9 +521,8 @@ class DeepKT(Model):
         Returns:
             float: an evaluation score (the higher the better)
         '''
-        # _correct_y is int-casted, go to owner op (int-cast) to get shared variable
-        # as first input and get its value without copying the value out
-        _y = self._correct_y.owner.inputs[0].get_value(borrow=True)[idxs]
+        self.bind()
+        _y = shared_data(self._correct_y)[idxs]
         return auc(_y[:len(pred)], pred, pos_label=1)
 
     def train(self, idxs, **kwargs):
@@ -225,6 +533,9 @@ class DeepKT(Model):
             (float, float[], int[]): a tuple of the loss, the predictions over the rows,
                 and the row indices
         '''
+        self.bind()
+        if self.train_lanes:
+            return self._run_padded(self._tf_train, idxs)
         res = self._tf_train(idxs)
         return res[:3]
 
@@ -236,5 +547,79 @@ class DeepKT(Model):
             (float, float[], int[]): a tuple of the loss, the predictions over the rows,
                 and the row indices
         '''
+        self.bind()
+        if self.valid_lanes:
+            return self._run_padded(self._tf_valid, idxs)
+        # the first row of a subject starts from an empty state
+        if self._live_row is None or idxs[0] - 1 != self._live_row:
+            self._live_state.set_value(np.zeros_like(self._live_state.get_value()))
+        self._live_row = idxs[-1]
         res = self._tf_valid(idxs)
         return res[:3]
+
+    def _run_padded(self, f, idxs):
+        res = f(idxs)
+        if self.state_checkpoint_every:
+            states, rows = res[4:]
+            for step_states, step_rows in izip(states, rows):
+                for state, row in izip(step_states, step_rows):
+                    if row >= 0:
+                        self.state_checkpoints[row] = state.astype('float32')
+        return _unpad(*res[:4])
+
+    def _step_function(self, name):
+        if name not in self._step_functions:
+            inputs, output = self._step_args[name]
+            self._step_functions[name] = theano.function(
+                inputs=inputs,
+                outputs=output,
+                givens=self._step_givens,
+                on_unused_input='ignore',
+                allow_input_downcast=True)
+        return self._step_functions[name]
+
+    def _skill_id(self, skill):
+        try:
+            return self._skill_ids[skill]
+        except KeyError:
+            raise Exception("skill '{}' was not in the training data".format(skill))
+
+    def _eeg_vector(self, eeg):
+        if eeg is None:
+            return np.zeros(self._eeg_vector_len)
+        return eeg
+
+    def observe(self, student_id, skill, correct, eeg=None):
+        '''fold a new response of a student into their cached state
+
+        Students without a cached state start from the same empty state as the beginning of
+        a training sequence.
+
+        Args:
+            student_id: a hashable id of the student
+            skill (string): the skill of the response as it appears in the training data
+            correct (bool): whether the response was correct
+            eeg (float[]): eeg features of the response. Zeros are used if missing
+        '''
+        self.bind()
+        state = self._step_function('observe')(
+            self.states.get(student_id), self._skill_id(skill), 2 if correct else 1,
+            self._eeg_vector(eeg))
+        self.states.set(student_id, state)
+
+    def predict_next(self, student_id, skill, eeg=None):
+        '''probability that a student answers a skill correctly given their cached state
+
+        Args:
+            student_id: a hashable id of the student
+            skill (string): the skill of the next response
+            eeg (float[]): eeg features of the next response. Zeros are used if missing
+
+        Returns:
+            float: the probability of a correct response
+        '''
+        self.bind()
+        pY = self._step_function('predict')(
+            self.states.get(student_id), self._skill_id(skill), self._eeg_vector(eeg))
+        # label 0 is never used so renormalize over incorrect (1) and correct (2)
+        return float(pY[2] / (pY[1] + pY[2]))
@@ -0,0 +1,145 @@
+import os
+
+import numpy as np
+
+from learntools.kt.bkt import BKTParams, forward, sequence_positions
+
+
+class KnowledgeStateStore(object):
+    '''the latest knowledge of every (student, skill) pair under a fitted BKT model
+
+    Each pair gets an integer slot into a float32 array that holds the probability that the
+    skill is known before the student's next answer, so predictions and updates only touch
+    one slot instead of replaying the student's history.
+
+    Args:
+        params (BKTParams): the per-skill parameters, e.g. from bkt.fit_em
+        capacity (int): the number of slots allocated up front. The table doubles in size
+            when it runs out
+    '''
+    def __init__(self, params, capacity=1024):
+        self.params = BKTParams(*(np.array(p, dtype=float) for p in params))
+        self._slots = {}
+        self._known = np.empty(max(capacity, 1), dtype='float32')
+
+    def __len__(self):
+        return len(self._slots)
+
+    def __contains__(self, key):
+        return key in self._slots
+
+    def _slot(self, student, skill):
+        '''the slot of a pair, which is created with the knowledge L0 of the skill if needed'''
+        key = (student, skill)
+        try:
+            return self._slots[key]
+        except KeyError:
+            slot = len(self._slots)
+            if slot == len(self._known):
+                self._known = np.resize(self._known, 2 * len(self._known))
+            self._known[slot] = self.params.L0[skill]
+            self._slots[key] = slot
+            return slot
+
+    def p_known(self, student, skill):
+        '''the probability that the student knows the skill before their next answer'''
+        slot = self._slots.get((student, skill))
+        return self.params.L0[skill] if slot is None else float(self._known[slot])
+
+    def predict(self, student, skill):
+        '''the probability that the next answer of the student on the skill is correct'''
+        known = self.p_known(student, skill)
+        return known * (1 - self.params.S[skill]) + (1 - known) * self.params.G[skill]
+
+    def update(self, student, skill, correct):
+        '''record an answer
+
+        Returns:
+            float: the prediction for the answer before it was recorded
+        '''
+        slot = self._slot(student, skill)
+        known = float(self._known[slot])
+        G, S = self.params.G[skill], self.params.S[skill]
+        p_correct = known * (1 - S) + (1 - known) * G
+        if correct:
+            posterior = known * (1 - S) / p_correct
+        else:
+            posterior = known * S / (1 - p_correct)
+        self._known[slot] = posterior + (1 - posterior) * self.params.T[skill]
+        return p_correct
+
+    def predict_batch(self, students, skills):
+        '''predict() for many pairs at once'''
+        skills = np.asarray(skills)
+        slots = np.array([self._slots.get(key, -1) for key in zip(students, skills)], dtype=int)
+        known = np.where(slots >= 0, self._known[np.maximum(slots, 0)], self.params.L0[skills])
+        return known * (1 - self.params.S[skills]) + (1 - known) * self.params.G[skills]
+
+    def update_batch(self, students, skills, corrects):
+        '''record many answers at once
+
+        The answers of each pair are applied in the order they are given, exactly as a series
+        of update() calls would. This is also how a store is initialized from the history of
+        the students (see from_history).
+
+        Args:
+            students (hashable[]): the student of each answer
+            skills (int[]): the skill of each answer
+            corrects (bool[]): whether each answer was correct
+
+        Returns:
+            float[]: the prediction for each answer before it was recorded
+        '''
+        skills = np.asarray(skills)
+        corrects = np.asarray(corrects, dtype=bool)
+        slots = np.array([self._slot(student, skill)
+                          for student, skill in zip(students, skills)], dtype=int)
+        if len(slots) == 0:
+            return np.zeros(0)
+        # each slot is a sequence that starts from its stored knowledge
+        order = np.argsort(slots, kind='mergesort')
+        sorted_slots = slots[order]
+        positions = sequence_positions(sorted_slots, sorted_slots)
+        p_correct, p_known = forward(skills[order], corrects[order], positions, self.params,
+                                     initial=self._known[sorted_slots])
+        is_last = np.ones(len(slots), dtype=bool)
+        is_last[:-1] = sorted_slots[1:] != sorted_slots[:-1]
+        self._known[sorted_slots[is_last]] = p_known[is_last]
+
+        predictions = np.empty(len(slots))
+        predictions[order] = p_correct
+        return predictions
+
+    @classmethod
+    def from_history(cls, params, students, skills, corrects):
+        '''a store with the knowledge after replaying the answers of the students'''
+        store = cls(params, capacity=len(skills))
+        store.update_batch(students, skills, corrects)
+        return store
+
+    def save(self, fname):
+        '''write the parameters and the knowledge of every pair to an npz file
+
+        Students must be all numbers or all strings. Like Model.save, the file is written
+        next to its destination and then moved into place.
+        '''
+        keys = sorted(self._slots.iteritems(), key=lambda (key, slot): slot)
+        tmp_name = '{}.tmp'.format(fname)
+        with open(tmp_name, 'wb') as f:
+            np.savez(f,
+                     students=np.array([student for (student, _), _ in keys]),
+                     skills=np.array([skill for (_, skill), _ in keys], dtype=int),
+                     known=self._known[:len(keys)],
+                     **self.params._asdict())
+        os.rename(tmp_name, fname)
+
+    @classmethod
+    def load(cls, fname):
+        '''a store with the parameters and knowledge written by save()'''
+        npz = np.load(fname)
+        store = cls(BKTParams(*(npz[name] for name in BKTParams._fields)),
+                    capacity=len(npz['known']))
+        for slot, key in enumerate(zip(npz['students'].tolist(), npz['skills'].tolist())):
+            store._slots[key] = slot
+        store._known[:len(store._slots)] = npz['known']
+        return store
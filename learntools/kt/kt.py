@@ -1,5 +1,3 @@
-from itertools import groupby
-
 import numpy as np
 import theano
 import theano.tensor as T
@@ -8,11 +6,19 @@ from learntools.libs.logger import log_me
 from learntools.libs.utils import idx_to_mask
 from learntools.libs.auc import auc
 from learntools.model.math import neg_log_loss
-from learntools.model.theano_utils import make_shared, make_probability
+from learntools.model.optimizers import get_updates, optimizer_config
+from learntools.model import plan_batches
+from learntools.model.theano_utils import make_shared, make_probability, shared_data
 
 
 @log_me('... building the model')
-def build_model(prepared_data, clamp_L0=0.4, **kwargs):
+def build_model(prepared_data, clamp_L0=0.4, init_params=None, **kwargs):
+    '''
+    Args:
+        init_params (learntools.kt.bkt.BKTParams, optional): per-skill starting parameters,
+            e.g. from bkt.fit_em. They replace the default starting point, including
+            the value of clamp_L0
+    '''
     # ##########
     # STEP1: order the data properly so that we can read from it sequentially
     # when training the model
@@ -45,10 +51,13 @@ def build_model(prepared_data, clamp_L0=0.4, **kwargs):
     else:
         p_L0 = clamp_L0
     parameter_base = np.ones(n_skills)
-    tp_L0, t_L0 = make_probability(parameter_base * p_L0, name='L0')
-    tp_T, t_T = make_probability(parameter_base * p_T, name='p(T)')
-    tp_G, t_G = make_probability(parameter_base * p_G, name='p(G)')
-    tp_S, t_S = make_probability(parameter_base * p_S, name='p(S)')
+    if init_params is None:
+        init_params = [parameter_base * p for p in (p_L0, p_T, p_G, p_S)]
+    init_L0, init_T, init_G, init_S = init_params
+    tp_L0, t_L0 = make_probability(init_L0, name='L0')
+    tp_T, t_T = make_probability(init_T, name='p(T)')
+    tp_G, t_G = make_probability(init_G, name='p(G)')
+    tp_S, t_S = make_probability(init_S, name='p(S)')
 
     # declare and prepare variables for theano
     i = T.ivector('i')
@@ -78,8 +87,7 @@ def build_model(prepared_data, clamp_L0=0.4, **kwargs):
         params = [t_T, t_L0]
     else:
         params = [t_T]
-    update_parameters = [(param, param - learning_rate * T.grad(loss, param))
-                         for param in params]
+    update_parameters = get_updates(loss, params, learning_rate, **optimizer_config(**kwargs))
 
     tf_train = theano.function(inputs=[i, skill_i, learning_rate],
                                updates=update_parameters,
@@ -96,16 +104,15 @@ def build_model(prepared_data, clamp_L0=0.4, **kwargs):
         return tf_valid(i, skill_i)
 
     def gen_batches(idxs, keys):
-        all_keys = zip(*keys)
-        return [(list(idx), k) for k, idx in
-                groupby(idxs, key=lambda i: all_keys[i])]
+        return [(idx, tuple(key[idx[0]] for key in keys))
+                for idx in plan_batches(idxs, keys)]
 
     def train_eval(idxs, pred):
-        _y = correct_y.owner.inputs[0].get_value(borrow=True)[idxs]
+        _y = shared_data(correct_y)[idxs]
         return auc(_y, pred, pos_label=1)
 
     def valid_eval(idxs, pred):
-        _y = correct_y.owner.inputs[0].get_value(borrow=True)[idxs]
+        _y = shared_data(correct_y)[idxs]
         return auc(_y, pred, pos_label=1)
 
     train_batches = gen_batches(train_idx, [subject_x, skill_x])
@@ -1,5 +1,3 @@
-from itertools import groupby
-
 import numpy as np
 import theano
 import theano.tensor as T
@@ -8,7 +6,9 @@ from learntools.libs.logger import log_me
 from learntools.libs.utils import idx_to_mask
 from learntools.libs.auc import auc
 from learntools.model.math import neg_log_loss
-from learntools.model.theano_utils import make_shared, make_probability
+from learntools.model.optimizers import get_updates, optimizer_config
+from learntools.model import plan_batches
+from learntools.model.theano_utils import make_shared, make_probability, shared_data
 
 
 @log_me('... building the model')
@@ -89,8 +89,7 @@ def build_model(prepared_data, clamp_L0=0.4, eeg_column_i=None, **kwargs):
         params = [t_T, t_L0]
     else:
         params = [t_T]
-    update_parameters = [(param, param - learning_rate * T.grad(loss, param))
-                         for param in params]
+    update_parameters = get_updates(loss, params, learning_rate, **optimizer_config(**kwargs))
 
     tf_train = theano.function(inputs=[i, skill_i, learning_rate],
                                updates=update_parameters,
@@ -107,16 +106,15 @@ def build_model(prepared_data, clamp_L0=0.4, eeg_column_i=None, **kwargs):
         return tf_valid(i, skill_i)
 
     def gen_batches(idxs, keys):
-        all_keys = zip(*keys)
-        return [(list(idx), k) for k, idx in
-                groupby(idxs, key=lambda i: all_keys[i])]
+        return [(idx, tuple(key[idx[0]] for key in keys))
+                for idx in plan_batches(idxs, keys)]
 
     def train_eval(idxs, pred):
-        _y = correct_y.owner.inputs[0].get_value(borrow=True)[idxs]
+        _y = shared_data(correct_y)[idxs]
         return auc(_y, pred, pos_label=1)
 
     def valid_eval(idxs, pred):
-        _y = correct_y.owner.inputs[0].get_value(borrow=True)[idxs]
+        _y = shared_data(correct_y)[idxs]
         return auc(_y, pred, pos_label=1)
 
     train_batches = gen_batches(train_idx, [subject_x, skill_x])
@@ -1,125 +1,193 @@
-from itertools import groupby
-
 import numpy as np
 import theano
 import theano.tensor as T
 
-from learntools.libs.logger import log_me
-from learntools.libs.utils import idx_to_mask
-from learntools.libs.data import gen_word_matrix
+from learntools.libs.logger import log, log_me
+from learntools.libs.utils import idx_to_mask, mask_to_idx
 from learntools.libs.auc import auc
-from learntools.model.math import neg_log_loss, sigmoid
-from learntools.model.theano_utils import make_shared, make_probability
-
-
-@log_me('... building the model')
-def build_model(prepared_data, clamp_L0=None, **kwargs):
-    # ##########
-    # STEP1: order the data properly so that we can read from it sequentially
-    # when training the model
-
-    subject_x, skill_x, correct_y, start_x, eeg_x, eeg_table, stim_pairs, train_idx, valid_idx = prepared_data
-    N = len(correct_y)
-    train_mask = idx_to_mask(train_idx, N)
-    valid_mask = idx_to_mask(valid_idx, N)
-
-    # sort data by subject and skill
-    sorted_i = sorted(xrange(N), key=lambda i: (subject_x[i], skill_x[i], start_x[i]))
-    skill_x = skill_x[sorted_i]
-    subject_x = subject_x[sorted_i]
-    correct_y = correct_y[sorted_i]
-    start_x = start_x[sorted_i]
-    train_mask = train_mask[sorted_i]
-    valid_mask = valid_mask[sorted_i]
-    train_idx = np.nonzero(train_mask)[0]
-    valid_idx = np.nonzero(valid_mask)[0]
-
-    n_skills = np.max(skill_x) + 1
-
-    # ####
-    # STEP 2: initialize parameters
-    p_G = 0.1
-    p_S = 0.2
-    feat_x = eeg_x
-    feat_table = eeg_table
-    feat_columns = range(feat_table.shape[1])  # [0, 1, 2, 3, 4, 5, 6]
-    feat_width = len(feat_columns)
-    if clamp_L0 is None:
-        Beta0 = make_shared(np.random.rand(n_skills))
-    Beta = make_shared(np.random.rand(n_skills, feat_width))
-    b = make_shared(np.random.rand(n_skills))
-    Gamma = make_shared(np.random.rand(n_skills, feat_width))
-    g = make_shared(np.random.rand(n_skills))
-    tp_G, t_G = make_probability(p_G, name='p(G)')
-    tp_S, t_S = make_probability(p_S, name='p(S)')
-
-    # declare and prepare variables for theano
-    i = T.ivector('i')
-    dummy_float = make_shared(0, name='dummy')
-    skill_i, subject_i = T.iscalars('skill_i', 'subject_i')
-    correct_y = make_shared(correct_y, to_int=True)
-    feat_x = make_shared(feat_x, to_int=True)
-    feat_table = make_shared(feat_table)
-
-    # set up theano functions
-    def step(correct_i, feat, prev_L, prev_p_C, skill_i, P_S, P_G):
-        L_true_given_true = sigmoid(T.dot(Beta[skill_i].T, feat[feat_columns]) + b[skill_i])
-        L_true_given_false = sigmoid(T.dot(Gamma[skill_i].T, feat[feat_columns]) + g[skill_i])
-        Ln = prev_L * L_true_given_true + (1 - prev_L) * L_true_given_false
-        p_C = prev_L * (1 - P_S) + (1 - prev_L) * P_G
-        return Ln, p_C
+from learntools.model.math import sigmoid
+from learntools.model.optimizers import get_updates, optimizer_config
+from learntools.model.theano_utils import (make_shared, set_shared, shared_data, get_compiled,
+                                           updated_variables)
+from learntools.model import Model, plan_batches
+from learntools.model.scheduler import describe_schedule, schedule_batches, schedule_stats
+
+# guess and slip are fixed like in the original logistic regression knowledge tracing
+P_G = 0.1
+P_S = 0.2
+
+
+def _gen_sequence_batches(idxs, subjects, skills, n_lanes, max_cells=0, rng_seed=None):
+    '''divide row indices into padded batches of whole (subject, skill) sequences
+
+    Each batch is a [time x lanes] matrix where every column holds the rows of one sequence
+    in order and is padded at the end with -1. Sequences of similar lengths are packed
+    together so that the columns of a batch need little padding (see schedule_batches).
+
+    Args:
+        idxs (int[]): row indices
+        subjects (int[]): subject of each row
+        skills (int[]): skill of each row. Rows must be sorted by subject and skill
+        n_lanes (int): the number of sequences per batch
+        max_cells (int): if set, batches of short sequences get more lanes, up to this many
+            cells
+        rng_seed (int, optional): shuffle sequences of similar lengths with this seed before
+            packing them
+
+    Returns:
+        int[][][]: list of batches
+
+    Example:
+        >>> _gen_sequence_batches(xrange(5), [1, 1, 1, 2, 2], [0, 0, 1, 0, 0], 2)
+        [array([[0, 3],
+               [1, 4]], dtype=int32), array([[2]], dtype=int32)]
+    '''
+    return schedule_batches(plan_batches(idxs, [subjects, skills]), n_lanes,
+                            max_cells=max_cells, rng_seed=rng_seed)
+
+
+def _build_lrkt(n_skills, feature_len, clamp_L0, rng_seed, optimizer):
+    '''connect up and compile the lrkt graph
+
+    The chance of staying in or moving into the known state depends on the features of each
+    row through Beta and Gamma. They are fixed within a call, so both projections are computed
+    for every cell of a batch with one batched product up front and the scan over time only
+    carries the knowledge of each lane.
+    '''
+    features = make_shared(np.zeros((0, feature_len)), name='features')
+    skill = make_shared(np.zeros(0), to_int=True, name='skill')
+    correct = make_shared(np.zeros(0), to_int=True, name='correct')
+    learning_rate = make_shared(0., name='learning_rate')
+
+    rng = np.random.RandomState(rng_seed)
+    Beta0 = make_shared(rng.rand(n_skills), name='Beta0')
+    Beta = make_shared(rng.rand(n_skills, feature_len), name='Beta')
+    b = make_shared(rng.rand(n_skills), name='b')
+    Gamma = make_shared(rng.rand(n_skills, feature_len), name='Gamma')
+    g = make_shared(rng.rand(n_skills), name='g')
+
+    idxs = T.imatrix('idxs')
+    mask = T.cast(T.ge(idxs, 0), theano.config.floatX)
+    rows = T.maximum(idxs, 0)  # padding reads row 0 but is masked out
+    cell_skill = skill[rows]
+    cell_features = features[rows]
+    stay = sigmoid(T.sum(Beta[cell_skill] * cell_features, axis=2) + b[cell_skill])
+    learn = sigmoid(T.sum(Gamma[cell_skill] * cell_features, axis=2) + g[cell_skill])
     if clamp_L0 is None:
-        L0 = sigmoid(Beta0[skill_i])
+        L0 = sigmoid(Beta0[cell_skill[0]])
     else:
-        L0 = make_shared(clamp_L0)
-    ((results, p_C), updates) = theano.scan(fn=step,
-                                            sequences=[correct_y[i],
-                                                       feat_table[feat_x[i]]],
-                                            outputs_info=[L0,
-                                                          dummy_float],
-                                            non_sequences=[skill_i,
-                                                           tp_G,
-                                                           tp_S])
-    p_y = T.stack(1 - p_C, p_C)
-    loss = neg_log_loss(p_y, correct_y[i])
-
-    learning_rate = T.fscalar('learning_rate')
-    if clamp_L0 is None:
-        params = [Beta0, Beta, Gamma, g, b]
-    else:
-        params = [Beta, Gamma, g, b]
-    update_parameters = [(param, param - learning_rate * T.grad(loss, param))
-                         for param in params]
-
-    tf_train = theano.function(inputs=[i, skill_i, learning_rate],
-                               updates=update_parameters,
-                               outputs=[loss, results, i],
-                               allow_input_downcast=True)
-    tf_valid = theano.function(inputs=[i, skill_i],
-                               outputs=[loss, results, i],
-                               allow_input_downcast=True)
-
-    def f_train((i, (subject_i, skill_i)), learning_rate):
-        everything = tf_train(i, skill_i, learning_rate)
-        return everything[:3]
-
-    def f_valid((i, (subject_i, skill_i))):
-        return tf_valid(i, skill_i)
-
-    def gen_batches(idxs, keys):
-        all_keys = zip(*keys)
-        return [(list(idx), k) for k, idx in
-                groupby(idxs, key=lambda i: all_keys[i])]
-
-    def train_eval(idxs, pred):
-        _y = correct_y.owner.inputs[0].get_value(borrow=True)[idxs]
+        L0 = T.alloc(np.asarray(clamp_L0, dtype=theano.config.floatX), idxs.shape[1])
+
+    def step(stay_t, learn_t, prev_L):
+        return prev_L * stay_t + (1 - prev_L) * learn_t
+
+    known, _ = theano.scan(fn=step, sequences=[stay, learn],
+                           outputs_info=[T.cast(L0, theano.config.floatX)])
+    # the knowledge before each row decides its answer
+    prior = T.concatenate([L0.dimshuffle('x', 0), known[:-1]], axis=0)
+    p_C = prior * (1 - P_S) + (1 - prior) * P_G
+    y = correct[rows]
+    nll = -(y * T.log(p_C) + (1 - y) * T.log(1 - p_C))
+    loss = T.sum(nll * mask) / T.maximum(T.sum(mask), 1)
+
+    params = [Beta, Gamma, g, b] + ([Beta0] if clamp_L0 is None else [])
+    update_parameters = get_updates(loss, params, learning_rate, **dict(optimizer))
+    func_args = {
+        'inputs': [idxs],
+        'outputs': [loss, p_C.flatten(), idxs.flatten(), mask.flatten()],
+        'allow_input_downcast': True,
+    }
+    return {
+        'features': features,
+        'skill': skill,
+        'correct': correct,
+        'learning_rate': learning_rate,
+        'saved_variables': [Beta0, Beta, b, Gamma, g],
+        'train': theano.function(updates=update_parameters, **func_args),
+        'valid': theano.function(**func_args),
+    }
+
+
+class LRKT(Model):
+    '''knowledge tracing where the transitions are logistic regressions on the eeg features
+
+    Attributes:
+        train_batches (int[][][]): [time x lanes] matrices of (subject, skill) sequences padded
+            with -1 (see _gen_sequence_batches)
+        valid_batches (int[][][]): the same for validation
+    '''
+    @log_me('...building lrkt')
+    def __init__(self, prepared_data, clamp_L0=None, learning_rate=0.02, rng_seed=42,
+                 train_lanes=32, valid_lanes=32, lane_cells=0, **kwargs):
+        '''
+        Args:
+            prepared_data (tuple(Dataset, int[], int[])): a tuple that holds the data to be used,
+                the row indices of the training set, and the row indices of the validation set
+            clamp_L0 (float, optional): fix the initial knowledge of every skill to this
+                instead of learning it
+            train_lanes (int): the number of sequences trained on together in a batch
+            valid_lanes (int): the number of sequences validated together in a batch
+            rng_seed (int): seeds the parameters and the shuffling of training sequences of
+                similar lengths before they are packed into batches
+            lane_cells (int): if set, batches of short sequences get more lanes, up to this
+                many time x lane cells, so they take fewer calls
+            **kwargs: may hold the optimizer settings (see optimizer_config)
+        '''
+        ds, train_idx, valid_idx = prepared_data
+        N = ds.n_rows
+        train_mask = idx_to_mask(train_idx, N)
+        valid_mask = idx_to_mask(valid_idx, N)
+
+        # order the rows into (subject, skill) sequences, keeping their time order
+        sorted_i = np.lexsort((ds.get_data('skill'), ds.get_data('subject')))
+        ds.reorder(sorted_i)
+        train_idx = mask_to_idx(train_mask[sorted_i])
+        valid_idx = mask_to_idx(valid_mask[sorted_i])
+        subject_x = ds.get_data('subject')
+        skill_x = ds.get_data('skill')
+
+        features = ds.get_data('eeg')
+        self.config = {
+            'n_skills': len(ds['skill'].enum_pairs),
+            'feature_len': features.shape[1],
+            'clamp_L0': clamp_L0,
+        }
+        architecture = dict(self.config, rng_seed=rng_seed,
+                            optimizer=tuple(sorted(optimizer_config(**kwargs).iteritems())))
+        graph = get_compiled(('LRKT', tuple(sorted(architecture.iteritems()))),
+                             lambda: _build_lrkt(**architecture), owner=self)
+        self._compiled_graph = graph
+        set_shared(graph['features'], features)
+        set_shared(graph['skill'], skill_x)
+        # correct is 1 for incorrect and 2 for correct rows
+        set_shared(graph['correct'], np.equal(ds.get_data('correct'), 2))
+        set_shared(graph['learning_rate'], learning_rate)
+
+        self._correct_y = graph['correct']
+        self._tf_train = graph['train']
+        self._tf_valid = graph['valid']
+        self.saved_variables = graph['saved_variables']
+        self.state_variables = updated_variables([graph['train']],
+                                                 exclude=graph['saved_variables'])
+        self.train_batches = _gen_sequence_batches(
+            train_idx, subject_x, skill_x, train_lanes, max_cells=lane_cells, rng_seed=rng_seed)
+        self.valid_batches = _gen_sequence_batches(valid_idx, subject_x, skill_x, valid_lanes,
+                                                   max_cells=lane_cells)
+        log('train batches: ' + describe_schedule(schedule_stats(self.train_batches)), True)
+
+    def evaluate(self, idxs, pred):
+        self.bind()
+        _y = shared_data(self._correct_y)[idxs]
         return auc(_y, pred, pos_label=1)
 
-    def valid_eval(idxs, pred):
-        _y = correct_y.owner.inputs[0].get_value(borrow=True)[idxs]
-        return auc(_y, pred, pos_label=1)
+    def _run(self, f, idxs):
+        self.bind()
+        loss, preds, idxs, mask = f(idxs)
+        mask = mask.astype(bool)
+        return loss, preds[mask], idxs[mask]
 
-    train_batches = gen_batches(train_idx, [subject_x, skill_x])
-    valid_batches = gen_batches(valid_idx, [subject_x, skill_x])
+    def train(self, idxs, **kwargs):
+        return self._run(self._tf_train, idxs)
 
-    return f_train, f_valid, train_batches, valid_batches, train_eval, valid_eval
+    def validate(self, idxs, **kwargs):
+        return self._run(self._tf_valid, idxs)
@@ -0,0 +1,40 @@
+import numpy as np
+
+from learntools.data import Dataset
+from learntools.kt.deepkt import DeepKT
+
+HEADERS = [('subject', Dataset.ENUM), ('skill', Dataset.ENUM), ('correct', Dataset.INT),
+           ('eeg', Dataset.MATFLOAT)]
+
+# layer widths of the small DeepKT models used by the tests
+SMALL_DEEPKT = {'skill_vector_len': 5, 'combiner_width': 6, 'main_net_width': 7}
+
+
+def fake_kt_data(n_subjects=5, n_rows=12, n_skills=4, eeg_len=3, seed=0):
+    rng = np.random.RandomState(seed)
+    # subjects of different lengths so that the batches need padding
+    subjects = [s for s in xrange(n_subjects) for _ in xrange(n_rows + s)]
+    ds = Dataset(HEADERS, n_rows=len(subjects))
+    for i, j in enumerate(rng.permutation(len(subjects))):
+        ds[i] = ('s{}'.format(subjects[j]), 'w{}'.format(rng.randint(n_skills)),
+                 str(1 + rng.randint(2)), rng.rand(eeg_len))
+    return ds
+
+
+def split_subjects(ds, valid_subjects):
+    '''train on the rows of every subject but valid_subjects and validate on theirs'''
+    subjects = ds.orig['subject']
+    train_idx = [i for i, s in enumerate(subjects) if s not in valid_subjects]
+    valid_idx = [i for i, s in enumerate(subjects) if s in valid_subjects]
+    return train_idx, valid_idx
+
+
+def small_deepkt(n_subjects=3, valid_subjects=('s2', ), **kwargs):
+    '''a small DeepKT on fresh fake data
+
+    Returns:
+        (DeepKT, Dataset): the model and its data
+    '''
+    ds = fake_kt_data(n_subjects=n_subjects)
+    model = DeepKT((ds, ) + split_subjects(ds, valid_subjects), **dict(SMALL_DEEPKT, **kwargs))
+    return model, ds
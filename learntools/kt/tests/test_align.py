@@ -0,0 +1,107 @@
+import numpy as np
+
+from learntools.data import Dataset
+from learntools.kt.data import align_data, align_new_data, SubjectIndex
+
+TASK_HEADERS = [('subject', Dataset.ENUM), ('stim', Dataset.ENUM),
+                ('start_time', Dataset.TIME), ('end_time', Dataset.TIME)]
+EEG_HEADERS = [('sigqual', Dataset.INT), ('subject', Dataset.ENUM),
+               ('start_time', Dataset.TIME), ('end_time', Dataset.TIME),
+               ('eeg', Dataset.MATFLOAT)]
+
+
+def _make_dataset(headers, columns):
+    n_rows = len(columns[0])
+    ds = Dataset(headers, n_rows=n_rows)
+    for (h, t), values in zip(headers, columns):
+        if t in (Dataset.ENUM, Dataset.MATFLOAT):
+            for i, v in enumerate(values):
+                ds.get_column(h)[i] = v
+        else:
+            ds.get_column(h).data = np.asarray(values)
+    return ds
+
+
+def _fake_sessions(rng, subjects, n_tasks, offset=0):
+    task_cols, eeg_cols = [[], [], [], []], [[], [], [], [], []]
+    for s in subjects:
+        t = offset
+        for i in xrange(n_tasks):
+            start, end = t, t + rng.randint(20, 60)
+            task_cols[0].append(s)
+            task_cols[1].append('w{}'.format(rng.randint(5)))
+            task_cols[2].append(start)
+            task_cols[3].append(end)
+            for e in xrange(start - 10, end + 10, 15):
+                eeg_cols[0].append(rng.choice([0, 0, 0, 200]))
+                eeg_cols[1].append(s)
+                eeg_cols[2].append(e)
+                eeg_cols[3].append(e + 15)
+                eeg_cols[4].append(rng.rand(4))
+            t = end + rng.randint(0, 30)
+    return task_cols, eeg_cols
+
+
+def test_align():
+    task = _make_dataset(TASK_HEADERS, [['a', 'a', 'b'], ['x', 'y', 'x'],
+                                        [100, 200, 100], [150, 250, 150]])
+    eeg = _make_dataset(EEG_HEADERS, [[0, 0, 200, 0, 0], ['b', 'a', 'a', 'a', 'b'],
+                                      [90, 120, 210, 230, 500], [110, 140, 230, 260, 510],
+                                      [[1.], [2.], [3.], [4.], [5.]]])
+    aligned = align_data(task, eeg)
+    assert aligned.orig['subject'] == ['a', 'a', 'b']
+    assert np.allclose(aligned['eeg'][:, 0], [2., 4., 1.])
+
+
+def test_align_new_data():
+    rng = np.random.RandomState(3)
+    old_task, old_eeg = _fake_sessions(rng, ['a', 'b', 'c'], 20)
+    new_task, new_eeg = _fake_sessions(rng, ['c', 'd'], 10, offset=100000)
+    all_task = [o + n for o, n in zip(old_task, new_task)]
+    all_eeg = [o + n for o, n in zip(old_eeg, new_eeg)]
+
+    full = align_data(_make_dataset(TASK_HEADERS, all_task), _make_dataset(EEG_HEADERS, all_eeg))
+
+    aligned = align_data(_make_dataset(TASK_HEADERS, old_task),
+                         _make_dataset(EEG_HEADERS, all_eeg))
+    n_old = aligned.n_rows
+    aligned = align_new_data(aligned, _make_dataset(TASK_HEADERS, new_task),
+                             _make_dataset(EEG_HEADERS, all_eeg))
+    assert aligned.n_rows > n_old
+    assert aligned.n_rows == full.n_rows
+    assert aligned.orig['subject'] == full.orig['subject']
+    assert aligned.orig['stim'] == full.orig['stim']
+    assert np.all(aligned['start_time'] == full['start_time'])
+    assert np.allclose(aligned['eeg'], full['eeg'])
+
+    # only the new sessions' eeg is needed
+    aligned2 = align_data(_make_dataset(TASK_HEADERS, old_task),
+                          _make_dataset(EEG_HEADERS, old_eeg))
+    aligned2 = align_new_data(aligned2, _make_dataset(TASK_HEADERS, new_task),
+                              _make_dataset(EEG_HEADERS, new_eeg))
+    assert np.allclose(aligned2['eeg'], full['eeg'])
+
+    # an index of the eeg history is merged with the eeg appended to it
+    eeg = _make_dataset(EEG_HEADERS, old_eeg)
+    eeg_index = SubjectIndex(eeg)
+    eeg.extend(_make_dataset(EEG_HEADERS, new_eeg))
+    aligned3 = align_data(_make_dataset(TASK_HEADERS, old_task),
+                          _make_dataset(EEG_HEADERS, old_eeg))
+    aligned3 = align_new_data(aligned3, _make_dataset(TASK_HEADERS, new_task), eeg,
+                              eeg_index=eeg_index)
+    assert np.allclose(aligned3['eeg'], full['eeg'])
+    fresh_index = SubjectIndex(eeg)
+    assert sorted(eeg_index.rows) == sorted(fresh_index.rows)
+    for subject, rows in fresh_index.rows.iteritems():
+        assert np.array_equal(eeg_index.rows[subject], rows)
+
+
+def test_parallel_align():
+    rng = np.random.RandomState(5)
+    task, eeg = _fake_sessions(rng, ['a', 'b', 'c', 'd', 'e'], 15)
+    serial = align_data(_make_dataset(TASK_HEADERS, task), _make_dataset(EEG_HEADERS, eeg))
+    parallel = align_data(_make_dataset(TASK_HEADERS, task), _make_dataset(EEG_HEADERS, eeg),
+                          n_jobs=2)
+    assert parallel.orig['subject'] == serial.orig['subject']
+    assert np.all(parallel['start_time'] == serial['start_time'])
+    assert np.array_equal(parallel['eeg'], serial['eeg'])
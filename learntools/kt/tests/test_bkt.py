@@ -0,0 +1,187 @@
+import numpy as np
+
+from learntools.kt.bkt import BKTParams, forward, log_likelihood, sequence_positions, sort_order
+
+
+def _fake_bkt_data(n_subjects=6, n_skills=3, n_rows=200, seed=0):
+    rng = np.random.RandomState(seed)
+    subjects = rng.randint(n_subjects, size=n_rows)
+    skills = rng.randint(n_skills, size=n_rows)
+    corrects = rng.rand(n_rows) < 0.6
+    order = sort_order(subjects, skills)
+    params = BKTParams(rng.uniform(0.1, 0.9, n_skills), rng.uniform(0.05, 0.5, n_skills),
+                       rng.uniform(0.05, 0.3, n_skills), rng.uniform(0.05, 0.3, n_skills))
+    return subjects[order], skills[order], corrects[order], params
+
+
+def _forward_by_row(subjects, skills, corrects, params):
+    p_correct, p_known = [], []
+    prev = None
+    for subject, skill, correct in zip(subjects, skills, corrects):
+        L = params.L0[skill] if (subject, skill) != prev else p_known[-1]
+        G, S = params.G[skill], params.S[skill]
+        p_c = L * (1 - S) + (1 - L) * G
+        L = L * (1 - S) / p_c if correct else L * S / (1 - p_c)
+        p_correct.append(p_c)
+        p_known.append(L + (1 - L) * params.T[skill])
+        prev = (subject, skill)
+    return p_correct, p_known
+
+
+def test_sequence_positions():
+    subjects = [0, 0, 0, 0, 1, 1]
+    skills = [0, 0, 1, 1, 1, 1]
+    assert list(sequence_positions(subjects, skills)) == [0, 1, 0, 1, 0, 1]
+    order = sort_order([1, 0, 1, 0], [0, 0, 0, 1])
+    assert list(order) == [1, 3, 0, 2]
+
+
+def test_forward_matches_rows():
+    subjects, skills, corrects, params = _fake_bkt_data()
+    positions = sequence_positions(subjects, skills)
+    p_correct, p_known = forward(skills, corrects, positions, params)
+    expected_correct, expected_known = _forward_by_row(subjects, skills, corrects, params)
+    assert np.allclose(p_correct, expected_correct)
+    assert np.allclose(p_known, expected_known)
+    assert log_likelihood(corrects, p_correct) < 0
+
+
+def _simulate(params, n_subjects=200, n_rows=15, seed=1):
+    rng = np.random.RandomState(seed)
+    n_skills = len(params.L0)
+    subjects, skills, corrects = [], [], []
+    for subject in xrange(n_subjects):
+        for skill in xrange(n_skills):
+            known = rng.rand() < params.L0[skill]
+            for _ in xrange(n_rows):
+                p = 1 - params.S[skill] if known else params.G[skill]
+                subjects.append(subject)
+                skills.append(skill)
+                corrects.append(rng.rand() < p)
+                known = known or rng.rand() < params.T[skill]
+    return np.array(subjects), np.array(skills), np.array(corrects)
+
+
+def test_smooth_matches_enumeration():
+    from learntools.kt.bkt import _filter, _smooth, _steps
+    params = BKTParams(np.array([0.3]), np.array([0.2]), np.array([0.25]), np.array([0.1]))
+    corrects = np.array([False, True, False, True, True])
+    skills = np.zeros(len(corrects), dtype=int)
+    positions = np.arange(len(corrects))
+    steps = _steps(positions)
+    _, p_filtered, p_known = _filter(skills, corrects, steps, params)
+    p_smoothed, p_learned = _smooth(skills, positions, steps, p_filtered, p_known, params.T)
+
+    # skills are never forgotten so the hidden path is "unknown" up to some row
+    n = len(corrects)
+    path_probs = []
+    for learned_at in xrange(n + 1):
+        known = np.arange(n) >= learned_at
+        if learned_at == 0:
+            p = params.L0[0]
+        else:
+            p = (1 - params.L0[0]) * (1 - params.T[0]) ** (learned_at - 1)
+            if learned_at < n:
+                p *= params.T[0]
+        emit = np.where(known, 1 - params.S[0], params.G[0])
+        p *= np.prod(np.where(corrects, emit, 1 - emit))
+        path_probs.append(p)
+    path_probs = np.array(path_probs) / sum(path_probs)
+    expected = [path_probs[:t + 1].sum() for t in xrange(n)]
+    assert np.allclose(p_smoothed, expected)
+    assert np.allclose(p_learned[:-1], path_probs[1:n])
+    assert p_learned[-1] == 0
+
+
+def test_fit_em_recovers_params():
+    from learntools.kt.bkt import default_params, fit_em
+    truth = BKTParams(np.array([0.2, 0.6]), np.array([0.15, 0.3]), np.array([0.2, 0.1]),
+                      np.array([0.1, 0.05]))
+    subjects, skills, corrects = _simulate(truth)
+    positions = sequence_positions(subjects, skills)
+    start = default_params(2)
+    params, iterations, ll = fit_em(skills, corrects, positions, params=start, max_iter=500)
+    assert (iterations > 1).all()
+    start_ll = log_likelihood(corrects, forward(skills, corrects, positions, start)[0])
+    assert ll.sum() > start_ll
+    assert np.isclose(ll.sum(), log_likelihood(corrects,
+                                               forward(skills, corrects, positions, params)[0]))
+    for fitted, true in zip(params, truth):
+        assert np.allclose(fitted, true, atol=0.08)
+
+
+def test_filter_gradient():
+    from learntools.kt.bkt import _filter_gradient, _steps
+    subjects, skills, corrects, params = _fake_bkt_data(n_rows=60)
+    positions = sequence_positions(subjects, skills)
+    steps = _steps(positions)
+    row_ll, d_ll = _filter_gradient(skills, corrects, steps, params)
+    assert np.allclose(row_ll.sum(), log_likelihood(
+        corrects, forward(skills, corrects, positions, params)[0]))
+
+    h = 1e-6
+    for k in xrange(4):
+        for skill in xrange(len(params.L0)):
+            shifted = [np.array(p) for p in params]
+            shifted[k][skill] += h
+            shifted_ll, _ = _filter_gradient(skills, corrects, steps, BKTParams(*shifted))
+            numeric = (shifted_ll.sum() - row_ll.sum()) / h
+            assert np.isclose(d_ll[skills == skill, k].sum(), numeric, rtol=1e-3, atol=1e-4)
+
+
+def test_fit_parallel(tmpdir):
+    from learntools.libs.logger import set_log_file
+    from learntools.kt.bkt import default_params, fit_em, fit_parallel
+    set_log_file(str(tmpdir.join('log.txt')))
+    truth = BKTParams(np.array([0.2, 0.6, 0.4]), np.array([0.15, 0.3, 0.1]),
+                      np.array([0.2, 0.1, 0.15]), np.array([0.1, 0.05, 0.1]))
+    # the rows are ordered by subject so the rows of each skill are spread out
+    subjects, skills, corrects = _simulate(truth, n_subjects=50)
+    positions = sequence_positions(subjects, skills)
+
+    em_params, _, em_ll = fit_em(skills, corrects, positions)
+    params, reports = fit_parallel(skills, corrects, positions, n_jobs=2)
+    assert [r.skill for r in reports] == [0, 1, 2]
+    assert sum(r.n_rows for r in reports) == len(skills)
+    assert np.allclose([r.log_likelihood for r in reports], em_ll)
+    for fitted, expected in zip(params, em_params):
+        assert np.allclose(fitted, expected)
+
+    gradient_params, reports = fit_parallel(skills, corrects, positions, method='gradient',
+                                            max_iter=200)
+    gradient_ll = sum(r.log_likelihood for r in reports)
+    start_ll = log_likelihood(corrects,
+                              forward(skills, corrects, positions, default_params(3))[0])
+    assert start_ll < gradient_ll
+    assert np.isclose(gradient_ll, em_ll.sum(), rtol=0.01)
+
+
+def test_fit_grid(tmpdir):
+    from learntools.libs.logger import set_log_file
+    from learntools.kt.bkt import fit_grid, fit_parallel
+    set_log_file(str(tmpdir.join('log.txt')))
+    truth = BKTParams(np.array([0.2, 0.6]), np.array([0.15, 0.3]), np.array([0.2, 0.1]),
+                      np.array([0.1, 0.05]))
+    subjects, skills, corrects = _simulate(truth, n_subjects=100)
+    positions = sequence_positions(subjects, skills)
+
+    coarse, _, coarse_ll = fit_grid(skills, corrects, positions, resolution=5)
+    # chunks of a few grid points give the same result
+    chunked, _, chunked_ll = fit_grid(skills, corrects, positions, resolution=5,
+                                      max_floats=3000)
+    assert np.allclose(coarse_ll, chunked_ll)
+    for p, q in zip(coarse, chunked):
+        assert np.allclose(p, q)
+
+    fine, iterations, fine_ll = fit_grid(skills, corrects, positions, resolution=5, refine=3)
+    assert list(iterations) == [4, 4]
+    assert (fine_ll >= coarse_ll).all()
+    assert np.isclose(fine_ll.sum(), log_likelihood(
+        corrects, forward(skills, corrects, positions, fine)[0]))
+    for fitted, true in zip(fine, truth):
+        assert np.allclose(fitted, true, atol=0.1)
+
+    parallel, reports = fit_parallel(skills, corrects, positions, method='grid', n_jobs=2,
+                                     resolution=5, refine=3)
+    for p, q in zip(parallel, fine):
+        assert np.allclose(p, q)
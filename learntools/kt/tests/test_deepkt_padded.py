@@ -0,0 +1,118 @@
+import numpy as np
+
+from learntools.libs.logger import set_log_file
+from learntools.kt.deepkt import _gen_padded_batches
+from learntools.kt.tests.fake_data import small_deepkt
+
+
+def test_gen_padded_batches():
+    subjects = [1] * 6 + [2] * 5 + [3] * 2 + [4] * 3
+    batches = _gen_padded_batches(range(len(subjects)), subjects, 2)
+    assert [b.shape for b in batches] == [(5, 2), (2, 1)]
+    assert list(batches[0][:, 0]) == [1, 2, 3, 4, 5]
+    assert list(batches[0][:, 1]) == [7, 8, 9, 10, -1]
+    # subjects with a single row after the first one have nothing to predict
+    assert list(batches[1][:, 0]) == [14, 15]
+
+
+def _lanes(batches):
+    '''the set of rows of each column of each batch'''
+    return [[frozenset(col[col >= 0]) for col in batch.T] for batch in batches]
+
+
+def test_padded_batches_shuffle(tmpdir):
+    subjects = [s for s in xrange(20) for _ in xrange(5)]
+    idxs = range(len(subjects))
+    shuffled = _lanes(_gen_padded_batches(idxs, subjects, 4, rng_seed=1))
+    assert shuffled == _lanes(_gen_padded_batches(idxs, subjects, 4, rng_seed=1))
+    assert shuffled != _lanes(_gen_padded_batches(idxs, subjects, 4, rng_seed=2))
+    assert shuffled != _lanes(_gen_padded_batches(idxs, subjects, 4))
+
+    # DeepKT shuffles its training subjects with its own seed
+    set_log_file(str(tmpdir.join('log.txt')))
+    lanes = [_lanes(small_deepkt(n_subjects=8, train_lanes=2, rng_seed=seed)[0].train_batches)
+             for seed in (1, 1, 2)]
+    assert lanes[0] == lanes[1]
+    assert lanes[0] != lanes[2]
+
+
+def test_padded_train_matches_rows(tmpdir):
+    set_log_file(str(tmpdir.join('log.txt')))
+    model, ds = small_deepkt(n_subjects=5, valid_subjects=('s4', ), learning_rate=0.,
+                             train_lanes=3)
+
+    seen = []
+    for batch in model.train_batches:
+        loss, preds, idxs = model.train(batch)
+        assert np.isfinite(loss)
+        assert len(preds) == len(idxs) == (batch[1:] >= 0).sum()
+        # row by row validation carries the exact state so it must agree with the scan
+        for col in batch.T:
+            col = col[col >= 0]
+            row_preds = [model.validate([i])[1][0] for i in col[1:]]
+            lane_preds = [p for p, i in zip(preds, idxs) if i in col]
+            assert np.allclose(row_preds, lane_preds)
+        seen.extend(idxs)
+    # every training row but the first two of each subject is predicted once
+    n_train = sum(s != 's4' for s in ds.orig['subject'])
+    assert len(seen) == len(set(seen)) == n_train - 2 * 4
+
+
+def test_padded_valid_matches_rows(tmpdir):
+    set_log_file(str(tmpdir.join('log.txt')))
+    models = []
+    for valid_lanes in (0, 2):
+        models.append(small_deepkt(n_subjects=5, valid_subjects=('s2', 's3', 's4'),
+                                   valid_lanes=valid_lanes)[0])
+    row_model, lane_model = models
+    assert len(lane_model.valid_batches) == 2
+
+    row_preds = {}
+    for batch in row_model.valid_batches:
+        _, preds, idxs = row_model.validate(batch)
+        row_preds.update(zip(idxs, preds))
+    lane_preds = {}
+    for batch in lane_model.valid_batches:
+        _, preds, idxs = lane_model.validate(batch)
+        lane_preds.update(zip(idxs, preds))
+    assert sorted(row_preds) == sorted(lane_preds)
+    assert np.allclose([row_preds[i] for i in sorted(row_preds)],
+                       [lane_preds[i] for i in sorted(row_preds)])
+
+
+def test_state_checkpoints(tmpdir):
+    set_log_file(str(tmpdir.join('log.txt')))
+    model, _ = small_deepkt(train_lanes=2, valid_lanes=2, state_checkpoint_every=4)
+    (batch, ) = model.valid_batches
+    model.validate(batch)
+    # states after the 1st, 5th, 9th... rows of the sequence that are followed by a prediction
+    assert sorted(model.state_checkpoints) == list(batch[:-1:4, 0])
+    assert all(state.shape == (6, ) for state in model.state_checkpoints.itervalues())
+
+
+def test_compiled_graph_reuse(tmpdir):
+    set_log_file(str(tmpdir.join('log.txt')))
+    results = []
+    for learning_rate in (0.1, 0.1, 0.):
+        model, _ = small_deepkt(train_lanes=2, valid_lanes=2, learning_rate=learning_rate)
+        batch = model.train_batches[0]
+        results.append((model, [model.train(batch)[0] for _ in xrange(3)]))
+    (first, first_losses), (second, second_losses), (frozen, frozen_losses) = results
+    assert second._tf_train is first._tf_train
+    # parameters are reset for every model and the hyperparameters are not baked in
+    assert np.allclose(first_losses, second_losses)
+    assert first_losses[2] < first_losses[0]
+    assert np.allclose(frozen_losses, first_losses[0])
+
+
+def test_precomputed_features(tmpdir):
+    set_log_file(str(tmpdir.join('log.txt')))
+    valid_preds = []
+    for precompute_features in (0, 1):
+        model, _ = small_deepkt(train_lanes=2, valid_lanes=2,
+                                precompute_features=precompute_features)
+        for batch in model.train_batches:
+            model.train(batch)
+        valid_preds.append(np.concatenate([model.validate(batch)[1]
+                                           for batch in model.valid_batches]))
+    assert np.allclose(valid_preds[0], valid_preds[1], atol=1e-5)
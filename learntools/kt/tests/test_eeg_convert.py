@@ -0,0 +1,57 @@
+import os
+
+import numpy as np
+
+from learntools.kt.data import (convert_eeg_from_xls, gen_eeg_features, stream_eeg_from_xls,
+                                load_eeg_features)
+
+SAMPLE_DATA = 'learntools/libs/data/tests/sample_data.xls'
+
+
+def test_convert_eeg():
+    data = convert_eeg_from_xls(SAMPLE_DATA, chunk_size=2)
+    assert data.n_rows == 5
+    assert list(data.get_data('sigqual')) == [0, 0, 0, 200, 50]
+    assert data.orig['subject'] == ['fAH6-6-2004-06-18'] * 2 + ['fAJ7-7-2007-02-07'] * 3
+    assert data.get_data('eeg').shape == (5, 4)
+
+
+def test_resume_from_offset():
+    all_rows = [row for rows, _ in gen_eeg_features(SAMPLE_DATA, chunk_size=2) for row in rows]
+    first_rows, offset = next(gen_eeg_features(SAMPLE_DATA, chunk_size=2))
+    rest = [row for rows, _ in gen_eeg_features(SAMPLE_DATA, offset=offset) for row in rows]
+    assert first_rows + rest == all_rows
+
+
+def test_stream_eeg(tmpdir):
+    outname = str(tmpdir.join('eeg_features.txt'))
+    full = convert_eeg_from_xls(SAMPLE_DATA)
+
+    # stop after the first chunk and then resume from the recorded offset
+    stream_eeg_from_xls(SAMPLE_DATA, outname, chunk_size=2)
+    with open('{}.offset'.format(outname)) as f:
+        assert int(f.read()) == os.path.getsize(SAMPLE_DATA)
+    _, offset = next(gen_eeg_features(SAMPLE_DATA, chunk_size=2))
+    with open(outname) as f:
+        lines = f.readlines()
+    with open(outname, 'w') as f:
+        f.writelines(lines[:3])
+    stream_eeg_from_xls(SAMPLE_DATA, outname, offset=offset)
+
+    data = load_eeg_features(outname)
+    assert data.orig['subject'] == full.orig['subject']
+    assert np.all(data.get_data('start_time') == full.get_data('start_time'))
+    assert np.allclose(data.get_data('eeg'), full.get_data('eeg'))
+
+
+def test_convert_eeg_blank_lines(tmpdir):
+    fname = str(tmpdir.join('blank_lines.xls'))
+    with open(SAMPLE_DATA) as f:
+        lines = f.readlines()
+    with open(fname, 'w') as f:
+        f.writelines(lines[:3] + ['\n'] + lines[3:] + ['\n', '  \n'])
+    data = convert_eeg_from_xls(fname, chunk_size=2)
+    full = convert_eeg_from_xls(SAMPLE_DATA)
+    assert data.n_rows == 5
+    assert list(data.get_data('sigqual')) == list(full.get_data('sigqual'))
+    assert np.allclose(data.get_data('eeg'), full.get_data('eeg'))
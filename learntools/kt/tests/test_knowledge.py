@@ -0,0 +1,59 @@
+import numpy as np
+
+from learntools.kt.bkt import BKTParams, forward, sequence_positions, sort_order
+from learntools.kt.knowledge import KnowledgeStateStore
+
+
+def _fake_answers(n_rows=300, n_students=8, n_skills=3, seed=0):
+    rng = np.random.RandomState(seed)
+    students = ['s{}'.format(i) for i in rng.randint(n_students, size=n_rows)]
+    skills = rng.randint(n_skills, size=n_rows)
+    corrects = rng.rand(n_rows) < 0.6
+    params = BKTParams(rng.uniform(0.1, 0.9, n_skills), rng.uniform(0.05, 0.5, n_skills),
+                       rng.uniform(0.05, 0.3, n_skills), rng.uniform(0.05, 0.3, n_skills))
+    return students, skills, corrects, params
+
+
+def test_updates_match_forward():
+    students, skills, corrects, params = _fake_answers()
+    store = KnowledgeStateStore(params, capacity=2)
+    predictions = [store.update(*answer) for answer in zip(students, skills, corrects)]
+
+    subject_ids = np.unique(students, return_inverse=True)[1]
+    order = sort_order(subject_ids, skills)
+    expected = np.empty(len(skills))
+    expected[order] = forward(skills[order], corrects[order],
+                              sequence_positions(subject_ids[order], skills[order]), params)[0]
+    assert np.allclose(predictions, expected, atol=1e-6)
+    assert len(store) == len(set(zip(students, skills)))
+    # new pairs start from L0
+    assert np.isclose(store.predict('new', 1), params.L0[1] * (1 - params.S[1]) +
+                      (1 - params.L0[1]) * params.G[1])
+
+
+def test_batch_updates(tmpdir):
+    students, skills, corrects, params = _fake_answers()
+    one_by_one = KnowledgeStateStore(params)
+    predictions = [one_by_one.update(*answer) for answer in zip(students, skills, corrects)]
+
+    # the history is replayed in one go and new answers are added in batches
+    store = KnowledgeStateStore.from_history(params, students[:100], skills[:100],
+                                             corrects[:100])
+    batch_predictions = list(store.update_batch(students[100:200], skills[100:200],
+                                                corrects[100:200]))
+    batch_predictions += list(store.update_batch(students[200:], skills[200:], corrects[200:]))
+    assert np.allclose(batch_predictions, predictions[100:], atol=1e-6)
+
+    pairs = sorted(set(zip(students, skills)))
+    expected = [one_by_one.predict(student, skill) for student, skill in pairs]
+    assert np.allclose(store.predict_batch(*zip(*pairs)), expected, atol=1e-6)
+
+    fname = str(tmpdir.join('knowledge.npz'))
+    store.save(fname)
+    restored = KnowledgeStateStore.load(fname)
+    assert len(restored) == len(store)
+    assert np.allclose([restored.predict(student, skill) for student, skill in pairs],
+                       expected, atol=1e-6)
+    restored.update('s0', 0, True)
+    one_by_one.update('s0', 0, True)
+    assert np.isclose(restored.p_known('s0', 0), one_by_one.p_known('s0', 0))
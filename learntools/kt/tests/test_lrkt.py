@@ -1,6 +1,49 @@
-from learntools.kt.lrkt import build_model
-from learntools.kt.tests.test_kt import smoke_build_model
+import numpy as np
 
+from learntools.libs.logger import set_log_file
+from learntools.kt.lrkt import LRKT, P_G, P_S, _gen_sequence_batches
+from learntools.kt.tests.fake_data import fake_kt_data, split_subjects
 
-def test_lrkt_smoke():
-    smoke_build_model(build_model)
+
+def _lrkt_by_row(model, ds, rows):
+    '''the lrkt recurrence over one sequence in numpy'''
+    Beta0, Beta, b, Gamma, g = [v.get_value() for v in model.saved_variables]
+    features = ds.get_data('eeg')
+    skill = ds.get_data('skill')[rows[0]]
+    known = 1 / (1 + np.exp(-Beta0[skill]))
+    preds = []
+    for row in rows:
+        preds.append(known * (1 - P_S) + (1 - known) * P_G)
+        stay = 1 / (1 + np.exp(-(features[row].dot(Beta[skill]) + b[skill])))
+        learn = 1 / (1 + np.exp(-(features[row].dot(Gamma[skill]) + g[skill])))
+        known = known * stay + (1 - known) * learn
+    return preds
+
+
+def test_gen_sequence_batches():
+    batches = _gen_sequence_batches(range(7), [1, 1, 1, 2, 2, 2, 2], [0, 0, 1, 0, 0, 0, 1], 2)
+    assert [b.shape for b in batches] == [(3, 2), (1, 2)]
+    assert list(batches[0][:, 0]) == [3, 4, 5]
+    assert list(batches[0][:, 1]) == [0, 1, -1]
+
+
+def test_lrkt_matches_rows(tmpdir):
+    set_log_file(str(tmpdir.join('log.txt')))
+    ds = fake_kt_data()
+    model = LRKT((ds, ) + split_subjects(ds, ('s4', )), train_lanes=3, valid_lanes=2,
+                 learning_rate=0.1)
+    for batch in model.valid_batches:
+        _, preds, idxs = model.validate(batch)
+        lane_preds = dict(zip(idxs, preds))
+        for col in batch.T:
+            col = col[col >= 0]
+            assert np.allclose([lane_preds[i] for i in col], _lrkt_by_row(model, ds, col),
+                               atol=1e-5)
+
+    losses = []
+    for epoch in xrange(20):
+        losses.append(sum(model.train(batch)[0] for batch in model.train_batches))
+    assert losses[-1] < losses[0]
+    # the model reorders the dataset into sequences
+    seen = np.concatenate([model.validate(batch)[2] for batch in model.valid_batches])
+    assert sorted(seen) == [i for i, s in enumerate(ds.orig['subject']) if s == 's4']
@@ -0,0 +1,50 @@
+import numpy as np
+
+from learntools.libs.logger import set_log_file
+from learntools.kt.tests.fake_data import small_deepkt
+
+
+def test_predict_next_matches_replay(tmpdir):
+    set_log_file(str(tmpdir.join('log.txt')))
+    model, ds = small_deepkt()
+
+    skills = ds.orig['skill']
+    corrects = ds['correct']
+    eegs = ds.get_data('eeg')
+    first = model.valid_batches[0][0] - 1
+    model.observe('s2', skills[first], corrects[first] == 2, eegs[first])
+    for (i, ) in model.valid_batches:
+        # replaying the rows one at a time gives the probabilities of each label
+        pY = model._tf_valid([i])[3][0]
+        p = model.predict_next('s2', skills[i], eegs[i])
+        assert np.isclose(p, pY[2] / (pY[1] + pY[2]), atol=1e-5)
+        model.observe('s2', skills[i], corrects[i] == 2, eegs[i])
+    assert len(model.states) == 1
+    assert 0 < model.predict_next('unseen', skills[first]) < 1
+
+
+def test_models_side_by_side(tmpdir):
+    set_log_file(str(tmpdir.join('log.txt')))
+    trained, ds = small_deepkt(train_lanes=2, learning_rate=0.5)
+    for batch in trained.train_batches:
+        trained.train(batch)
+    skill = ds.orig['skill'][0]
+    trained.observe('s2', skill, True)
+    expected = trained.predict_next('s2', skill)
+    expected_valid = [trained.validate(batch)[1] for batch in trained.valid_batches]
+
+    # a second model of the same architecture shares the compiled graph but not its values
+    fresh, _ = small_deepkt(train_lanes=2, learning_rate=0.5)
+    fresh.observe('s2', skill, False)
+    assert not np.isclose(fresh.predict_next('s2', skill), expected)
+    assert np.isclose(trained.predict_next('s2', skill), expected)
+    for batch, preds in zip(trained.valid_batches, expected_valid):
+        assert np.allclose(trained.validate(batch)[1], preds)
+
+    fname = str(tmpdir.join('trained.npz'))
+    trained.save(fname)
+    loaded, _ = small_deepkt(train_lanes=2, learning_rate=0.5)
+    loaded.load(fname)
+    loaded.observe('s2', skill, True)
+    assert np.isclose(loaded.predict_next('s2', skill), expected)
+    assert np.isclose(trained.predict_next('s2', skill), expected)
@@ -0,0 +1,44 @@
+import cPickle
+import gzip
+import os
+
+import numpy as np
+
+from learntools.data import Dataset
+from learntools.kt.data import prepare_data
+from learntools.libs.logger import set_log_file
+
+
+def _write_dataset(fname, subjects):
+    headers = [('subject', Dataset.ENUM), ('stim', Dataset.ENUM), ('cond', Dataset.INT),
+               ('start_time', Dataset.TIME), ('eeg', Dataset.MATFLOAT)]
+    ds = Dataset(headers, n_rows=len(subjects))
+    rng = np.random.RandomState(1)
+    for i, s in enumerate(subjects):
+        ds[i] = (s, 'w{}'.format(i % 3), str(1 + i % 2),
+                 '2013-10-15 09:{:02d}:51.480000'.format(59 - i), rng.rand(4))
+    with gzip.open(fname, 'w') as f:
+        cPickle.dump(ds.to_pickle(), f)
+
+
+def test_prepare_data_cache(tmpdir):
+    set_log_file(str(tmpdir.join('test.log')))
+    dataset_name = str(tmpdir.join('data.gz'))
+    cache_dir = str(tmpdir.join('cache'))
+    _write_dataset(dataset_name, ['a'] * 2 + ['b'] * 4 + ['c'] * 3 + ['d'])
+
+    ds = prepare_data(dataset_name, top_n=2, cache_dir=cache_dir)
+    assert sorted(set(ds.orig['subject'])) == ['b', 'c']
+    assert np.all(np.diff(ds['start_time']) >= 0)
+    assert len(os.listdir(cache_dir)) == 1
+
+    cached = prepare_data(dataset_name, top_n=2, cache_dir=cache_dir)
+    assert cached.headers == ds.headers
+    assert cached.orig['subject'] == ds.orig['subject']
+    assert cached.orig['skill'] == ds.orig['skill']
+    assert np.all(cached['correct'] == ds['correct'])
+    assert np.allclose(cached['eeg'], ds['eeg'])
+
+    # a different top_n gets its own snapshot
+    prepare_data(dataset_name, top_n=3, cache_dir=cache_dir)
+    assert len(os.listdir(cache_dir)) == 2
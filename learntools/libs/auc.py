@@ -14,22 +14,17 @@ def tied_rank(x):
     x : list of numbers, numpy array
     Returns
     -------
-    score : list of numbers
-            The tied rank f each element in x
+    score : numpy array
+            The tied rank of each element in x
     """
-    sorted_x = sorted(zip(x,range(len(x))))
-    r = np.array([0] * len(x))
-    cur_val = sorted_x[0][0]
-    last_rank = 0
-    for i in range(len(sorted_x)):
-        if cur_val != sorted_x[i][0]:
-            cur_val = sorted_x[i][0]
-            for j in range(last_rank, i):
-                r[sorted_x[j][1]] = float(last_rank + 1 + i) / 2.0
-            last_rank = i
-        if i == len(sorted_x) - 1:
-            for j in range(last_rank, i + 1):
-                r[sorted_x[j][1]] = float(last_rank + i + 2) / 2.0
+    x = np.asarray(x)
+    order = np.argsort(x, kind='mergesort')
+    sorted_x = x[order]
+    # each run of equal values shares the mean of the ranks it covers
+    starts = np.flatnonzero(np.concatenate([[True], sorted_x[1:] != sorted_x[:-1]]))
+    ends = np.append(starts[1:], len(x))
+    r = np.empty(len(x))
+    r[order] = np.repeat((starts + ends + 1) / 2.0, ends - starts)
     return r
 
 
@@ -57,13 +52,13 @@ def auc(actual, posterior, pos_label=1):
         raise Exception('actual and posterior lengths do not match')
     r = tied_rank(posterior)
     positives = np.equal(actual, pos_label)
-    num_positive = sum(positives)
+    num_positive = np.sum(positives)
     if (num_positive == 0):
         raise Exception('actual is has no positives')
     if (num_positive == len(actual)):
         raise Exception('actual is all positives')
     num_negative = len(actual) - num_positive
-    sum_positive = sum(r[positives])
+    sum_positive = np.sum(r[positives])
     auc = ((sum_positive - num_positive * (num_positive + 1) / 2.0) /
            (num_negative * num_positive))
     return auc
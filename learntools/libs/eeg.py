@@ -1,17 +1,164 @@
-from numpy.fft import fft
+from __future__ import division
+from collections import defaultdict, OrderedDict
 from itertools import izip, islice
+import hashlib
 import math
 
+import numpy as np
+from numpy.fft import fft
+from scipy import signal
+
+DEFAULT_CUTOFFS = (0.5, 4.0, 7.0, 12.0, 30.0)
+
+EXTRACTORS = {}
+
+
+def register_extractor(name):
+    '''decorator that makes a feature extractor selectable by name
+
+    An extractor takes a batch of signals with samples along the last axis, i.e.
+    (n_records, n_samples) or (n_records, n_channels, n_samples), plus keyword arguments
+    and returns the features with the sample axis replaced by a feature axis.
+    '''
+    def register(func):
+        EXTRACTORS[name] = func
+        return func
+    return register
+
+
+def get_extractor(name):
+    try:
+        return EXTRACTORS[name]
+    except KeyError:
+        raise Exception("unknown eeg feature extractor '{}'".format(name))
+
+
+def _bands(cutoffs):
+    return list(izip(cutoffs, islice(cutoffs, 1, None)))
+
+
+def _stack_bands(band_values):
+    return np.concatenate([v[..., np.newaxis] for v in band_values], axis=-1)
+
+
+@register_extractor('fft_bins')
+def fft_bins(signals, cutoffs=DEFAULT_CUTOFFS, **kwargs):
+    '''sums of fft magnitudes between cutoffs (the original features)
+
+    The cutoffs index the first tenth of the fft directly, so the frequency of each bin
+    depends on the length of the signal and the sampling rate is ignored.
+    '''
+    signals = np.asarray(signals, dtype=float)
+    f = 2 * np.abs(fft(signals, axis=-1)[..., :int(signals.shape[-1] / 10)])
+    return _stack_bands([f[..., int(math.ceil(low)):int(math.floor(high))].sum(axis=-1)
+                         for low, high in _bands(cutoffs)])
+
+
+@register_extractor('band_power')
+def band_power(signals, cutoffs=DEFAULT_CUTOFFS, sampling_rate=512.0, nperseg=256, **kwargs):
+    '''absolute power in each frequency band from a Welch power spectral density
+
+    Args:
+        signals (float[][]): batch of signals with samples along the last axis
+        cutoffs (float[]): boundaries of the frequency bands in Hz
+        sampling_rate (float): sampling rate of the signals in Hz
+        nperseg (int): length of the Welch segments. This sets the frequency resolution to
+            sampling_rate / nperseg independently of the signal length
+
+    Returns:
+        float[][]: power of each band with the sample axis replaced by a band axis
+    '''
+    signals = np.asarray(signals, dtype=float)
+    nperseg = min(nperseg, signals.shape[-1])
+    freqs, psd = signal.welch(signals, fs=sampling_rate, nperseg=nperseg, axis=-1)
+    df = freqs[1] - freqs[0] if len(freqs) > 1 else sampling_rate
+    return _stack_bands([psd[..., (freqs >= low) & (freqs < high)].sum(axis=-1) * df
+                         for low, high in _bands(cutoffs)])
+
+
+@register_extractor('relative_band_power')
+def relative_band_power(signals, cutoffs=DEFAULT_CUTOFFS, **kwargs):
+    '''band power as a fraction of the total power between the outer cutoffs'''
+    powers = band_power(signals, cutoffs=cutoffs, **kwargs)
+    total = powers.sum(axis=-1)[..., np.newaxis]
+    return powers / np.where(total > 0, total, 1)
+
+
+def extract(name, signals, **kwargs):
+    '''run a registered extractor over a batch of raw records
+
+    Args:
+        name (string): name of the extractor
+        signals (float[][]): either an array of records or a list of records of possibly
+            different lengths. Records of the same length are processed together
+        **kwargs: arguments to the extractor
+
+    Returns:
+        float[][]: (n_records, n_features) feature matrix. The features of multi-channel
+            records are flattened channel by channel
+    '''
+    extractor = get_extractor(name)
+    if isinstance(signals, np.ndarray):
+        features = extractor(signals, **kwargs)
+        return features.reshape(features.shape[0], -1)
+
+    by_length = defaultdict(list)
+    for i, s in enumerate(signals):
+        by_length[np.shape(s)].append(i)
+    features = None
+    for idxs in by_length.itervalues():
+        group_features = extractor(np.asarray([signals[i] for i in idxs], dtype=float), **kwargs)
+        group_features = group_features.reshape(len(idxs), -1)
+        if features is None:
+            features = np.empty((len(signals), group_features.shape[1]))
+        features[idxs] = group_features
+    return features if features is not None else np.empty((0, 0))
+
+
+class FeatureCache(object):
+    '''memoizes extractor outputs by a hash of each raw record
+
+    Recordings are often converted more than once (different files, cutoffs or
+    resumed runs), so features are looked up per record before computing them. Only the
+    most recently used max_entries records are kept so that streaming a long recording
+    through the cache stays in bounded memory.
+
+    Args:
+        max_entries (int): the number of records whose features are kept
+    '''
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._features = OrderedDict()
+
+    def __len__(self):
+        return len(self._features)
+
+    def _key(self, name, record, kwargs):
+        record = np.ascontiguousarray(record, dtype=float)
+        digest = hashlib.sha1(record.tostring()).hexdigest()
+        return (name, digest, record.shape, repr(sorted(kwargs.iteritems())))
+
+    def extract(self, name, signals, **kwargs):
+        '''same as extract() but only computes records that have not been seen'''
+        keys = [self._key(name, s, kwargs) for s in signals]
+        features = [self._features.pop(k, None) for k in keys]
+        missing = [i for i, f in enumerate(features) if f is None]
+        if missing:
+            missing_features = extract(name, [signals[i] for i in missing], **kwargs)
+            for i, f in izip(missing, missing_features):
+                features[i] = f
+        # (re)insert as the most recently used and evict the least recently used
+        for k, f in izip(keys, features):
+            self._features[k] = f
+        while len(self._features) > self.max_entries:
+            self._features.popitem(last=False)
+        return np.asarray(features)
+
 
 def signal_to_freq_bins(y, cutoffs, sampling_rate=512.0):
-    Y = fft(y)
-    f = 2 * abs(Y[0:len(y) / 10])
-    bins = [sum(f[math.ceil(low):math.floor(high)]) for low, high
-            in izip(cutoffs, islice(cutoffs, 1, None))]
-    return bins
+    return list(fft_bins(y, cutoffs=cutoffs, sampling_rate=sampling_rate))
 
 if __name__ == "__main__":
-    import numpy.array
-    eeg = "57 38 20 29 56 54 35 21 22 13 -7 -26 -30 -8 10 4 -10 -5 16 33 49 55 43 41 39 32 28 44 32 -6 -22 0 37 67 50 21 20 27 23 20 22 22 25 25 38 59 45 8 7 22 7 -21 -27 -35 -37 -11 23 53 84 100 86 71 66 55 41 34 27 13 12 65 118 120 105 98 67 44 55 41 6 -10 -6 3 11 33 81 121 120 100 88 98 107 112 117 115 112 123 145 156 150 135 134 134 108 72 52 52 53 42 25 18 22 33 53 58 45 36 44 68 77 88 102 105 121 137 136 133 145 168 201 198 155 135 149 195 220 205 181 165 168 176 164 129 97 84 87 100 106 113 116 101 76 93 149 187 195 209 240 283 324 326 299 281 293 321 338 332 336 355 354 320 290 268 245 219 232 244 186 136 137 161 171 163 153 145 135 155 179 170 140 117 137 169 173 179 177 170 173 167 149 135 147 154 147 157 183 193 195 187 179 169 136 113 117 136 132 103 99 129 154 156 154 154 161 164 161 149 144 165 186 193 195 172 120 74 66 61 48 24 26 52 70 75 87 114 113 90 70 60 59 82 120 120 67 22 5 -6 1 10 23 38 33 23 32 49 33 5 4 16 26 21 18 17 -4 -21 -9 1 -10 -26 -23 -13 -13 -19 -26 -18 10 32 12 -13 -8 26 52 57 59 54 57 80 102 118 136 170 192 201 204 194 187 209 218 203 171 135 120 123 138 137 115 100 92 105 119 98 35 -12 -24 -17 -8 -29 -59 -66 -49 -72 -121 -135 -117 -116 -140 -166 -154 -121 -92 -85 -87 -86 -75 -81 -88 -81 -86 -93 -78 -56 -52 -42 -12 -3 5 45 65 18 -29 -21 23 50 43 44 64 75 73 64 59 44 26 28 53 70 45 5 -22 -20 12 23 -1 -36 -38 -28 -27 -27 -22 -9 7 12 12 21 39 66 74 74 83 97 117 141 147 137 140 153 162 135 86 65 83 103 99 67 39 25 21 37 52 56 66 76 87 92 84 68 68 86 106 108 101 102 102 105 109 112 115 109 85 50 29 18 10 22 23 1 -19 -30 -38 -38 -38 -26 -4 4 -1 7 28 26 16 19 23 -5 -35 -39 -11 16 8 -3 -5 -18 -26 -9 19 36 33 37 52 55 38 25 37 58 83 103 120 120 118 123 116 91 72 67 49 10 -2 4 27 52 57 58 55 51 36 11 7 24 33 22 11"
-    eeg = numpy.array([float(v) for v in eeg.split(' ')], dtype='complex128')
-    signal_to_freq_bins(eeg, cutoffs=[0.5, 4.0, 7.0, 12.0, 30.0], sampling_rate=512.0)
+    t = np.arange(1024) / 512.0
+    eeg = np.sin(2 * np.pi * 10 * t) + 0.1 * np.random.randn(len(t))
+    print extract('relative_band_power', [eeg], cutoffs=DEFAULT_CUTOFFS, sampling_rate=512.0)
@@ -0,0 +1,21 @@
+import numpy as np
+from scipy.stats import rankdata
+
+from learntools.libs.auc import auc, tied_rank
+
+
+def test_tied_rank():
+    x = [0.5, 0.1, 0.5, 0.3, 0.5, 0.1]
+    assert list(tied_rank(x)) == [5, 1.5, 5, 3, 5, 1.5]
+    x = np.random.RandomState(0).randint(10, size=1000)
+    assert np.allclose(tied_rank(x), rankdata(x))
+
+
+def test_auc_matches_pairs():
+    rng = np.random.RandomState(1)
+    actual = rng.randint(2, size=300)
+    posterior = np.round(rng.rand(300) + 0.3 * actual, 1)
+    pos, neg = posterior[actual == 1], posterior[actual == 0]
+    pairs = (pos[:, None] > neg[None, :]) + 0.5 * (pos[:, None] == neg[None, :])
+    assert np.isclose(auc(actual, posterior), pairs.mean())
+    assert np.isclose(auc(list(actual), list(posterior)), pairs.mean())
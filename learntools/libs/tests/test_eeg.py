@@ -0,0 +1,80 @@
+import math
+from itertools import izip, islice
+
+import numpy as np
+from numpy.fft import fft
+
+from learntools.libs.eeg import (extract, fft_bins, signal_to_freq_bins, register_extractor,
+                                 FeatureCache, EXTRACTORS)
+
+CUTOFFS = [0.5, 4.0, 7.0, 12.0, 30.0]
+
+
+def _sine(freq, n_samples=1024, sampling_rate=512.0):
+    t = np.arange(n_samples) / sampling_rate
+    return np.sin(2 * np.pi * freq * t)
+
+
+def test_band_power_finds_frequency():
+    signals = np.asarray([_sine(2), _sine(10), _sine(20)])
+    powers = extract('band_power', signals, cutoffs=CUTOFFS, sampling_rate=512.0)
+    assert list(np.argmax(powers, axis=1)) == [0, 2, 3]
+
+    relative = extract('relative_band_power', signals, cutoffs=CUTOFFS, sampling_rate=512.0)
+    assert np.allclose(relative.sum(axis=1), 1)
+
+
+def test_multichannel():
+    record = np.asarray([_sine(10), _sine(20)])
+    features = extract('band_power', np.asarray([record, record]), cutoffs=CUTOFFS)
+    assert features.shape == (2, 8)
+    assert np.argmax(features[0, :4]) == 2
+    assert np.argmax(features[0, 4:]) == 3
+
+
+def _legacy_bins(y, cutoffs):
+    # the original per record implementation of signal_to_freq_bins
+    Y = fft(y)
+    f = 2 * abs(Y[0:len(y) // 10])
+    return [sum(f[int(math.ceil(low)):int(math.floor(high))]) for low, high
+            in izip(cutoffs, islice(cutoffs, 1, None))]
+
+
+def test_ragged_batch_matches_legacy():
+    rng = np.random.RandomState(0)
+    signals = [rng.randn(200), rng.randn(300), rng.randn(200)]
+    features = extract('fft_bins', signals, cutoffs=CUTOFFS)
+    for s, f in zip(signals, features):
+        assert np.allclose(_legacy_bins(s, CUTOFFS), f)
+        assert np.allclose(signal_to_freq_bins(s, CUTOFFS), f)
+
+
+def test_registry_and_cache():
+    calls = []
+
+    @register_extractor('test_mean')
+    def mean(signals, **kwargs):
+        calls.append(len(signals))
+        return signals.mean(axis=-1)[:, np.newaxis]
+
+    try:
+        cache = FeatureCache()
+        signals = [np.arange(4.), np.arange(6.)]
+        cache.extract('test_mean', signals)
+        features = cache.extract('test_mean', signals + [np.ones(4)])
+        assert np.allclose(features[:, 0], [1.5, 2.5, 1.])
+        assert sum(calls) == 3
+        assert len(cache) == 3
+
+        # the least recently used record is evicted first
+        cache = FeatureCache(max_entries=2)
+        cache.extract('test_mean', signals)
+        cache.extract('test_mean', signals[:1])
+        cache.extract('test_mean', [np.ones(4)])
+        assert len(cache) == 2
+        del calls[:]
+        cache.extract('test_mean', signals)
+        assert calls == [1]
+    finally:
+        EXTRACTORS.pop('test_mean')
+    assert np.allclose(fft_bins(np.zeros((2, 100)), CUTOFFS), 0)
@@ -0,0 +1,13 @@
+from learntools.libs.utils import balanced_work_units
+
+
+def test_balanced_work_units():
+    assert balanced_work_units([5, 1, 3, 2], 2) == [[2, 3], [0, 1]]
+    sizes = range(1, 21)
+    units = balanced_work_units(sizes, 4)
+    assert sorted(i for unit in units for i in unit) == range(20)
+    totals = [sum(sizes[i] for i in unit) for unit in units]
+    # the greedy split stays close to an even split
+    assert max(totals) <= 4. / 3 * sum(sizes) / 4
+    # no empty units when there are fewer items than units
+    assert balanced_work_units([1, 2], 4) == [[1], [0]]
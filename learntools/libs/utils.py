@@ -1,3 +1,4 @@
+import heapq
 import operator
 from itertools import chain, imap
 
@@ -81,3 +82,15 @@ def iget_column(data, i):
 
 def get_column(data, i):
     return [d[i] for d in data]
+
+
+# splits items into n_units groups with similar total sizes (largest first, greedily)
+# and returns the item indices of each non-empty group
+# example: [5, 1, 3, 2], 2 -> [[2, 3], [0, 1]]
+def balanced_work_units(sizes, n_units):
+    heap = [(0, i, []) for i in xrange(n_units)]
+    for item in sorted(xrange(len(sizes)), key=lambda i: -sizes[i]):
+        total, i, unit = heapq.heappop(heap)
+        unit.append(item)
+        heapq.heappush(heap, (total + sizes[item], i, unit))
+    return [unit for _, _, unit in heap if unit]
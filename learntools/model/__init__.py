@@ -1,2 +1,2 @@
-from model import Model, gen_batches_by_keys, gen_batches_by_size
+from model import Model, gen_batches_by_keys, gen_batches_by_size, plan_batches
 from train import train_model
@@ -0,0 +1,117 @@
+import json
+import time
+
+import numpy as np
+import theano
+
+try:
+    import resource
+except ImportError:  # not available on windows
+    resource = None
+
+
+def peak_rss_mb():
+    '''the peak resident memory of this process in MB, or None where it is not available'''
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.
+
+
+class BatchTimer(object):
+    '''times the compiled calls of one pass over a list of batches
+
+    The wall time of the pass is split into the time spent in the compiled calls, the time
+    spent scoring the predictions, and the rest of the host side work (batch order, copying
+    predictions, logging). The split is approximate: the python work of the model's train or
+    validate method and of the theano function wrapper around the call (argument checks,
+    copying outputs) is counted as call time.
+
+    Args:
+        n_batches (int): the number of calls that will be timed
+    '''
+    def __init__(self, n_batches):
+        self.call_times = np.zeros(n_batches)
+        self.n_calls = 0
+        self.n_rows = 0
+        self.eval_time = 0.
+        self.start = time.time()
+
+    def call(self, f, *args, **kwargs):
+        '''run f and record how long it took
+
+        Returns:
+            the result of f
+        '''
+        start = time.time()
+        result = f(*args, **kwargs)
+        self.call_times[self.n_calls] = time.time() - start
+        self.n_calls += 1
+        return result
+
+    def evaluate(self, f, *args, **kwargs):
+        start = time.time()
+        result = f(*args, **kwargs)
+        self.eval_time += time.time() - start
+        return result
+
+    def summary(self):
+        '''the timings of the pass as a json serializable dict'''
+        wall_time = time.time() - self.start
+        call_times = self.call_times[:self.n_calls]
+        call_time = call_times.sum()
+        if self.n_calls:
+            p50, p90, p99 = np.percentile(call_times, [50, 90, 99])
+        else:
+            p50 = p90 = p99 = 0.
+        return {
+            'wall_time': wall_time,
+            'rows': self.n_rows,
+            'rows_per_sec': self.n_rows / wall_time if wall_time > 0 else 0.,
+            'calls': self.n_calls,
+            'call_time': call_time,
+            'call_p50': p50,
+            'call_p90': p90,
+            'call_p99': p99,
+            'eval_time': self.eval_time,
+            'host_time': max(wall_time - call_time - self.eval_time, 0.),
+            'peak_rss_mb': peak_rss_mb(),
+        }
+
+
+class MetricsWriter(object):
+    '''appends one json object per line to a file. Nothing is written without a path'''
+    def __init__(self, path=None):
+        self.path = path
+
+    def write(self, **record):
+        if self.path is None:
+            return
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(record, sort_keys=True) + '\n')
+
+
+def compiled_functions(model):
+    '''the theano functions held by a model, e.g. its _tf_train and _tf_valid'''
+    return dict((name, f) for name, f in sorted(vars(model).iteritems())
+                if isinstance(f, theano.compile.function_module.Function))
+
+
+def profile_summaries(model):
+    '''the theano profiler summaries of the compiled functions of a model
+
+    Theano only profiles functions compiled with profiling on, e.g. by running with
+    THEANO_FLAGS=profile=True. Functions without a profile are left out.
+
+    Returns:
+        dict: the text summary of each profiled function by attribute name
+    '''
+    from StringIO import StringIO
+    summaries = {}
+    for name, f in compiled_functions(model).iteritems():
+        if getattr(f, 'profile', None) is None:
+            continue
+        out = StringIO()
+        f.profile.summary(file=out)
+        summaries[name] = out.getvalue()
+    return summaries
@@ -5,15 +5,16 @@ import numpy
 import theano
 import theano.tensor as T
 
-from learntools.model.net import NetworkComponent
+from learntools.model.net import NetworkComponent, stacked_dot
 
 
 class LogisticRegression(NetworkComponent):
-    def __init__(self, n_in, n_out, name='logistic'):
+    def __init__(self, n_in, n_out, name='logistic', n_stacked=None):
         super(LogisticRegression, self).__init__(name=name)
+        stack = () if n_stacked is None else (n_stacked,)
         self.W = theano.shared(
             value=numpy.zeros(
-                (n_in, n_out),
+                stack + (n_in, n_out),
                 dtype=theano.config.floatX
             ),
             name=self.subname(self.name),
@@ -21,7 +22,7 @@ class LogisticRegression(NetworkComponent):
         )
         self.b = theano.shared(
             value=numpy.zeros(
-                (n_out,),
+                stack + (n_out,),
                 dtype=theano.config.floatX
             ),
             name=self.subname(self.name),
@@ -34,4 +35,8 @@ class LogisticRegression(NetworkComponent):
         self.L2_sqr = (self.W ** 2).sum()
 
     def instance(self, x, **kwargs):
-        return T.nnet.softmax(T.dot(x, self.W) + self.b)
+        lin_output = stacked_dot(x, self.W, self.b)
+        if lin_output.ndim == 3:
+            return T.nnet.softmax(lin_output.reshape((-1, lin_output.shape[2]))).reshape(
+                lin_output.shape)
+        return T.nnet.softmax(lin_output)
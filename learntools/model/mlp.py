@@ -9,7 +9,7 @@ from learntools.model.net import NetworkComponent, HiddenNetwork
 
 class MLP(NetworkComponent):
     def __init__(self, rng, n_in, size, n_out, activation=rectifier,
-                 dropout=None, name='MLP'):
+                 dropout=None, name='MLP', n_stacked=None):
         super(MLP, self).__init__(name=name)
         self.dropout = T.scalar('dropout') if dropout is None else dropout
         self.hidden = HiddenNetwork(
@@ -18,13 +18,15 @@ class MLP(NetworkComponent):
             size=size,
             activation=activation,
             dropout=self.dropout,
-            name=self.subname('hidden')
+            name=self.subname('hidden'),
+            n_stacked=n_stacked
         )
 
         self.logRegressionLayer = LogisticRegression(
             n_in=size[-1],
             n_out=n_out,
-            name=self.subname('softmax')
+            name=self.subname('softmax'),
+            n_stacked=n_stacked
         )
         self.components = [self.hidden, self.logRegressionLayer]
 
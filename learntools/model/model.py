@@ -1,4 +1,9 @@
-from itertools import groupby
+import json
+import os
+
+import numpy as np
+
+from learntools.model.theano_utils import bind_compiled
 
 
 class Model(object):
@@ -9,6 +14,14 @@ class Model(object):
             indices
         valid_batches (int[][]): a list of validation batches. Each batch is a list of row
             indices
+        saved_variables (theano.shared[]): the shared variables that save() writes, usually
+            the params of every NetworkComponent plus any learned lookup tables
+        state_variables (theano.shared[]): the shared variables besides saved_variables that
+            training changes, e.g. optimizer state, random streams of dropout or stored row
+            states (see updated_variables). save() writes them too so that resumed training
+            continues exactly where it stopped
+        config (dict): the architecture of the model. A checkpoint can only be loaded into a
+            model with the same config
     '''
     # TODO: don't log self
     def __init__(self, *args, **kwargs):
@@ -83,6 +96,100 @@ class Model(object):
     def valid_batches(self, valid_batches):
         self._valid_batches = valid_batches
 
+    def bind(self):
+        '''make the shared variables of the model's compiled graph hold the model's values
+
+        Models with the same architecture share a compiled graph (see get_compiled), so
+        everything that runs or reads the graph binds it first. Models that do not share a
+        graph have nothing to bind.
+        '''
+        graph = getattr(self, '_compiled_graph', None)
+        if graph is not None:
+            bind_compiled(graph, self)
+
+    @property
+    def saved_variables(self):
+        self.bind()
+        try:
+            return self._saved_variables
+        except AttributeError:
+            raise Exception("saved_variables not defined for this model")
+
+    @saved_variables.setter
+    def saved_variables(self, saved_variables):
+        self._saved_variables = saved_variables
+
+    @property
+    def state_variables(self):
+        self.bind()
+        return getattr(self, '_state_variables', [])
+
+    @state_variables.setter
+    def state_variables(self, state_variables):
+        self._state_variables = state_variables
+
+    @property
+    def config(self):
+        return getattr(self, '_config', {})
+
+    @config.setter
+    def config(self, config):
+        self._config = config
+
+    def save(self, fname, **train_state):
+        '''write the saved variables, state variables and config of the model to an npz file
+
+        The file is written next to its destination first and then moved into place, so an
+        interrupted save never leaves a truncated checkpoint behind.
+
+        Args:
+            fname (string): the file to write
+            **train_state: json serializable values to store with the checkpoint. load()
+                returns them
+        '''
+        arrays = dict(('variable{}'.format(i), v.get_value(borrow=True))
+                      for i, v in enumerate(self.saved_variables))
+        arrays.update(('state{}'.format(i), v.get_value(borrow=True))
+                      for i, v in enumerate(self.state_variables))
+        arrays['config'] = json.dumps(dict(self.config, model=type(self).__name__),
+                                      sort_keys=True)
+        arrays['train_state'] = json.dumps(train_state)
+        tmp_name = '{}.tmp'.format(fname)
+        with open(tmp_name, 'wb') as f:
+            np.savez(f, **arrays)
+        os.rename(tmp_name, fname)
+
+    def load(self, fname):
+        '''replace the values of the saved variables with the ones in a checkpoint
+
+        The state variables are restored as well if the checkpoint has as many, so a
+        checkpoint of a model trained with a different optimizer still loads its weights.
+
+        Args:
+            fname (string): a file written by save()
+
+        Returns:
+            dict: the train state stored with the checkpoint
+        '''
+        npz = np.load(fname)
+        try:
+            config = json.loads(str(npz['config']))
+            if config != dict(self.config, model=type(self).__name__):
+                raise Exception('checkpoint {} was saved from a different model: {}'.format(
+                    fname, config))
+            variables = [('variable{}'.format(i), v) for i, v in enumerate(self.saved_variables)]
+            n_states = sum(1 for name in npz.files if name.startswith('state'))
+            if n_states == len(self.state_variables):
+                variables += [('state{}'.format(i), v) for i, v in enumerate(self.state_variables)]
+            for name, v in variables:
+                value = npz[name]
+                if value.shape != v.get_value(borrow=True).shape:
+                    raise Exception('checkpoint {} has a different shape for {}'.format(fname, v))
+                v.set_value(value.astype(v.dtype))
+            return json.loads(str(npz['train_state']))
+        finally:
+            npz.close()
+
     def train_full(self, strategy=None, **kwargs):
         import time
         from learntools.model import train_model
@@ -95,9 +202,10 @@ class Model(object):
             else:
                 strategy = train_model
 
-        start_time = time.clock()
+        # wall time, since time.clock is cpu time on linux
+        start_time = time.time()
         best_validation_loss, best_epoch = train_model(self, **kwargs)
-        end_time = time.clock()
+        end_time = time.time()
         training_time = (end_time - start_time) / 60.
 
         log(('Optimization complete. Best validation score of %f %%') %
@@ -105,6 +213,54 @@ class Model(object):
         log('Code ran for ran for %.2fm' % (training_time))
 
 
+def _key_values(key, idxs):
+    if isinstance(key, (list, tuple)):
+        key = np.asarray(key)
+    return np.asarray(key[idxs])
+
+
+def plan_batches(idxs, keys=(), batch_size=None, skip=0):
+    '''breaks a provided group of rows into batches of rows with the same keys
+
+    The boundaries between runs of equal keys are found with one comparison over all of the
+    rows rather than by grouping them one at a time.
+
+    Args:
+        idxs (int[]): the indices to break into batches
+        keys (list[]): arrays indexed by row. Each run of rows in idxs with the same values
+            in all of the keys becomes a separate batch. NOTE: Keys must be pre-sorted.
+        batch_size (int, optional): if set, each run is further divided into batches of
+            this size. Rows that do not fill a batch are dropped (see gen_batches_by_size)
+        skip (int): the number of rows dropped from the start of each run, e.g. rows that
+            only warm up the state of a recurrent model
+
+    Returns:
+        int[][]: a list of index arrays. Empty batches are left out
+
+    Examples:
+        >>> plan_batches([0, 1, 2, 3, 4, 5, 6], [[1, 1, 1, 1, 1, 2, 2]], batch_size=2, skip=1)
+        [array([1, 2]), array([3, 4])]
+    '''
+    idxs = np.asarray(idxs, dtype=int)
+    if len(idxs) == 0:
+        return []
+    if keys:
+        key_values = np.vstack([_key_values(key, idxs) for key in keys])
+        boundaries = np.flatnonzero((key_values[:, 1:] != key_values[:, :-1]).any(axis=0)) + 1
+        runs = np.split(idxs, boundaries)
+    else:
+        runs = [idxs]
+    batches = []
+    for run in runs:
+        run = run[skip:]
+        if batch_size is None:
+            batches.append(run)
+        else:
+            n_batches = len(run) // batch_size
+            batches.extend(run[:n_batches * batch_size].reshape(n_batches, batch_size))
+    return [batch for batch in batches if len(batch)]
+
+
 def gen_batches_by_keys(idxs, keys):
     '''breaks a provided group of rows into batches based on some input keys
 
@@ -118,12 +274,9 @@ def gen_batches_by_keys(idxs, keys):
 
     Examples:
         >>> gen_batches_by_keys([0, 1, 2, 3], [[1, 2, 1, 1], [2, 1, 1, 1]])
-        [[0], [1], [2, 3]]
+        [array([0]), array([1]), array([2, 3])]
     '''
-    all_keys = zip(*keys)
-    batches = [list(idx) for k, idx in
-               groupby(idxs, key=lambda i: all_keys[i])]
-    return batches
+    return plan_batches(idxs, keys)
 
 
 def gen_batches_by_size(idxs, batch_size):
@@ -2,10 +2,18 @@ import numpy
 
 import theano
 import theano.tensor as T
+from theano.sandbox.rng_mrg import MRG_RandomStreams
 
 from learntools.model.math import rectifier
 
 
+def stacked_dot(x, W, b):
+    '''x.W + b, or the same for every copy along the leading axis if W is stacked'''
+    if W.ndim == 3:
+        return T.batched_dot(x, W) + b[:, None, :]
+    return T.dot(x, W) + b
+
+
 class NetworkComponent(object):
     '''Abstract network object that is not meant to be used. Holds some convenience functions
     and the signature for NetworkComponents'''
@@ -84,18 +92,25 @@ class NetworkComponent(object):
 # inspired by https://github.com/mdenil/dropout/blob/master/mlp.py
 class HiddenLayer(NetworkComponent):
     def __init__(self, rng, n_in, n_out=None, W=None, b=None,
-                 activation=rectifier, dropout=None, name='hiddenlayer'):
+                 activation=rectifier, dropout=None, name='hiddenlayer', n_stacked=None):
+        '''
+        Args:
+            n_stacked (int): if set, hold this many independent copies of the layer along a
+                leading axis of W and b. instance then takes a [copy x row x n_in] input
+        '''
         super(HiddenLayer, self).__init__(name=name)
+        self.n_stacked = n_stacked
+        stack = () if n_stacked is None else (n_stacked,)
         self.dropout = T.scalar('dropout') if dropout is None else dropout
-        self.srng = theano.tensor.shared_randomstreams.RandomStreams(
-            rng.randint(999999))
+        # MRG streams can also be sampled inside of a differentiated scan
+        self.srng = MRG_RandomStreams(rng.randint(999999))
 
         if W is None:
             W_values = numpy.asarray(
                 rng.uniform(
                     low=-numpy.sqrt(6. / (n_in + n_out)),
                     high=numpy.sqrt(6. / (n_in + n_out)),
-                    size=(n_in, n_out)
+                    size=stack + (n_in, n_out)
                 ),
                 dtype=theano.config.floatX
             )
@@ -105,7 +120,7 @@ class HiddenLayer(NetworkComponent):
             W = theano.shared(value=W_values, name=self.subname('W'), borrow=True)
 
         if b is None:
-            b_values = numpy.zeros((n_out,), dtype=theano.config.floatX)
+            b_values = numpy.zeros(stack + (n_out,), dtype=theano.config.floatX)
             b = theano.shared(value=b_values, name=self.subname('b'), borrow=True)
 
         self.W = W
@@ -122,7 +137,7 @@ class HiddenLayer(NetworkComponent):
         mask = self.srng.binomial(n=1, p=1 - self.dropout, size=x.shape)
         # cast because int * float32 = float64 which does not run on GPU
         x = x * T.cast(mask, theano.config.floatX)
-        lin_output = (T.dot(x, self.W) + self.b) * (1 / (1 - self.dropout))
+        lin_output = stacked_dot(x, self.W, self.b) * (1 / (1 - self.dropout))
         return self.activation(lin_output)
 
 
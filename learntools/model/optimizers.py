@@ -0,0 +1,150 @@
+from itertools import izip
+
+import numpy as np
+import theano.tensor as T
+
+from learntools.model.theano_utils import make_shared
+
+OPTIMIZERS = {}
+
+# settings of the optimizers that can be given as model parameters
+DEFAULT_CONFIG = {
+    'optimizer': 'sgd',
+    'momentum': 0.9,
+    'rho': 0.9,
+    'beta1': 0.9,
+    'beta2': 0.999,
+    'epsilon': 1e-6,
+    'max_norm': 0.,
+}
+
+
+def register_optimizer(name):
+    '''decorator that makes an optimizer selectable by name
+
+    An optimizer takes the params, their gradients, the learning rate and its settings as
+    keyword arguments and returns a list of theano updates. Any state it keeps between
+    updates must be in shared variables that are updated alongside the params.
+    '''
+    def register(func):
+        OPTIMIZERS[name] = func
+        return func
+    return register
+
+
+def get_optimizer(name):
+    try:
+        return OPTIMIZERS[name]
+    except KeyError:
+        raise Exception("unknown optimizer '{}'".format(name))
+
+
+def optimizer_config(**kwargs):
+    '''pick the optimizer settings out of a set of model parameters
+
+    Returns:
+        dict: every setting of DEFAULT_CONFIG, overridden by the ones in kwargs
+    '''
+    return dict((k, kwargs.get(k, v)) for k, v in DEFAULT_CONFIG.iteritems())
+
+
+def _zeros_like(param):
+    return make_shared(np.zeros_like(param.get_value(borrow=True)),
+                       name='{}_state'.format(param.name))
+
+
+def clip_norm(grads, max_norm):
+    '''scale the gradients down so that their combined L2 norm is at most max_norm'''
+    norm = T.sqrt(sum(T.sum(g ** 2) for g in grads))
+    scale = T.minimum(1., max_norm / (norm + 1e-7))
+    return [g * scale for g in grads]
+
+
+@register_optimizer('sgd')
+def sgd(params, grads, learning_rate, **kwargs):
+    return [(p, p - learning_rate * g) for p, g in izip(params, grads)]
+
+
+@register_optimizer('momentum')
+def momentum(params, grads, learning_rate, momentum=0.9, **kwargs):
+    updates = []
+    for p, g in izip(params, grads):
+        velocity = _zeros_like(p)
+        new_velocity = momentum * velocity - learning_rate * g
+        updates += [(velocity, new_velocity), (p, p + new_velocity)]
+    return updates
+
+
+@register_optimizer('nesterov')
+def nesterov(params, grads, learning_rate, momentum=0.9, **kwargs):
+    '''momentum with the gradient looked ahead along the velocity (Sutskever et al. 2013)'''
+    updates = []
+    for p, g in izip(params, grads):
+        velocity = _zeros_like(p)
+        new_velocity = momentum * velocity - learning_rate * g
+        updates += [(velocity, new_velocity),
+                    (p, p + momentum * new_velocity - learning_rate * g)]
+    return updates
+
+
+@register_optimizer('rmsprop')
+def rmsprop(params, grads, learning_rate, rho=0.9, epsilon=1e-6, **kwargs):
+    updates = []
+    for p, g in izip(params, grads):
+        mean_square = _zeros_like(p)
+        new_mean_square = rho * mean_square + (1 - rho) * g ** 2
+        updates += [(mean_square, new_mean_square),
+                    (p, p - learning_rate * g / T.sqrt(new_mean_square + epsilon))]
+    return updates
+
+
+@register_optimizer('adagrad')
+def adagrad(params, grads, learning_rate, epsilon=1e-6, **kwargs):
+    updates = []
+    for p, g in izip(params, grads):
+        square_sum = _zeros_like(p)
+        new_square_sum = square_sum + g ** 2
+        updates += [(square_sum, new_square_sum),
+                    (p, p - learning_rate * g / T.sqrt(new_square_sum + epsilon))]
+    return updates
+
+
+@register_optimizer('adam')
+def adam(params, grads, learning_rate, beta1=0.9, beta2=0.999, epsilon=1e-6, **kwargs):
+    '''Adam with bias corrected moment estimates (Kingma and Ba 2015)'''
+    t = make_shared(0., name='adam_t')
+    new_t = t + 1
+    step = learning_rate * T.sqrt(1 - beta2 ** new_t) / (1 - beta1 ** new_t)
+    updates = [(t, new_t)]
+    for p, g in izip(params, grads):
+        m = _zeros_like(p)
+        v = _zeros_like(p)
+        new_m = beta1 * m + (1 - beta1) * g
+        new_v = beta2 * v + (1 - beta2) * g ** 2
+        updates += [(m, new_m), (v, new_v),
+                    (p, p - step * new_m / (T.sqrt(new_v) + epsilon))]
+    return updates
+
+
+def get_updates(cost, params, learning_rate, optimizer='sgd', max_norm=0., **kwargs):
+    '''build the updates that minimize a cost
+
+    Args:
+        cost (theano scalar): the cost to be minimized
+        params (theano.shared[]): the variables to be optimized
+        learning_rate (float or theano scalar): the step size
+        optimizer (string): name of the optimizer (see OPTIMIZERS)
+        max_norm (float): if set, clip the gradients to this combined L2 norm
+        **kwargs: settings of the optimizer. Unknown settings are ignored
+
+    Returns:
+        (theano.shared, theano variable)[]: theano updates for the params and the state of
+            the optimizer
+    '''
+    params = list(params)
+    grads = T.grad(cost, params)
+    if max_norm:
+        grads = clip_norm(grads, max_norm)
+    # the updates have to keep the dtype of the variables, e.g. with a float32 learning rate
+    updates = get_optimizer(optimizer)(params, grads, learning_rate, **kwargs)
+    return [(v, T.cast(u, v.dtype)) for v, u in updates]
@@ -0,0 +1,81 @@
+from collections import namedtuple
+
+import numpy as np
+
+# how well a set of padded batches uses its cells
+ScheduleStats = namedtuple('ScheduleStats', ['n_sequences', 'n_rows', 'n_cells',
+                                             'calls_per_epoch', 'padding_efficiency'])
+
+
+def _length_buckets(lengths):
+    '''bucket of each length. Lengths within a bucket differ by less than a factor of 2'''
+    return np.floor(np.log2(np.maximum(lengths, 1))).astype(int)
+
+
+def schedule_batches(sequences, max_lanes, max_cells=0, rng_seed=None):
+    '''pack sequences into padded [time x lanes] batches of sequences of similar lengths
+
+    Sequences are bucketed by length so that a batch never pads a sequence to more than
+    twice its length. With max_cells, the batches of short sequences get more lanes, which
+    cuts the number of calls spent on the many short sequences.
+
+    Args:
+        sequences (int[][]): the row indices of each sequence in order
+        max_lanes (int): the number of sequences in a batch
+        max_cells (int): if set, batches of short sequences get more lanes than max_lanes,
+            up to max_cells time x lane cells. Only models that accept any number of lanes
+            per call can use this
+        rng_seed (int, optional): if set, the sequences of each bucket are shuffled with
+            this seed before being packed, so batches mix different sequences of similar
+            length. Otherwise they are packed from longest to shortest
+
+    Returns:
+        int[][][]: the batches padded with -1, from the longest sequences to the shortest
+
+    Example:
+        >>> schedule_batches([[0, 1, 2], [3, 4], [5]], 2)
+        [array([[ 0,  3],
+               [ 1,  4],
+               [ 2, -1]], dtype=int32), array([[5]], dtype=int32)]
+    '''
+    sequences = [seq for seq in sequences if len(seq)]
+    lengths = np.array([len(seq) for seq in sequences], dtype=int)
+    buckets = _length_buckets(lengths)
+    rng = np.random.RandomState(rng_seed) if rng_seed is not None else None
+    batches = []
+    for bucket in np.unique(buckets)[::-1]:
+        members = np.flatnonzero(buckets == bucket)
+        if rng is None:
+            members = members[np.argsort(-lengths[members], kind='mergesort')]
+        else:
+            members = members[rng.permutation(len(members))]
+        lanes = max_lanes
+        if max_cells:
+            lanes = max(lanes, max_cells // lengths[members].max())
+        for i in xrange(0, len(members), lanes):
+            lane_members = members[i:(i + lanes)]
+            batch = np.empty((lengths[lane_members].max(), len(lane_members)), dtype='int32')
+            batch.fill(-1)
+            for j, k in enumerate(lane_members):
+                batch[:lengths[k], j] = sequences[k]
+            batches.append(batch)
+    return batches
+
+
+def schedule_stats(batches):
+    '''how well a list of padded batches uses its cells
+
+    Example:
+        >>> stats = schedule_stats(schedule_batches([[0, 1, 2], [3, 4], [5]], 2))
+        >>> stats.n_rows, stats.n_cells, stats.calls_per_epoch
+        (6, 7, 2)
+    '''
+    n_rows = sum(int((batch >= 0).sum()) for batch in batches)
+    n_cells = sum(batch.size for batch in batches)
+    return ScheduleStats(sum(batch.shape[1] for batch in batches), n_rows, n_cells,
+                         len(batches), float(n_rows) / n_cells if n_cells else 1.)
+
+
+def describe_schedule(stats):
+    return '{calls} calls per epoch over {n} sequences, {eff:.1%} of cells are rows'.format(
+        calls=stats.calls_per_epoch, n=stats.n_sequences, eff=stats.padding_efficiency)
@@ -0,0 +1,48 @@
+from collections import OrderedDict
+
+import numpy as np
+
+
+class StateCache(object):
+    '''least recently used cache of the latest model state of each student
+
+    States are stored as compact copies so that serving only needs memory for the students
+    that were seen recently rather than for every historical row. Students that are not in
+    the cache (never seen or evicted) start again from the initial state.
+
+    Args:
+        initial (float[]): state of a student without any history
+        max_entries (int): the maximum number of students kept before the least recently
+            used ones are evicted
+        dtype (string): numpy dtype the states are stored in
+    '''
+    def __init__(self, initial, max_entries=100000, dtype='float32'):
+        self.dtype = dtype
+        self.initial = np.array(initial, dtype=dtype)
+        self.max_entries = max_entries
+        self._states = OrderedDict()
+
+    def __len__(self):
+        return len(self._states)
+
+    def __contains__(self, key):
+        return key in self._states
+
+    def get(self, key):
+        '''the latest state of a student which is marked as most recently used'''
+        try:
+            state = self._states.pop(key)
+        except KeyError:
+            return self.initial
+        self._states[key] = state
+        return state
+
+    def set(self, key, state):
+        self._states.pop(key, None)
+        self._states[key] = np.array(state, dtype=self.dtype)
+        while len(self._states) > self.max_entries:
+            self._states.popitem(last=False)
+
+    def reset(self, key):
+        '''forget the state of a student'''
+        self._states.pop(key, None)
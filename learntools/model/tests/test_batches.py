@@ -0,0 +1,33 @@
+from itertools import groupby, islice
+
+import numpy as np
+
+from learntools.model import plan_batches, gen_batches_by_keys, gen_batches_by_size
+
+
+def _batches_by_groupby(idxs, keys, batch_size=None, skip=0):
+    all_keys = zip(*keys)
+    batches = []
+    for _, run in groupby(idxs, key=lambda i: all_keys[i]):
+        run = list(islice(run, skip, None))
+        batches.extend(gen_batches_by_size(run, batch_size) if batch_size else [run])
+    return [b for b in batches if b]
+
+
+def test_plan_batches_matches_groupby():
+    rng = np.random.RandomState(0)
+    subjects = np.sort(rng.randint(20, size=500))
+    skills = rng.randint(3, size=500)
+    idxs = np.sort(rng.choice(500, size=300, replace=False))
+    for batch_size, skip in ((None, 0), (None, 1), (3, 2), (1, 0)):
+        expected = _batches_by_groupby(idxs, [subjects, skills], batch_size, skip)
+        batches = plan_batches(idxs, [subjects, skills], batch_size=batch_size, skip=skip)
+        assert [list(b) for b in batches] == expected
+        assert all(isinstance(b, np.ndarray) for b in batches)
+
+
+def test_gen_batches_by_keys():
+    assert plan_batches([], [[]]) == []
+    batches = gen_batches_by_keys([0, 1, 2, 3], [[1, 2, 1, 1], [2, 1, 1, 1]])
+    assert [list(b) for b in batches] == [[0], [1], [2, 3]]
+    assert [list(b) for b in plan_batches(range(5), batch_size=2)] == [[0, 1], [2, 3]]
@@ -0,0 +1,120 @@
+import numpy as np
+import theano
+import theano.tensor as T
+
+from learntools.libs.logger import set_log_file
+from learntools.model import Model, train_model, gen_batches_by_size
+from learntools.model.mlp import MLP
+from learntools.model.optimizers import get_updates, optimizer_config
+from learntools.model.theano_utils import updated_variables
+
+
+class TinyModel(Model):
+    def __init__(self, width=3, rng_seed=1, **kwargs):
+        xs = np.random.RandomState(0).rand(40, 2)
+        rng = np.random.RandomState(rng_seed)
+        ys = (xs[:, 0] > xs[:, 1]).astype('int32')
+        self._ys = ys
+        classifier = MLP(rng=rng, n_in=2, size=[width], n_out=2, dropout=T.constant(0.))
+        idxs = T.ivector('idxs')
+        pY = classifier.instance(theano.shared(xs)[idxs])
+        loss = -T.mean(T.log(pY)[T.arange(idxs.shape[0]), theano.shared(ys)[idxs]])
+        outputs = [loss, pY[:, 1] - pY[:, 0], idxs]
+        self._tf_valid = theano.function([idxs], outputs)
+        self._tf_train = theano.function([idxs], outputs, updates=get_updates(
+            loss, classifier.params, 0.5, **optimizer_config(**kwargs)))
+        self.train_batches = gen_batches_by_size(range(30), 5)
+        self.valid_batches = [range(30, 40)]
+        self.saved_variables = classifier.params
+        self.state_variables = updated_variables([self._tf_train], exclude=classifier.params)
+        self.config = {'width': width}
+
+    def evaluate(self, idxs, pred):
+        return np.mean((np.asarray(pred) > 0) == self._ys[idxs])
+
+    def train(self, idxs, **kwargs):
+        return self._tf_train(idxs)
+
+    def validate(self, idxs, **kwargs):
+        return self._tf_valid(idxs)
+
+
+def _values(model):
+    return [v.get_value() for v in model.saved_variables]
+
+
+def test_save_load(tmpdir):
+    fname = str(tmpdir.join('model.npz'))
+    model = TinyModel()
+    model.train(range(10))
+    model.save(fname, epoch=3)
+
+    other = TinyModel(rng_seed=2)
+    assert other.load(fname) == {'epoch': 3}
+    for v1, v2 in zip(_values(model), _values(other)):
+        assert np.all(v1 == v2)
+
+    try:
+        TinyModel(width=4).load(fname)
+    except Exception as e:
+        assert 'different model' in str(e)
+    else:
+        assert False
+
+
+def test_load_closes_file(tmpdir, monkeypatch):
+    fname = str(tmpdir.join('model.npz'))
+    model = TinyModel()
+    model.save(fname, epoch=3)
+    opened = []
+
+    def load(*args, **kwargs):
+        opened.append(np_load(*args, **kwargs))
+        return opened[-1]
+    np_load = np.load
+    monkeypatch.setattr(np, 'load', load)
+    model.load(fname)
+    try:
+        TinyModel(width=4).load(fname)
+    except Exception:
+        pass
+    assert len(opened) == 2
+    assert all(npz.fid is None for npz in opened)
+
+
+def test_resume(tmpdir):
+    set_log_file(str(tmpdir.join('log.txt')))
+    prefix = str(tmpdir.join('run'))
+    args = {'validation_frequency': 2, 'patience': 100, 'checkpoint_path': prefix}
+    full = TinyModel()
+    full_result = train_model(full, n_epochs=8, **args)
+
+    interrupted = TinyModel()
+    train_model(interrupted, n_epochs=4, **args)
+    resumed = TinyModel(rng_seed=5)
+    resumed_result = train_model(resumed, n_epochs=8, resume=True, **args)
+    assert resumed_result == full_result
+    for v1, v2 in zip(_values(full), _values(resumed)):
+        assert np.allclose(v1, v2)
+    assert tmpdir.join('run.best.npz').check()
+
+
+def test_resume_optimizer_state(tmpdir):
+    set_log_file(str(tmpdir.join('log.txt')))
+    for optimizer in ('momentum', 'adam'):
+        prefix = str(tmpdir.join(optimizer))
+        args = {'validation_frequency': 2, 'patience': 100, 'checkpoint_path': prefix}
+        full = TinyModel(optimizer=optimizer)
+        assert full.state_variables
+        train_model(full, n_epochs=8, **args)
+
+        train_model(TinyModel(optimizer=optimizer), n_epochs=4, **args)
+        resumed = TinyModel(rng_seed=5, optimizer=optimizer)
+        train_model(resumed, n_epochs=8, resume=True, **args)
+        for v1, v2 in zip(_values(full), _values(resumed)):
+            assert np.allclose(v1, v2)
+        for v1, v2 in zip(full.state_variables, resumed.state_variables):
+            assert np.allclose(v1.get_value(), v2.get_value())
+
+    # the weights still load into a model with another optimizer
+    TinyModel().load('{}.best.npz'.format(prefix))
@@ -0,0 +1,62 @@
+import json
+
+import numpy as np
+import theano
+
+from learntools.libs.logger import set_log_file
+from learntools.model import train_model
+from learntools.model.instrument import BatchTimer, profile_summaries
+from learntools.model.tests.test_checkpoint import TinyModel
+
+
+def test_batch_timer():
+    timer = BatchTimer(3)
+    for i in xrange(3):
+        assert timer.call(lambda x, y=0: x + y, i, y=1) == i + 1
+        timer.n_rows += 2
+    assert timer.evaluate(np.sum, [1, 2]) == 3
+    stats = timer.summary()
+    assert stats['calls'] == 3
+    assert stats['rows'] == 6
+    assert 0 <= stats['call_p50'] <= stats['call_p90'] <= stats['call_p99']
+    assert stats['call_time'] + stats['eval_time'] <= stats['wall_time']
+    assert stats['peak_rss_mb'] > 0
+
+
+def test_metrics_file(tmpdir):
+    log_file = tmpdir.join('log.txt')
+    set_log_file(str(log_file))
+    metrics_path = tmpdir.join('metrics.jsonl')
+    model = TinyModel()
+    train_model(model, n_epochs=4, validation_frequency=2, patience=100,
+                metrics_path=str(metrics_path), theano_profile=True)
+
+    records = [json.loads(line) for line in metrics_path.readlines()]
+    assert [(r['epoch'], r['phase']) for r in records] == [
+        (0, 'train'), (1, 'train'), (1, 'valid'), (2, 'train'), (3, 'train'), (3, 'valid')]
+    for record in records:
+        batches = model.train_batches if record['phase'] == 'train' else model.valid_batches
+        assert record['calls'] == len(batches)
+        assert record['rows'] == sum(len(batch) for batch in batches)
+        assert record['rows_per_sec'] > 0
+        for field in ('accuracy', 'loss', 'call_p50', 'call_p99', 'host_time', 'peak_rss_mb'):
+            assert field in record
+    # the model was compiled without profiling, so there is nothing to log
+    assert 'theano profile' not in log_file.read()
+
+
+def test_theano_profile(tmpdir):
+    log_file = tmpdir.join('log.txt')
+    set_log_file(str(log_file))
+    with theano.change_flags(profile=True):
+        model = TinyModel()
+    train_model(model, n_epochs=4, validation_frequency=2, patience=100, theano_profile=True)
+
+    summaries = profile_summaries(model)
+    assert sorted(summaries) == ['_tf_train', '_tf_valid']
+    n_calls = {'_tf_train': 4 * len(model.train_batches),
+               '_tf_valid': 2 * len(model.valid_batches)}
+    log_text = log_file.read()
+    for name, summary in summaries.iteritems():
+        assert 'theano profile of {}'.format(name) in log_text
+        assert 'Time in {} calls to Function.__call__'.format(n_calls[name]) in summary
@@ -17,3 +17,26 @@ def test_mlp_smoke():
 
     for i, o in enumerate(outs):
         assert not any(np.isnan(o).flatten())
+
+
+def test_mlp_stacked():
+    rng = np.random.RandomState(1234)
+    net = MLP(rng, 2, [10], 2, activation=rectifier, dropout=T.constant(0.), n_stacked=3)
+    x = T.dtensor3()
+    f = theano.function(inputs=[x], outputs=net.instance(x))
+    xs = np.random.RandomState(0).rand(3, 4, 2)
+    net.logRegressionLayer.W.set_value(np.random.RandomState(1).rand(3, 10, 2))
+    outs = f(xs)
+    assert outs.shape == (3, 4, 2)
+
+    # every copy runs on its own weights
+    for k in xrange(3):
+        hidden = [layer.W.get_value()[k] for layer in net.hidden.layers]
+        single = MLP(np.random.RandomState(0), 2, [10], 2, activation=rectifier,
+                     dropout=T.constant(0.))
+        for layer, W in zip(single.hidden.layers, hidden):
+            layer.W.set_value(W)
+        single.logRegressionLayer.W.set_value(net.logRegressionLayer.W.get_value()[k])
+        x2 = T.dmatrix()
+        g = theano.function(inputs=[x2], outputs=single.instance(x2))
+        assert np.allclose(outs[k], g(xs[k]))
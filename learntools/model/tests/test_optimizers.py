@@ -0,0 +1,41 @@
+import numpy as np
+import theano
+import theano.tensor as T
+
+from learntools.model.optimizers import OPTIMIZERS, get_updates, clip_norm
+from learntools.model.theano_utils import make_shared
+
+
+def _minimize(optimizer, learning_rate, n_steps=200, **kwargs):
+    target = np.array([1., -2., 3.])
+    w = make_shared(np.zeros(3), name='w')
+    cost = T.sum((w - target) ** 2)
+    step = theano.function([], cost, updates=get_updates(cost, [w], learning_rate,
+                                                         optimizer=optimizer, **kwargs))
+    costs = [step() for _ in xrange(n_steps)]
+    return costs, np.abs(w.get_value() - target).max()
+
+
+def test_optimizers_converge():
+    learning_rates = {'sgd': 0.05, 'momentum': 0.02, 'nesterov': 0.02, 'rmsprop': 0.02,
+                      'adagrad': 0.5, 'adam': 0.1}
+    assert sorted(learning_rates) == sorted(OPTIMIZERS)
+    for optimizer, learning_rate in learning_rates.iteritems():
+        costs, error = _minimize(optimizer, learning_rate)
+        assert costs[-1] < costs[0]
+        assert error < 0.1, optimizer
+
+
+def test_symbolic_learning_rate():
+    learning_rate = make_shared(0.05)
+    costs, error = _minimize('adam', learning_rate)
+    assert error < 0.1
+
+
+def test_clip_norm():
+    grads = [make_shared([3., 0.]), make_shared([0., 4.])]
+    clipped = theano.function([], clip_norm(grads, 1.))()
+    assert np.isclose(np.sqrt(sum((g ** 2).sum() for g in clipped)), 1.)
+    assert np.allclose(clipped[0], [0.6, 0.])
+    unclipped = theano.function([], clip_norm(grads, 10.))()
+    assert np.allclose(unclipped[1], [0., 4.])
@@ -0,0 +1,35 @@
+import numpy as np
+
+from learntools.model.scheduler import schedule_batches, schedule_stats
+
+
+def _sequences(n=200, seed=0):
+    rng = np.random.RandomState(seed)
+    lengths = np.concatenate([rng.randint(1, 5, size=n - 10), rng.randint(50, 400, size=10)])
+    starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    return [range(start, start + length) for start, length in zip(starts, lengths)]
+
+
+def test_schedule_batches():
+    sequences = _sequences()
+    batches = schedule_batches(sequences, 8)
+    # every sequence is a column of exactly one batch
+    columns = sorted(tuple(col[col >= 0]) for batch in batches for col in batch.T)
+    assert columns == sorted(tuple(seq) for seq in sequences)
+    for batch in batches:
+        lengths = (batch >= 0).sum(axis=0)
+        assert lengths.max() < 2 * lengths.min()
+
+    # shuffling changes which sequences share a batch, deterministically
+    shuffled = schedule_batches(sequences, 8, rng_seed=1)
+    assert [b.shape for b in shuffled] != [b.shape for b in batches]
+    assert [b.shape for b in schedule_batches(sequences, 8, rng_seed=1)] == \
+        [b.shape for b in shuffled]
+    assert schedule_stats(shuffled).n_rows == schedule_stats(batches).n_rows
+
+    packed = schedule_batches(sequences, 8, max_cells=512)
+    stats, packed_stats = schedule_stats(batches), schedule_stats(packed)
+    assert packed_stats.calls_per_epoch * 4 < stats.calls_per_epoch
+    assert packed_stats.n_rows == stats.n_rows == sum(len(seq) for seq in sequences)
+    assert packed_stats.padding_efficiency > 0.5
+    assert all(b.size <= 512 or b.shape[1] <= 8 for b in packed)
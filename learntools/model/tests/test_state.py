@@ -0,0 +1,19 @@
+import numpy as np
+
+from learntools.model.state import StateCache
+
+
+def test_state_cache():
+    cache = StateCache(np.zeros(2), max_entries=2)
+    assert np.all(cache.get('a') == 0)
+    assert 'a' not in cache
+    cache.set('a', [1., 2.])
+    cache.set('b', [3., 4.])
+    assert cache.get('a').dtype == np.float32
+    # b is now the least recently used so it is evicted first
+    cache.set('c', [5., 6.])
+    assert len(cache) == 2
+    assert 'b' not in cache
+    assert list(cache.get('a')) == [1., 2.]
+    cache.reset('a')
+    assert np.all(cache.get('a') == 0)
@@ -0,0 +1,73 @@
+import numpy as np
+import theano
+
+from learntools.model.theano_utils import (make_shared, set_shared, shared_data, get_compiled,
+                                          bind_compiled, clear_compiled)
+
+
+def _build():
+    w = make_shared(1., name='w')
+    scale = make_shared(0., name='scale')
+    step = theano.function([], w, updates=[(w, w * scale)])
+    return {'w': w, 'scale': scale, 'step': step}
+
+
+def test_get_compiled():
+    clear_compiled()
+    graph = get_compiled(('test', 1), _build)
+    graph['scale'].set_value(2.)
+    graph['step']()
+    assert graph['w'].get_value() == 2.
+
+    # the same graph is returned with the updated variables reset
+    graph2 = get_compiled(('test', 1), _build)
+    assert graph2['step'] is graph['step']
+    assert graph2['w'].get_value() == 1.
+    # the other shared variables are left for the model to set
+    assert graph2['scale'].get_value() == 2.
+    assert get_compiled(('test', 2), _build)['step'] is not graph['step']
+    clear_compiled()
+
+
+class _Owner(object):
+    pass
+
+
+def test_bind_compiled():
+    clear_compiled()
+    first, second = _Owner(), _Owner()
+    graph = get_compiled(('test', 1), _build, owner=first)
+    graph['scale'].set_value(2.)
+    graph['step']()
+    assert get_compiled(('test', 1), _build, owner=second) is graph
+    graph['scale'].set_value(3.)
+    graph['step']()
+    assert graph['w'].get_value() == 3.
+
+    # each owner gets back its own values
+    bind_compiled(graph, first)
+    assert graph['w'].get_value() == 2.
+    assert graph['scale'].get_value() == 2.
+    graph['step']()
+    bind_compiled(graph, second)
+    assert graph['w'].get_value() == 3.
+    bind_compiled(graph, first)
+    assert graph['w'].get_value() == 4.
+
+    try:
+        bind_compiled(graph, _Owner())
+    except Exception as e:
+        assert 'did not request' in str(e)
+    else:
+        assert False
+    clear_compiled()
+
+
+def test_make_shared_int():
+    labels = make_shared([1, 2, 2], dtype='uint8')
+    idxs = make_shared([0., 2.], to_int=True)
+    assert labels.dtype == 'uint8' and idxs.dtype == 'int32'
+    assert list(theano.function([], labels[idxs])()) == [1, 2]
+    set_shared(labels, [2., 1.])
+    assert shared_data(labels).dtype == np.uint8
+    assert list(shared_data(labels)) == [2, 1]
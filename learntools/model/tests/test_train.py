@@ -0,0 +1,45 @@
+import json
+import warnings
+
+import numpy as np
+
+from learntools.libs.logger import set_log_file
+from learntools.model import train_model
+from learntools.model.tests.test_checkpoint import TinyModel, _values
+
+
+def test_lazy_train_evaluation(tmpdir):
+    log_file = tmpdir.join('log.txt')
+    set_log_file(str(log_file))
+    args = {'n_epochs': 6, 'validation_frequency': 2, 'patience': 100}
+    every_epoch = TinyModel()
+    result = train_model(every_epoch, **args)
+
+    # scoring training less often or on a sample does not change the training itself
+    for train_args in ({'train_eval_frequency': 3}, {'train_eval_frequency': 0},
+                       {'train_eval_sample': 7}):
+        model = TinyModel()
+        assert train_model(model, **dict(args, **train_args)) == result
+        for v1, v2 in zip(_values(every_epoch), _values(model)):
+            assert np.allclose(v1, v2)
+
+    # every epoch logs the same fields, with n/a for an unscored training accuracy
+    lines = [line for line in log_file.readlines() if 'train loss' in line]
+    assert len(lines) == 4 * 6
+    assert all('train accuracy' in line for line in lines)
+    assert sum('train accuracy n/a' in line for line in lines) == 4 + 6
+
+
+def test_no_train_batches(tmpdir):
+    log_file = tmpdir.join('log.txt')
+    set_log_file(str(log_file))
+    metrics_file = tmpdir.join('metrics.jsonl')
+    model = TinyModel()
+    model.train_batches = []
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        train_model(model, n_epochs=2, validation_frequency=1, train_eval_frequency=0,
+                    metrics_path=str(metrics_file))
+    assert sum('train loss n/a' in line for line in log_file.readlines()) == 2
+    records = [json.loads(line) for line in metrics_file.readlines()]
+    assert [r['loss'] for r in records if r['phase'] == 'train'] == [None, None]
@@ -1,14 +1,37 @@
+from itertools import chain, izip
+import weakref
+
 import numpy as np
 import theano.tensor as T
 import theano
+from theano.compile.sharedvalue import SharedVariable
+
+
+def make_shared(d, to_int=False, dtype=None, **kwargs):
+    '''store data in a theano shared variable
+
+    Args:
+        d: the data to store
+        to_int (bool): store the data as int32, for indices and labels
+        dtype (string): numpy dtype to store the data in. Overrides to_int. Defaults to
+            floatX
 
+    Returns:
+        theano.shared: the shared variable. Index data can be used for indexing directly
+    '''
+    if dtype is None:
+        dtype = 'int32' if to_int else theano.config.floatX
+    return theano.shared(np.asarray(d, dtype=dtype), **kwargs)
 
-def make_shared(d, to_int=False, **kwargs):
-    sd = theano.shared(np.asarray(d, dtype=theano.config.floatX),
-                       **kwargs)
-    if to_int:
-        return T.cast(sd, 'int32')
-    return sd
+
+def shared_data(shared):
+    '''the array held by a shared variable without copying it'''
+    return shared.get_value(borrow=True)
+
+
+def set_shared(shared, d):
+    '''replace the data of a shared variable, converting it to the variable's dtype'''
+    shared.set_value(np.asarray(d, dtype=shared.dtype))
 
 
 def make_probability(init, shape=None, **kwargs):
@@ -17,3 +40,134 @@ def make_probability(init, shape=None, **kwargs):
     logit_p = np.log(init / (1 - init))
     logit_p = make_shared(logit_p, **kwargs)
     return 1 / (1 + T.exp(-logit_p)), logit_p
+
+
+_COMPILED = {}
+
+
+def updated_variables(functions, exclude=()):
+    '''shared variables that are updated by any of some theano functions
+
+    Args:
+        functions (theano.function[]): the functions
+        exclude (theano.shared[]): variables to leave out
+
+    Returns:
+        theano.shared[]: the updated variables in the order they are first found
+    '''
+    variables = []
+    for f in functions:
+        for inp in f.maker.inputs:
+            if (inp.update is not None and
+                    not any(inp.variable is v for v in chain(variables, exclude))):
+                variables.append(inp.variable)
+    return variables
+
+
+def _updated_variables(graph):
+    '''shared variables that are updated by any of the theano functions in a graph'''
+    return updated_variables(
+        [f for f in graph.itervalues() if isinstance(f, theano.compile.function_module.Function)],
+        exclude=graph.get('transient', []))
+
+
+def _graph_variables(graph):
+    '''every shared variable held by a graph or used by its functions and expressions'''
+    variables = []
+
+    def add(variable):
+        if (isinstance(variable, SharedVariable) and
+                not any(variable is v for v in variables)):
+            variables.append(variable)
+
+    def walk(value):
+        if isinstance(value, theano.compile.function_module.Function):
+            for inp in value.maker.inputs:
+                add(inp.variable)
+        elif isinstance(value, SharedVariable):
+            add(value)
+        elif isinstance(value, theano.Variable):
+            for variable in theano.gof.graph.inputs([value]):
+                add(variable)
+        elif isinstance(value, dict):
+            for v in value.itervalues():
+                walk(v)
+        elif isinstance(value, (list, tuple)):
+            for v in value:
+                walk(v)
+    walk(graph)
+    return variables
+
+
+def _stash_owner(entry):
+    '''keep the values of the model that is using a graph while another one uses it'''
+    owner = entry['owner']() if entry['owner'] is not None else None
+    if owner is not None:
+        entry['stashed'][owner] = [v.get_value(borrow=True) for v in entry['variables']]
+
+
+def get_compiled(key, build, owner=None):
+    '''build and compile a graph once per process and reuse it for every model that asks again
+
+    Compiling usually takes longer than training a small model, so models with the same
+    architecture share their theano functions. Data and hyperparameters have to live in
+    shared variables which the model sets after getting the graph. Every shared variable
+    updated by the functions (parameters, random streams, optimizer state) is put back to the
+    value it had right after being built.
+
+    The values of the model that used the graph before are kept aside, so several models can
+    be used side by side as long as each binds the graph before using it (see
+    bind_compiled and Model.bind).
+
+    Args:
+        key (tuple): a hashable description of everything that changes the graph
+        build (function): builds the graph if it is not cached. It returns a dict of theano
+            functions and whatever else the model needs. Updated shared variables listed
+            under 'transient' are not reset, but each model gets its own copy of them
+        owner (object, optional): the model that will use the graph
+
+    Returns:
+        dict: the graph returned by build
+    '''
+    if key in _COMPILED:
+        entry = _COMPILED[key]
+        _stash_owner(entry)
+        for variable, value in entry['initial_values']:
+            variable.set_value(value)
+        for variable in entry['graph'].get('transient', []):
+            variable.set_value(variable.get_value())
+    else:
+        graph = build()
+        entry = _COMPILED[key] = {
+            'graph': graph,
+            'initial_values': [(v, v.get_value()) for v in _updated_variables(graph)],
+            'variables': _graph_variables(graph),
+            'stashed': weakref.WeakKeyDictionary(),
+        }
+    entry['owner'] = weakref.ref(owner) if owner is not None else None
+    return entry['graph']
+
+
+def bind_compiled(graph, owner):
+    '''make the shared variables of a compiled graph hold the values of one of its models
+
+    Args:
+        graph (dict): a graph returned by get_compiled. Nothing is done if it has been
+            cleared from the cache since
+        owner (object): the model that requested the graph
+    '''
+    entry = next((e for e in _COMPILED.itervalues() if e['graph'] is graph), None)
+    if entry is None or (entry['owner'] is not None and entry['owner']() is owner):
+        return
+    values = entry['stashed'].pop(owner, None)
+    if values is None:
+        raise Exception('{} did not request this compiled graph'.format(owner))
+    _stash_owner(entry)
+    for variable, value in izip(entry['variables'], values):
+        variable.set_value(value, borrow=True)
+    entry['owner'] = weakref.ref(owner)
+
+
+def clear_compiled():
+    '''forget all compiled graphs'''
+    _COMPILED.clear()
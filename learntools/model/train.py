@@ -1,17 +1,58 @@
-from itertools import imap, chain
+import os
 import random
 
+import numpy as np
+
 from learntools.libs.logger import log_me, log
-from learntools.libs.utils import transpose
+from learntools.model.instrument import BatchTimer, MetricsWriter, profile_summaries
+
+
+def _capacity(batches):
+    '''an upper bound of the number of predictions over the batches, one per row index'''
+    return sum(np.size(batch) for batch in batches)
+
+
+def _mean(values):
+    '''the mean of the values, or None if there are none'''
+    return float(np.mean(values)) if len(values) else None
+
+
+def _format(value, spec):
+    '''format a logged value, writing n/a if it is missing'''
+    return 'n/a' if value is None else format(value, spec)
 
 
 @log_me('... training')
 def train_model(model, n_epochs=500, patience=50,
                 patience_increase=40, improvement_threshold=1,
                 validation_frequency=5, learning_rate=0.02,
-                rng_seed=1023, **kwargs):
+                rng_seed=1023, checkpoint_path=None, resume=False, train_eval_frequency=1,
+                train_eval_sample=0, metrics_path=None, theano_profile=False, **kwargs):
+    '''train a model until the validation accuracy stops improving
+
+    Args:
+        train_eval_frequency (int): score the training predictions every this many epochs.
+            The other epochs skip collecting the predictions and log the training accuracy
+            as n/a next to the mean training loss. Training is never scored if it is 0
+        train_eval_sample (int): if set, score the training predictions on a random sample of
+            at most this many rows (drawn deterministically from rng_seed and the epoch)
+        checkpoint_path (string): if set, the weights of the best validation epoch are saved
+            to <checkpoint_path>.best.npz and the weights and training progress of the latest
+            validation epoch to <checkpoint_path>.last.npz
+        resume (bool): continue from <checkpoint_path>.last.npz if it exists
+        metrics_path (string): if set, one json line per epoch and phase (train or valid) is
+            appended to this file with the wall time, rows per second, latency percentiles
+            of the compiled calls, the split between compiled calls, scoring and other host
+            work, and the peak memory of the process (see BatchTimer)
+        theano_profile (bool): log the theano profiler summaries of the model's compiled
+            functions at the end. They only exist if theano was run with profiling on
+
+    Returns:
+        (float, int): the best validation accuracy and the epoch it was reached in
+    '''
     best_valid_accuracy = 0
     best_epoch = 0
+    start_epoch = 0
 
     train_model = model.train
     valid_model = model.validate
@@ -24,26 +65,72 @@ def train_model(model, n_epochs=500, patience=50,
     prev_rng_state = random.getstate()
     random.seed(rng_seed)
 
-    def run_batches(model, batches, f_eval, shuffle=True, **kwargs):
+    if checkpoint_path:
+        best_path = '{}.best.npz'.format(checkpoint_path)
+        last_path = '{}.last.npz'.format(checkpoint_path)
+    if checkpoint_path and resume and os.path.exists(last_path):
+        train_state = model.load(last_path)
+        start_epoch = train_state['epoch'] + 1
+        patience = train_state['patience']
+        best_valid_accuracy = train_state['best_valid_accuracy']
+        best_epoch = train_state['best_epoch']
+        version, internal_state, gauss_next = train_state['rng_state']
+        random.setstate((version, tuple(internal_state), gauss_next))
+        log('resuming from epoch {epoch} of {path}'.format(
+            epoch=start_epoch, path=last_path), True)
+
+    # the predictions of an epoch are written into buffers sized from the batches up front
+    buffers = {}
+    metrics = MetricsWriter(metrics_path)
+
+    def run_batches(model, batches, f_eval, shuffle=True, evaluate=True, sample=0,
+                    sample_seed=None, **kwargs):
+        timer = BatchTimer(len(batches))
         batch_order = range(len(batches))
         if shuffle:
             random.shuffle(batch_order)
-        # Aaron: this is not really a speed critical part of the code but we
-        # can come back and redo AUC in theano if we want to make this suck less
-        results = imap(lambda i: model(batches[i], **kwargs), batch_order)
-        (losses, preds, idxs) = transpose(results)
-        accuracy = f_eval(list(chain.from_iterable(idxs)),
-                          list(chain.from_iterable(preds)))
-        return accuracy, losses
-
-    for epoch in range(n_epochs):
-        train_accuracy, train_losses = run_batches(train_model, train_batches, train_eval,
-                                                   learning_rate=learning_rate)
-        log('epoch {epoch}, train accuracy {err:.2%}'.format(
-            epoch=epoch, err=train_accuracy), True)
+        losses = np.empty(len(batches))
+        if evaluate:
+            if id(batches) not in buffers:
+                capacity = _capacity(batches)
+                buffers[id(batches)] = (np.empty(capacity), np.empty(capacity, dtype=int))
+            preds, idxs = buffers[id(batches)]
+        n = 0
+        for j, i in enumerate(batch_order):
+            loss, batch_preds, batch_idxs = timer.call(model, batches[i], **kwargs)[:3]
+            losses[j] = loss
+            timer.n_rows += len(batch_preds)
+            if evaluate:
+                preds[n:(n + len(batch_preds))] = batch_preds
+                idxs[n:(n + len(batch_idxs))] = batch_idxs
+                n += len(batch_preds)
+        if not evaluate:
+            return None, losses, timer.summary()
+
+        preds, idxs = preds[:n], idxs[:n]
+        if sample and sample < n:
+            keep = np.sort(np.random.RandomState(sample_seed).choice(n, sample, replace=False))
+            preds, idxs = preds[keep], idxs[keep]
+        return timer.evaluate(f_eval, idxs, preds), losses, timer.summary()
+
+    for epoch in range(start_epoch, n_epochs):
+        evaluate = bool(train_eval_frequency) and (epoch + 1) % train_eval_frequency == 0
+        train_accuracy, train_losses, timings = run_batches(
+            train_model, train_batches, train_eval, evaluate=evaluate,
+            sample=train_eval_sample, sample_seed=(rng_seed, epoch),
+            learning_rate=learning_rate)
+        train_loss = _mean(train_losses)
+        metrics.write(epoch=epoch, phase='train', accuracy=train_accuracy, loss=train_loss,
+                      **timings)
+        log('epoch {epoch}, train loss {loss}, train accuracy {acc}'.format(
+            epoch=epoch, loss=_format(train_loss, '.4f'), acc=_format(train_accuracy, '.2%')),
+            True)
 
         if (epoch + 1) % validation_frequency == 0:
-            valid_accuracy, _ = run_batches(valid_model, valid_batches, valid_eval, shuffle=False)
+            valid_accuracy, valid_losses, timings = run_batches(valid_model, valid_batches,
+                                                                valid_eval, shuffle=False)
+            metrics.write(epoch=epoch, phase='valid', accuracy=valid_accuracy,
+                          loss=_mean(valid_losses), **timings)
             log('epoch {epoch}, validation accuracy {acc:.2%}'.format(
                 epoch=epoch, acc=valid_accuracy), True)
 
@@ -52,6 +139,13 @@ def train_model(model, n_epochs=500, patience=50,
                     patience = max(patience, epoch + patience_increase)
                 best_valid_accuracy = valid_accuracy
                 best_epoch = epoch
+                if checkpoint_path:
+                    model.save(best_path, epoch=epoch, valid_accuracy=valid_accuracy)
+
+            if checkpoint_path:
+                model.save(last_path, epoch=epoch, patience=patience,
+                           best_valid_accuracy=best_valid_accuracy, best_epoch=best_epoch,
+                           rng_state=random.getstate())
 
             if patience <= epoch:
                 break
@@ -59,4 +153,8 @@ def train_model(model, n_epochs=500, patience=50,
     # restore rng state
     random.setstate(prev_rng_state)
 
+    if theano_profile:
+        for name, summary in sorted(profile_summaries(model).iteritems()):
+            log('theano profile of {}:\n{}'.format(name, summary))
+
     return best_valid_accuracy, best_epoch